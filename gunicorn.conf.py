@@ -0,0 +1,53 @@
+# Configuração do gunicorn: gunicorn -c gunicorn.conf.py
+#
+# A aplicação é carregada no processo mestre (preload_app) e o motor de rotas
+# é pré-carregado antes do fork, então os workers compartilham por
+# copy-on-write as bibliotecas do solver e os grafos já em memória.
+import multiprocessing
+import os
+
+# Com o pool de processos do motor (ROTAS_POOL_PROCESSOS > 0, desligado por
+# padrão), cada worker tem o seu pool: o padrão passa a ser workers ×
+# processos do pool ≈ núcleos, com workers gthread cujas threads esperam os
+# jobs do pool sem bloquear o worker inteiro.
+ROTAS_POOL_PROCESSOS = int(os.getenv('ROTAS_POOL_PROCESSOS', '0'))
+NUCLEOS = multiprocessing.cpu_count()
+
+wsgi_app = 'milo_backend.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+if ROTAS_POOL_PROCESSOS > 0:
+    workers = int(os.getenv('GUNICORN_WORKERS', str(max(1, NUCLEOS // ROTAS_POOL_PROCESSOS))))
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+else:
+    workers = int(os.getenv('GUNICORN_WORKERS', str(NUCLEOS * 2 + 1)))
+    threads = int(os.getenv('GUNICORN_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+
+def when_ready(server):
+    """Executado no mestre depois do carregamento da aplicação e antes do fork dos workers"""
+    from rotas.aquecimento import ROTAS_PRECARREGAR, precarregar
+
+    if ROTAS_PRECARREGAR:
+        precarregar()
+
+
+def post_fork(server, worker):
+    """Executado em cada worker logo após o fork"""
+    from rotas.aquecimento import ROTAS_PRECARREGAR, aquecer_worker
+    from rotas.jobs import ROTAS_JOBS_NO_PROCESSO, get_fila_jobs
+
+    if ROTAS_PRECARREGAR:
+        aquecer_worker()
+    # Retoma os jobs que ficaram na fila sem esperar um job novo
+    if ROTAS_JOBS_NO_PROCESSO:
+        get_fila_jobs()
+
+
+def worker_exit(server, worker):
+    """Executado em cada worker ao sair: termina os processos do pool do motor"""
+    from rotas.processos import encerrar_pool_solver
+
+    encerrar_pool_solver()
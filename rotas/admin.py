@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Veiculo, Rota
+from .models import Veiculo, Rota, GeocodificacaoCache, RotaJob
 
 @admin.register(Veiculo)
 class VeiculoAdmin(admin.ModelAdmin):
@@ -14,5 +14,21 @@ class RotaAdmin(admin.ModelAdmin):
     list_display = ['id', 'nome_motorista', 'veiculo', 'distancia_total_km', 'valor_rota', 'status', 'data_geracao', 'usuario']
     list_filter = ['status', 'data_geracao', 'veiculo__tipo_combustivel']
     search_fields = ['nome_motorista', 'usuario__nome', 'veiculo__nome']
-    readonly_fields = ['data_geracao', 'enderecos_otimizados', 'coordenadas_otimizadas', 'distancia_total_km', 'tempo_estimado_minutos', 'valor_rota', 'link_maps']
+    readonly_fields = ['data_geracao', 'enderecos_otimizados', 'coordenadas_otimizadas', 'distancia_total_km', 'tempo_estimado_minutos', 'valor_rota', 'link_maps', 'qualidade_otimizacao']
     ordering = ['-data_geracao']
+
+@admin.register(GeocodificacaoCache)
+class GeocodificacaoCacheAdmin(admin.ModelAdmin):
+    list_display = ['endereco_normalizado', 'latitude', 'longitude', 'encontrado', 'acertos', 'data_atualizacao']
+    list_filter = ['encontrado', 'data_atualizacao']
+    search_fields = ['endereco_normalizado']
+    readonly_fields = ['chave', 'data_criacao']
+    ordering = ['-data_atualizacao']
+
+@admin.register(RotaJob)
+class RotaJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'rota', 'tentativas', 'data_criacao', 'data_conclusao', 'usuario']
+    list_filter = ['status', 'data_criacao']
+    search_fields = ['usuario__nome']
+    readonly_fields = ['id', 'parametros', 'rota', 'erro', 'tentativas', 'data_criacao', 'data_inicio', 'data_conclusao']
+    ordering = ['-data_criacao']
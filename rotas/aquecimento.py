@@ -0,0 +1,88 @@
+# Pré-carregamento do processo mestre (gunicorn --preload) antes do fork dos workers
+import gc
+import importlib
+import os
+import time
+
+# Com false, o processo mestre não pré-carrega nada (workers aquecem no primeiro uso)
+ROTAS_PRECARREGAR = os.getenv('ROTAS_PRECARREGAR', 'true').lower() == 'true'
+
+# Regiões persistidas (as mais recentes) colocadas em memória no pré-carregamento
+ROTAS_PRECARREGAR_REGIOES = int(os.getenv('ROTAS_PRECARREGAR_REGIOES', '20'))
+
+
+def importar_bibliotecas(capacidades):
+    """
+    Importa as bibliotecas pesadas que o motor vai usar (OR-Tools e, se os
+    ladrilhos forem baixados, OSMnx/NetworkX). Retorna {módulo: ms}.
+    """
+    modulos = []
+    if capacidades['ortools']:
+        modulos.append('ortools.constraint_solver.pywrapcp')
+    if capacidades['download_grafos']:
+        modulos.append('osmnx')
+
+    tempos = {}
+    for modulo in modulos:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+        except ImportError as e:
+            print(f"⚠️  Não foi possível importar {modulo}: {e}")
+            continue
+        tempos[modulo] = round((time.perf_counter() - inicio) * 1000, 1)
+    return tempos
+
+
+def precarregar(max_regioes=ROTAS_PRECARREGAR_REGIOES):
+    """
+    Deixa o processo pronto para atender a primeira rota como a centésima:
+    carrega as URLs e views, cria o motor (capacidades, geocodificador e
+    gazetteer), importa o solver e os grafos e põe em memória as regiões
+    persistidas com seus índices espaciais e hierarquias. Ao final fecha as
+    conexões com o banco (não podem ser herdadas pelos workers) e congela os
+    objetos no gc, para que as páginas compartilhadas por copy-on-write não
+    sejam copiadas pelas coletas nos workers.
+    """
+    from django.db import connections
+    from django.urls import get_resolver
+
+    from .motor import get_capacidades, get_motor_rotas
+
+    inicio = time.perf_counter()
+    get_resolver().url_patterns
+    motor = get_motor_rotas()
+    importados = importar_bibliotecas(get_capacidades())
+
+    etapa = time.perf_counter()
+    try:
+        regioes = motor.grafos.carregar_persistidas(max_regioes)
+    except Exception as e:
+        print(f"⚠️  Erro ao pré-carregar regiões: {e}")
+        regioes = []
+    tempo_regioes = time.perf_counter() - etapa
+
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+
+    print(
+        f"🔥 Pré-carregamento concluído em {time.perf_counter() - inicio:.1f}s: "
+        f"bibliotecas {importados}, {len(regioes)} região(ões) em {tempo_regioes:.1f}s, "
+        f"{gc.get_freeze_count()} objetos congelados"
+    )
+    return {'bibliotecas': importados, 'regioes': regioes}
+
+
+def aquecer_worker():
+    """
+    Inicia o pool de processos do worker recém-criado (o pool não pode ser
+    criado no mestre: seus processos e filas não sobrevivem ao fork)
+    """
+    from .processos import get_pool_solver
+
+    pool = get_pool_solver()
+    if pool is not None:
+        inicio = time.perf_counter()
+        pool.aquecer()
+        print(f"🔥 Pool de {pool.processos} processo(s) iniciado em {time.perf_counter() - inicio:.1f}s (pid {os.getpid()})")
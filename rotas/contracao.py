@@ -0,0 +1,424 @@
+# Contraction hierarchies: pré-processamento dos grafos regionais para consultas rápidas
+import heapq
+import math
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from .grafo_csr import GrafoCSR
+
+# Limite de nós resolvidos em cada busca de testemunha durante a contração
+LIMITE_TESTEMUNHA = int(os.getenv('GRAFOS_CONTRACAO_LIMITE_TESTEMUNHA', '200'))
+
+PREFIXO = 'ch'
+ARRAYS_CONTRACAO = (
+    'rank',
+    'subida_offsets',
+    'subida_destinos',
+    'subida_pesos',
+    'subida_acumulados',
+    'subida_meio',
+    'descida_offsets',
+    'descida_destinos',
+    'descida_pesos',
+    'descida_acumulados',
+    'descida_meio',
+)
+
+
+def prefixo(objetivo='distancia'):
+    """
+    Prefixo dos arquivos da hierarquia no GrafoStore (uma por objetivo)
+    """
+    return PREFIXO if objetivo == 'distancia' else f'{PREFIXO}_{objetivo}'
+
+
+def _para_csr(listas, dtype_peso=np.float32):
+    """
+    Converte listas de adjacência [(destino, peso, acumulado, meio), ...] por nó em arrays CSR
+    """
+    n = len(listas)
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum([len(arestas) for arestas in listas], out=offsets[1:])
+    destinos = np.fromiter((a[0] for arestas in listas for a in arestas), dtype=np.int32, count=offsets[-1])
+    pesos = np.fromiter((a[1] for arestas in listas for a in arestas), dtype=dtype_peso, count=offsets[-1])
+    acumulados = np.fromiter((a[2] for arestas in listas for a in arestas), dtype=dtype_peso, count=offsets[-1])
+    meio = np.fromiter((a[3] for arestas in listas for a in arestas), dtype=np.int32, count=offsets[-1])
+    return offsets, destinos, pesos, acumulados, meio
+
+
+class ContracaoHierarquica:
+    """
+    Contraction hierarchy de um GrafoCSR, construída para um objetivo
+    (distância ou tempo): os pesos são a métrica minimizada e os
+    acumulados, a outra métrica somada ao longo da aresta ou do atalho.
+
+    Os nós são contraídos em ordem de importância (2 x diferença de arestas +
+    vizinhos já contraídos), adicionando atalhos quando a busca de
+    testemunha não encontra caminho alternativo. O resultado são dois grafos
+    "para cima" em CSR: subida (arestas u -> w com rank[w] > rank[u]) e
+    descida (arestas reversas, para a busca a partir do destino).
+    `meio` guarda o nó contraído de cada atalho (-1 para arestas originais).
+    """
+
+    def __init__(self, rank, subida_offsets, subida_destinos, subida_pesos, subida_acumulados, subida_meio,
+                 descida_offsets, descida_destinos, descida_pesos, descida_acumulados, descida_meio,
+                 versao=None, objetivo='distancia'):
+        self.rank = rank
+        self.subida = (subida_offsets, subida_destinos, subida_pesos, subida_acumulados, subida_meio)
+        self.descida = (descida_offsets, descida_destinos, descida_pesos, descida_acumulados, descida_meio)
+        self.versao = versao
+        self.objetivo = objetivo
+        self._adjacencia = {}
+
+    @property
+    def num_nos(self):
+        return len(self.rank)
+
+    @property
+    def num_atalhos(self):
+        return int((self.subida[4] >= 0).sum() + (self.descida[4] >= 0).sum())
+
+    @classmethod
+    def construir(cls, csr, limite_testemunha=LIMITE_TESTEMUNHA, progresso=None, objetivo='distancia'):
+        """
+        Executa o pré-processamento (contração de todos os nós)
+        """
+        n = csr.num_nos
+        offsets, destinos, comprimentos, outros = csr.pesos(objetivo)
+        infinito = math.inf
+
+        # Grafo remanescente (nós ainda não contraídos) em dicionários; a
+        # métrica acumulada de cada aresta e atalho fica à parte
+        saida = [dict() for _ in range(n)]
+        entrada = [dict() for _ in range(n)]
+        acumulado = {}
+        for u in range(n):
+            for k in range(offsets[u], offsets[u + 1]):
+                v = destinos[k]
+                peso = comprimentos[k]
+                if v != u and peso < saida[u].get(v, infinito):
+                    saida[u][v] = peso
+                    entrada[v][u] = peso
+                    acumulado[(u, v)] = outros[k]
+
+        meio = {}
+        vizinhos_contraidos = [0] * n
+
+        def testemunha(origem, ignorado, alvos, limite_distancia):
+            distancias = {origem: 0.0}
+            heap = [(0.0, origem)]
+            restantes = set(alvos)
+            resolvidos = 0
+            while heap and restantes:
+                d, x = heapq.heappop(heap)
+                if d > distancias.get(x, infinito):
+                    continue
+                if d > limite_distancia:
+                    break
+                restantes.discard(x)
+                resolvidos += 1
+                if resolvidos > limite_testemunha:
+                    break
+                for y, peso in saida[x].items():
+                    if y == ignorado:
+                        continue
+                    nd = d + peso
+                    if nd < distancias.get(y, infinito):
+                        distancias[y] = nd
+                        heapq.heappush(heap, (nd, y))
+            return distancias
+
+        def atalhos_necessarios(v):
+            atalhos = []
+            saidas = list(saida[v].items())
+            if not saidas:
+                return atalhos
+            maior_saida = max(peso for _, peso in saidas)
+            for u, peso_u in entrada[v].items():
+                alvos = [x for x, _ in saidas if x != u]
+                if not alvos:
+                    continue
+                distancias = testemunha(u, v, alvos, peso_u + maior_saida)
+                for x, peso_x in saidas:
+                    if x == u:
+                        continue
+                    candidato = peso_u + peso_x
+                    if distancias.get(x, infinito) > candidato:
+                        atalhos.append((u, x, candidato))
+            return atalhos
+
+        def prioridade(v, atalhos):
+            return 2 * (len(atalhos) - len(entrada[v]) - len(saida[v])) + vizinhos_contraidos[v]
+
+        heap = [(prioridade(v, atalhos_necessarios(v)), v) for v in range(n)]
+        heapq.heapify(heap)
+
+        rank = np.zeros(n, dtype=np.int32)
+        subida = [None] * n
+        descida = [None] * n
+        ordem = 0
+        inicio = time.time()
+
+        while heap:
+            _, v = heapq.heappop(heap)
+            atalhos = atalhos_necessarios(v)
+            nova_prioridade = prioridade(v, atalhos)
+            if heap and nova_prioridade > heap[0][0]:
+                # Atualização preguiçosa: ainda não é o menos importante
+                heapq.heappush(heap, (nova_prioridade, v))
+                continue
+
+            rank[v] = ordem
+            ordem += 1
+            subida[v] = [(w, peso, acumulado[(v, w)], meio.get((v, w), -1)) for w, peso in saida[v].items()]
+            descida[v] = [(u, peso, acumulado[(u, v)], meio.get((u, v), -1)) for u, peso in entrada[v].items()]
+
+            for u in entrada[v]:
+                del saida[u][v]
+                vizinhos_contraidos[u] += 1
+            for w in saida[v]:
+                del entrada[w][v]
+                vizinhos_contraidos[w] += 1
+            for u, x, peso in atalhos:
+                if peso < saida[u].get(x, infinito):
+                    saida[u][x] = peso
+                    entrada[x][u] = peso
+                    acumulado[(u, x)] = acumulado[(u, v)] + acumulado[(v, x)]
+                    meio[(u, x)] = v
+            saida[v] = {}
+            entrada[v] = {}
+
+            if progresso and ordem % 5000 == 0:
+                progresso(ordem, n, time.time() - inicio)
+
+        return cls(rank, *_para_csr(subida), *_para_csr(descida), versao=csr.versao, objetivo=objetivo)
+
+    def _listas(self, direcao):
+        """
+        Cópias em listas Python de offsets/destinos/pesos/acumulados ('subida' ou 'descida')
+        """
+        if direcao not in self._adjacencia:
+            arrays = self.subida if direcao == 'subida' else self.descida
+            self._adjacencia[direcao] = tuple(a.tolist() for a in arrays[:4])
+        return self._adjacencia[direcao]
+
+    def _meios(self, direcao):
+        """Nó contraído de cada aresta ('subida' ou 'descida'), em lista"""
+        chave = f'{direcao}_meio'
+        if chave not in self._adjacencia:
+            arrays = self.subida if direcao == 'subida' else self.descida
+            self._adjacencia[chave] = arrays[4].tolist()
+        return self._adjacencia[chave]
+
+    def _busca(self, origem, direcao, anteriores=None):
+        """
+        Dijkstra completo no grafo para cima (espaço de busca pequeno), com
+        stall-on-demand: um nó alcançável com distância menor por um vizinho
+        de rank maior não é expandido nem retornado.
+        Retorna {nó: (custo, acumulado)}. Com `anteriores`, preenche
+        {nó: (nó anterior, nó contraído da aresta)} para reconstruir o caminho.
+        """
+        offsets, destinos, pesos, acumulados = self._listas(direcao)
+        meios = self._meios(direcao) if anteriores is not None else None
+        r_offsets, r_destinos, r_pesos, _ = self._listas('descida' if direcao == 'subida' else 'subida')
+        distancias = {origem: 0.0}
+        outras = {origem: 0.0}
+        resolvidos = {}
+        heap = [(0.0, origem)]
+        heappop, heappush, infinito = heapq.heappop, heapq.heappush, math.inf
+        while heap:
+            d, u = heappop(heap)
+            if u in resolvidos:
+                continue
+            resolvidos[u] = d
+
+            parado = False
+            for k in range(r_offsets[u], r_offsets[u + 1]):
+                if distancias.get(r_destinos[k], infinito) + r_pesos[k] < d:
+                    parado = True
+                    break
+            if parado:
+                resolvidos[u] = infinito
+                continue
+
+            outra = outras[u]
+            for k in range(offsets[u], offsets[u + 1]):
+                v = destinos[k]
+                nd = d + pesos[k]
+                if nd < distancias.get(v, infinito):
+                    distancias[v] = nd
+                    outras[v] = outra + acumulados[k]
+                    if meios is not None:
+                        anteriores[v] = (u, meios[k])
+                    heappush(heap, (nd, v))
+        return {u: (d, outras[u]) for u, d in resolvidos.items() if d != infinito}
+
+    def distancia(self, origem, destino):
+        """
+        Custo do caminho mínimo entre dois nós pelo objetivo da hierarquia
+        (math.inf se inalcançável)
+        """
+        if origem == destino:
+            return 0.0
+        frente = self._busca(origem, 'subida')
+        tras = self._busca(destino, 'descida')
+        if len(tras) < len(frente):
+            frente, tras = tras, frente
+        return min((d + tras[v][0] for v, (d, _) in frente.items() if v in tras), default=math.inf)
+
+    def _meio_da_aresta(self, no, vizinho, direcao):
+        """
+        Nó contraído da aresta no -> vizinho ('subida') ou vizinho -> no
+        ('descida'), guardada na lista de `no` (o de menor rank)
+        """
+        offsets, destinos, _, _ = self._listas(direcao)
+        meios = self._meios(direcao)
+        for k in range(offsets[no], offsets[no + 1]):
+            if destinos[k] == vizinho:
+                return meios[k]
+        return -1
+
+    def _desempacotar(self, u, w, meio):
+        """
+        Nós da aresta u -> w no grafo original (sem u): cada atalho é
+        trocado pelas duas arestas que passam pelo seu nó contraído
+        """
+        nos = []
+        pilha = [(u, w, meio)]
+        while pilha:
+            a, b, m = pilha.pop()
+            if m < 0:
+                nos.append(b)
+                continue
+            pilha.append((m, b, self._meio_da_aresta(m, b, 'subida')))
+            pilha.append((a, m, self._meio_da_aresta(m, a, 'descida')))
+        return nos
+
+    def caminho(self, origem, destino, objetivo=None):
+        """
+        Nós do caminho mínimo de `origem` a `destino` no grafo original
+        (None se inalcançável): busca para cima a partir dos dois lados e
+        desempacotamento dos atalhos do caminho
+        """
+        self._validar_objetivo(objetivo)
+        if origem == destino:
+            return [origem]
+        anteriores_frente, anteriores_tras = {}, {}
+        frente = self._busca(origem, 'subida', anteriores_frente)
+        tras = self._busca(destino, 'descida', anteriores_tras)
+        encontro = min(
+            (v for v in frente if v in tras),
+            key=lambda v: frente[v][0] + tras[v][0],
+            default=None,
+        )
+        if encontro is None:
+            return None
+
+        arestas = []
+        v = encontro
+        while v != origem:
+            u, meio = anteriores_frente[v]
+            arestas.append((u, v, meio))
+            v = u
+        arestas.reverse()
+        v = encontro
+        while v != destino:
+            w, meio = anteriores_tras[v]
+            arestas.append((v, w, meio))
+            v = w
+
+        nos = [origem]
+        for u, w, meio in arestas:
+            nos.extend(self._desempacotar(u, w, meio))
+        return nos
+
+    def _validar_objetivo(self, objetivo):
+        if objetivo is not None and objetivo != self.objetivo:
+            raise ValueError(f'Hierarquia construída para {self.objetivo}, não para {objetivo}')
+
+    def matrizes(self, nos, linhas=None, objetivo=None):
+        """
+        Matrizes de distâncias (m) e de tempos (s) entre os nós informados
+        (muitos-para-muitos com buckets): uma busca para cima por destino e
+        uma por origem, minimizando o objetivo da hierarquia e somando a
+        outra métrica nos mesmos caminhos. Com `linhas`, apenas essas
+        origens são calculadas. Retorna (distancias, tempos).
+        """
+        self._validar_objetivo(objetivo)
+        n = len(nos)
+        custos = np.full((n, n), math.inf, dtype=np.float64)
+        outras = np.full((n, n), math.inf, dtype=np.float64)
+        buckets = defaultdict(list)
+        for j, destino in enumerate(nos):
+            for v, (d, a) in self._busca(destino, 'descida').items():
+                buckets[v].append((j, d, a))
+
+        for i in (range(n) if linhas is None else linhas):
+            origem = nos[i]
+            linha = [math.inf] * n
+            linha_outra = [math.inf] * n
+            for v, (d, a) in self._busca(origem, 'subida').items():
+                for j, d_tras, a_tras in buckets.get(v, ()):
+                    if d + d_tras < linha[j]:
+                        linha[j] = d + d_tras
+                        linha_outra[j] = a + a_tras
+            linha[i] = linha_outra[i] = 0.0
+            custos[i] = linha
+            outras[i] = linha_outra
+        if self.objetivo == 'tempo':
+            return outras, custos
+        return custos, outras
+
+    def matriz_distancias(self, nos, linhas=None):
+        """
+        Só a matriz de distâncias (caminhos mínimos pelo objetivo da hierarquia)
+        """
+        return self.matrizes(nos, linhas)[0]
+
+    def arrays(self):
+        """Arrays para persistência no GrafoStore"""
+        return dict(zip(ARRAYS_CONTRACAO, (self.rank, *self.subida, *self.descida)))
+
+    def salvar(self, store, chave):
+        """Persiste a hierarquia junto do grafo da região"""
+        store.salvar_arrays(chave, prefixo(self.objetivo), self.arrays(),
+                            {'versao': self.versao, 'objetivo': self.objetivo})
+
+    @classmethod
+    def carregar(cls, store, chave, versao, objetivo='distancia'):
+        """
+        Carrega a hierarquia persistida (mapeada em memória), ou None se não
+        existir ou tiver sido gerada para outra versão do grafo ou em um
+        formato anterior (sem a métrica acumulada)
+        """
+        caminho = store.diretorio / chave
+        if not all((caminho / f'{prefixo(objetivo)}_{nome}.npy').exists() for nome in ARRAYS_CONTRACAO):
+            return None
+        dados = store.carregar_arrays(chave, prefixo(objetivo), ARRAYS_CONTRACAO)
+        if dados is None:
+            return None
+        arrays, meta = dados
+        if meta.get('versao') != versao:
+            return None
+        return cls(*(arrays[nome] for nome in ARRAYS_CONTRACAO), versao=versao, objetivo=objetivo)
+
+
+def construir_e_salvar(store, chave, compacto, objetivo='distancia', progresso=None, forcar=False):
+    """
+    Constrói e persiste a hierarquia da região sob a trava da região e do
+    objetivo no GrafoStore, compartilhada entre processos: quem chega
+    depois encontra a hierarquia já gravada e não a refaz. Retorna
+    (hierarquia, construída agora). Usada pelo comando preprocessar_grafos,
+    nunca pelas requisições (a construção é em Python puro e longa).
+    """
+    with store.trava(f"{chave}.{prefixo(objetivo)}"):
+        if not forcar:
+            ch = ContracaoHierarquica.carregar(store, chave, compacto.versao, objetivo)
+            if ch is not None:
+                return ch, False
+        ch = ContracaoHierarquica.construir(GrafoCSR.de_compacto(compacto), progresso=progresso, objetivo=objetivo)
+        ch.salvar(store, chave)
+        return ch, True
@@ -0,0 +1,167 @@
+# Cache de distâncias e tempos entre pares de nós (memória LRU + banco de dados)
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from django.db import DatabaseError
+
+# Número máximo de pares mantidos em memória por processo
+DISTANCIAS_CACHE_MAX = int(os.getenv('DISTANCIAS_CACHE_MAX', '200000'))
+
+
+class CacheDistancias:
+    """
+    Cache de (distância, tempo) por (versão do grafo, objetivo, nó de
+    origem, nó de destino): o caminho mínimo por distância e o mais rápido
+    são caminhos diferentes. Mantém os pares mais usados em memória com
+    despejo LRU e persiste todos no banco, compartilhado entre workers. Os
+    nós são ids OSM.
+    """
+
+    def __init__(self, max_entradas=DISTANCIAS_CACHE_MAX):
+        self.max_entradas = max_entradas
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {
+            'acertos_memoria': 0,
+            'acertos_banco': 0,
+            'falhas': 0,
+        }
+
+    def _guardar_em_memoria(self, chave, valor):
+        # Chamado com o lock adquirido
+        self._memoria[chave] = valor
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def obter_muitos(self, versao, pares, objetivo='distancia'):
+        """
+        Retorna {(origem, destino): (distância, tempo)} para os pares
+        conhecidos. Pares inalcançáveis conhecidos retornam math.inf.
+        """
+        from .models import DistanciaCache
+
+        encontrados = {}
+        faltantes = []
+        with self._lock:
+            for par in pares:
+                chave = (versao, objetivo, par[0], par[1])
+                if chave in self._memoria:
+                    self._memoria.move_to_end(chave)
+                    encontrados[par] = self._memoria[chave]
+                else:
+                    faltantes.append(par)
+            self._contadores['acertos_memoria'] += len(encontrados)
+
+        if faltantes:
+            origens = {origem for origem, _ in faltantes}
+            destinos = {destino for _, destino in faltantes}
+            pendentes = set(faltantes)
+            try:
+                registros = DistanciaCache.objects.filter(
+                    versao_grafo=versao,
+                    objetivo=objetivo,
+                    no_origem__in=origens,
+                    no_destino__in=destinos,
+                ).values_list('no_origem', 'no_destino', 'distancia_m', 'tempo_s')
+                do_banco = {
+                    (origem, destino): (math.inf, math.inf) if distancia is None else (distancia, tempo)
+                    for origem, destino, distancia, tempo in registros
+                    # Pares gravados antes dos tempos de percurso são recalculados
+                    # (e sobrescritos em salvar_muitos)
+                    if (origem, destino) in pendentes and (distancia is None or tempo is not None)
+                }
+            except DatabaseError as e:
+                print(f"Erro ao consultar cache de distâncias: {e}")
+                do_banco = {}
+
+            with self._lock:
+                for par, valor in do_banco.items():
+                    self._guardar_em_memoria((versao, objetivo, par[0], par[1]), valor)
+                self._contadores['acertos_banco'] += len(do_banco)
+                self._contadores['falhas'] += len(faltantes) - len(do_banco)
+            encontrados.update(do_banco)
+
+        return encontrados
+
+    def salvar_muitos(self, versao, valores, objetivo='distancia'):
+        """
+        Armazena {(origem, destino): (distância, tempo)} em memória e no banco
+        """
+        from .models import DistanciaCache
+
+        if not valores:
+            return
+        with self._lock:
+            for (origem, destino), valor in valores.items():
+                self._guardar_em_memoria((versao, objetivo, origem, destino), valor)
+        try:
+            DistanciaCache.objects.bulk_create(
+                [
+                    DistanciaCache(
+                        versao_grafo=versao,
+                        objetivo=objetivo,
+                        no_origem=origem,
+                        no_destino=destino,
+                        distancia_m=None if math.isinf(distancia) else float(distancia),
+                        tempo_s=None if math.isinf(tempo) else float(tempo),
+                    )
+                    for (origem, destino), (distancia, tempo) in valores.items()
+                ],
+                # Sobrescreve os pares gravados antes dos tempos de percurso
+                # (tempo nulo), que obter_muitos trata como falha
+                update_conflicts=True,
+                unique_fields=['versao_grafo', 'objetivo', 'no_origem', 'no_destino'],
+                update_fields=['distancia_m', 'tempo_s'],
+            )
+        except DatabaseError as e:
+            print(f"Erro ao salvar cache de distâncias: {e}")
+
+    def limpar_versoes(self, versoes_ativas):
+        """
+        Remove da memória e do banco os pares de versões do grafo que não
+        estão em `versoes_ativas` (regiões regravadas, removidas ou
+        expiradas). Retorna a quantidade de registros removidos do banco.
+        """
+        from .models import DistanciaCache
+
+        versoes_ativas = set(versoes_ativas)
+        with self._lock:
+            for chave in [chave for chave in self._memoria if chave[0] not in versoes_ativas]:
+                del self._memoria[chave]
+        try:
+            removidos, _ = DistanciaCache.objects.exclude(versao_grafo__in=versoes_ativas).delete()
+            return removidos
+        except DatabaseError as e:
+            print(f"Erro ao limpar cache de distâncias: {e}")
+            return 0
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do processo atual e a taxa de acerto
+        """
+        with self._lock:
+            dados = dict(self._contadores)
+            dados['entradas_memoria'] = len(self._memoria)
+        consultas = dados['acertos_memoria'] + dados['acertos_banco'] + dados['falhas']
+        dados['consultas'] = consultas
+        dados['taxa_acerto'] = (
+            (dados['acertos_memoria'] + dados['acertos_banco']) / consultas if consultas else 0.0
+        )
+        return dados
+
+
+# Instância compartilhada
+_cache_distancias = None
+_cache_distancias_lock = threading.Lock()
+
+
+def get_cache_distancias():
+    """Retorna instância singleton do cache de distâncias"""
+    global _cache_distancias
+    with _cache_distancias_lock:
+        if _cache_distancias is None:
+            _cache_distancias = CacheDistancias()
+    return _cache_distancias
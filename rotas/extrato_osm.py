@@ -0,0 +1,174 @@
+# Leitura de extratos OSM locais (.osm, .osm.pbf, GraphML) para o formato compacto dos grafos
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from .grafos import GrafoCompacto
+from .haversine import distancias_pares
+from .velocidades import velocidade_via
+
+# Mesmo filtro de vias trafegáveis por carro do network_type='drive' do OSMnx
+HIGHWAY_EXCLUIDOS = {
+    'abandoned', 'bridleway', 'bus_guideway', 'construction', 'corridor', 'cycleway',
+    'elevator', 'escalator', 'footway', 'no', 'path', 'pedestrian', 'planned', 'platform',
+    'proposed', 'raceway', 'razed', 'service', 'steps', 'track',
+}
+SERVICE_EXCLUIDOS = {'alley', 'driveway', 'emergency_access', 'parking', 'parking_aisle', 'private'}
+
+
+def via_trafegavel(tags):
+    """
+    Indica se a via (tags OSM) entra no grafo de roteamento de veículos
+    """
+    highway = tags.get('highway')
+    if not highway or highway in HIGHWAY_EXCLUIDOS:
+        return False
+    if tags.get('area') == 'yes' or tags.get('access') == 'private':
+        return False
+    if tags.get('motor_vehicle') == 'no' or tags.get('motorcar') == 'no':
+        return False
+    return tags.get('service') not in SERVICE_EXCLUIDOS
+
+
+def sentidos(tags):
+    """
+    (ida, volta): se a via pode ser percorrida na ordem dos nós e no
+    sentido contrário
+    """
+    oneway = tags.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return True, False
+    if oneway in ('-1', 'reverse'):
+        return False, True
+    if oneway not in ('no', 'false', '0') and tags.get('junction') in ('roundabout', 'circular'):
+        return True, False
+    return True, True
+
+
+class MontadorGrafo:
+    """
+    Acumula nós e vias trafegáveis lidos do extrato e gera o GrafoCompacto
+    (sem simplificação: cada trecho entre nós consecutivos vira uma aresta,
+    com o tempo de percurso pela velocidade da via)
+    """
+
+    def __init__(self):
+        self.nos = {}
+        self.vias = []
+
+    def adicionar_no(self, no_id, lat, lon):
+        self.nos[no_id] = (lat, lon)
+
+    def adicionar_via(self, refs, tags):
+        if len(refs) >= 2 and via_trafegavel(tags):
+            velocidade = velocidade_via(tags.get('highway'), tags.get('maxspeed'))
+            self.vias.append((refs, sentidos(tags), velocidade))
+
+    def grafo(self, meta=None):
+        origens, destinos, velocidades = [], [], []
+        for refs, (ida, volta), velocidade in self.vias:
+            # Trechos com nós fora do recorte do extrato são descartados
+            trechos = [(u, v) for u, v in zip(refs, refs[1:]) if u in self.nos and v in self.nos]
+            if ida:
+                origens.extend(u for u, _ in trechos)
+                destinos.extend(v for _, v in trechos)
+            if volta:
+                origens.extend(v for _, v in trechos)
+                destinos.extend(u for u, _ in trechos)
+            velocidades.extend([velocidade] * (len(trechos) * (ida + volta)))
+        origens = np.array(origens, dtype=np.int64)
+        destinos = np.array(destinos, dtype=np.int64)
+        velocidades = np.array(velocidades, dtype=np.float64)
+        validos = origens != destinos
+        origens, destinos, velocidades = origens[validos], destinos[validos], velocidades[validos]
+
+        nos_osm = np.unique(np.concatenate([origens, destinos]))
+        coordenadas = np.array([self.nos[no] for no in nos_osm.tolist()], dtype=np.float64).reshape(-1, 2)
+        arestas_origem = np.searchsorted(nos_osm, origens)
+        arestas_destino = np.searchsorted(nos_osm, destinos)
+        comprimento = distancias_pares(coordenadas[arestas_origem], coordenadas[arestas_destino])
+        tempo = comprimento / (velocidades / 3.6)
+
+        # Ordena por origem e mantém a menor de arestas paralelas
+        ordem = np.lexsort((comprimento, arestas_destino, arestas_origem))
+        arestas_origem, arestas_destino, comprimento, tempo = (
+            arestas_origem[ordem], arestas_destino[ordem], comprimento[ordem], tempo[ordem]
+        )
+        unicas = np.ones(len(ordem), dtype=bool)
+        unicas[1:] = (arestas_origem[1:] != arestas_origem[:-1]) | (arestas_destino[1:] != arestas_destino[:-1])
+
+        return GrafoCompacto(
+            nos_osm, coordenadas[:, 0].copy(), coordenadas[:, 1].copy(),
+            arestas_origem[unicas].astype(np.int32), arestas_destino[unicas].astype(np.int32),
+            comprimento[unicas].astype(np.float32), tempo[unicas].astype(np.float32),
+            meta=dict(meta or {}),
+        )
+
+
+def ler_osm_xml(caminho):
+    """
+    Lê um extrato .osm (XML) em streaming
+    """
+    montador = MontadorGrafo()
+    for _, elemento in ET.iterparse(caminho, events=('end',)):
+        if elemento.tag == 'node':
+            montador.adicionar_no(int(elemento.get('id')), float(elemento.get('lat')), float(elemento.get('lon')))
+        elif elemento.tag == 'way':
+            refs = [int(nd.get('ref')) for nd in elemento.iter('nd')]
+            tags = {tag.get('k'): tag.get('v') for tag in elemento.iter('tag')}
+            montador.adicionar_via(refs, tags)
+        if elemento.tag in ('node', 'way', 'relation'):
+            elemento.clear()
+    return montador
+
+
+def ler_osm_pbf(caminho):
+    """
+    Lê um extrato .osm.pbf com o pyosmium (dependência opcional)
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError('Leitura de .osm.pbf requer o pacote osmium (pip install osmium)')
+
+    montador = MontadorGrafo()
+
+    class Leitor(osmium.SimpleHandler):
+        def way(self, via):
+            tags = {tag.k: tag.v for tag in via.tags}
+            if not via_trafegavel(tags):
+                return
+            refs = []
+            for no in via.nodes:
+                if no.location.valid():
+                    montador.adicionar_no(no.ref, no.location.lat, no.location.lon)
+                    refs.append(no.ref)
+            montador.adicionar_via(refs, tags)
+
+    # locations=True resolve as coordenadas dos nós de cada via durante a leitura
+    Leitor().apply_file(str(caminho), locations=True)
+    return montador
+
+
+def ler_graphml(caminho, meta=None):
+    """
+    Lê um grafo GraphML salvo pelo OSMnx (já filtrado ao salvar)
+    """
+    import osmnx as ox
+
+    return GrafoCompacto.de_networkx(ox.load_graphml(caminho), meta=meta)
+
+
+def grafo_do_extrato(caminho):
+    """
+    GrafoCompacto do extrato, pelo formato indicado na extensão do arquivo
+    """
+    nome = str(caminho).lower()
+    meta = {'fonte': str(caminho)}
+    if nome.endswith('.graphml'):
+        return ler_graphml(caminho, meta=meta)
+    if nome.endswith('.pbf'):
+        return ler_osm_pbf(caminho).grafo(meta=meta)
+    if nome.endswith('.osm') or nome.endswith('.xml'):
+        return ler_osm_xml(caminho).grafo(meta=meta)
+    raise ValueError(f'Formato de extrato não suportado: {caminho} (use .osm, .osm.pbf ou .graphml)')
@@ -0,0 +1,228 @@
+# Geocodificação offline a partir de um gazetteer local (CEP e logradouros)
+import bisect
+import csv
+import gzip
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+
+from .geocodificacao import normalizar_endereco
+
+# Caminho do arquivo do gazetteer (CSV ou CSV.GZ)
+GAZETTEER_PATH = os.getenv(
+    'GAZETTEER_PATH',
+    str(Path(__file__).resolve().parent.parent / 'dados' / 'gazetteer.csv')
+)
+
+CEP_REGEX = re.compile(r'(?<!\d)(\d{5})-?(\d{3})(?!\d)')
+UFS = {
+    'ac', 'al', 'ap', 'am', 'ba', 'ce', 'df', 'es', 'go', 'ma', 'mt', 'ms', 'mg', 'pa',
+    'pb', 'pr', 'pe', 'pi', 'rj', 'rn', 'rs', 'ro', 'rr', 'sc', 'sp', 'se', 'to',
+}
+
+
+def extrair_cep(texto):
+    """
+    Extrai o primeiro CEP (8 dígitos) de um texto, ou None
+    """
+    if not texto:
+        return None
+    match = CEP_REGEX.search(str(texto))
+    if not match:
+        return None
+    return int(match.group(1) + match.group(2))
+
+
+def chave_logradouro(logradouro, bairro, cidade):
+    """
+    Chave normalizada logradouro|bairro|cidade usada no índice de ruas
+    """
+    return '|'.join(normalizar_endereco(parte) for parte in (logradouro, bairro, cidade))
+
+
+class Gazetteer:
+    """
+    Índice compacto em memória para geocodificação sem rede.
+
+    O arquivo é um CSV com cabeçalho contendo as colunas
+    cep, logradouro, bairro, cidade, latitude, longitude (uf opcional).
+    Linhas com CEP alimentam o índice CEP -> centroide; linhas com
+    logradouro, bairro e cidade alimentam o índice de ruas. Os índices
+    são arrays ordenados consultados por busca binária.
+    """
+
+    def __init__(self, ceps=None, ceps_lat=None, ceps_lon=None, ruas=None, ruas_lat=None, ruas_lon=None):
+        self._ceps = ceps or array('I')
+        self._ceps_lat = ceps_lat or array('f')
+        self._ceps_lon = ceps_lon or array('f')
+        self._ruas = ruas or []
+        self._ruas_lat = ruas_lat or array('f')
+        self._ruas_lon = ruas_lon or array('f')
+        self._lock = threading.Lock()
+        self._contadores = {'acertos_cep': 0, 'acertos_rua': 0, 'falhas': 0}
+
+    @classmethod
+    def carregar(cls, caminho):
+        """
+        Carrega o gazetteer de um arquivo CSV (ou CSV compactado com gzip)
+        """
+        abrir = gzip.open if str(caminho).endswith('.gz') else open
+        somas_cep = {}
+        somas_rua = {}
+        with abrir(caminho, 'rt', encoding='utf-8', newline='') as arquivo:
+            amostra = arquivo.read(4096)
+            arquivo.seek(0)
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+            for linha in csv.DictReader(arquivo, dialect=dialeto):
+                try:
+                    lat = float(linha['latitude'])
+                    lon = float(linha['longitude'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+                cep = extrair_cep(linha.get('cep'))
+                if cep is not None:
+                    soma = somas_cep.setdefault(cep, [0.0, 0.0, 0])
+                    soma[0] += lat
+                    soma[1] += lon
+                    soma[2] += 1
+
+                logradouro, bairro, cidade = linha.get('logradouro'), linha.get('bairro'), linha.get('cidade')
+                if logradouro and bairro and cidade:
+                    soma = somas_rua.setdefault(chave_logradouro(logradouro, bairro, cidade), [0.0, 0.0, 0])
+                    soma[0] += lat
+                    soma[1] += lon
+                    soma[2] += 1
+
+        ceps = sorted(somas_cep)
+        ruas = sorted(somas_rua)
+        return cls(
+            ceps=array('I', ceps),
+            ceps_lat=array('f', (somas_cep[c][0] / somas_cep[c][2] for c in ceps)),
+            ceps_lon=array('f', (somas_cep[c][1] / somas_cep[c][2] for c in ceps)),
+            ruas=ruas,
+            ruas_lat=array('f', (somas_rua[r][0] / somas_rua[r][2] for r in ruas)),
+            ruas_lon=array('f', (somas_rua[r][1] / somas_rua[r][2] for r in ruas)),
+        )
+
+    def __len__(self):
+        return len(self._ceps) + len(self._ruas)
+
+    def _incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def localizar_cep(self, cep):
+        """
+        Retorna o centroide do CEP (int ou texto), ou None
+        """
+        if not isinstance(cep, int):
+            cep = extrair_cep(cep)
+            if cep is None:
+                return None
+        i = bisect.bisect_left(self._ceps, cep)
+        if i < len(self._ceps) and self._ceps[i] == cep:
+            return (round(self._ceps_lat[i], 6), round(self._ceps_lon[i], 6))
+        return None
+
+    def localizar_logradouro(self, logradouro, bairro, cidade):
+        """
+        Retorna as coordenadas de logradouro + bairro + cidade, ou None
+        """
+        chave = chave_logradouro(logradouro, bairro, cidade)
+        i = bisect.bisect_left(self._ruas, chave)
+        if i < len(self._ruas) and self._ruas[i] == chave:
+            return (round(self._ruas_lat[i], 6), round(self._ruas_lon[i], 6))
+        return None
+
+    def _partes_endereco(self, endereco):
+        """
+        Separa o endereço em partes textuais, sem números, CEP e UF
+        """
+        sem_cep = CEP_REGEX.sub(' ', str(endereco))
+        partes = []
+        for parte in re.split(r'[,;]|\s-\s', sem_cep):
+            parte = normalizar_endereco(parte)
+            if not parte or parte.isdigit() or parte in UFS:
+                continue
+            partes.append(parte)
+        return partes
+
+    def localizar(self, endereco):
+        """
+        Geocodifica um endereço em texto livre usando apenas o índice local.
+        Tenta primeiro o CEP contido no texto e depois o logradouro com
+        bairro e cidade (formato de Usuario.endereco_completo()).
+        """
+        coordenadas = self.localizar_cep(extrair_cep(endereco)) if self._ceps else None
+        if coordenadas is not None:
+            self._incrementar('acertos_cep')
+            return coordenadas
+
+        if self._ruas:
+            partes = self._partes_endereco(endereco)
+            if len(partes) >= 3:
+                logradouro = partes[0]
+                for j in range(1, len(partes) - 1):
+                    for k in range(j + 1, len(partes)):
+                        coordenadas = self.localizar_logradouro(logradouro, partes[j], partes[k])
+                        if coordenadas is not None:
+                            self._incrementar('acertos_rua')
+                            return coordenadas
+
+        self._incrementar('falhas')
+        return None
+
+    def localizar_usuario(self, usuario):
+        """
+        Geocodifica o endereço cadastrado de um Usuario pelos campos
+        estruturados (usado pelo motor de rotas para a origem da rota)
+        """
+        coordenadas = self.localizar_cep(usuario.cep)
+        if coordenadas is not None:
+            self._incrementar('acertos_cep')
+            return coordenadas
+        if usuario.rua and usuario.bairro and usuario.cidade:
+            coordenadas = self.localizar_logradouro(usuario.rua, usuario.bairro, usuario.cidade)
+            if coordenadas is not None:
+                self._incrementar('acertos_rua')
+                return coordenadas
+        self._incrementar('falhas')
+        return None
+
+    def estatisticas(self):
+        """
+        Retorna o tamanho dos índices e os contadores do processo atual
+        """
+        with self._lock:
+            dados = dict(self._contadores)
+        dados['ceps'] = len(self._ceps)
+        dados['logradouros'] = len(self._ruas)
+        return dados
+
+
+# Instância compartilhada (carregada sob demanda)
+_gazetteer = None
+_gazetteer_carregado = False
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """
+    Retorna o gazetteer carregado de GAZETTEER_PATH, ou None se o arquivo
+    não existir (a geocodificação segue então direto para o cache/provedor)
+    """
+    global _gazetteer, _gazetteer_carregado
+    with _gazetteer_lock:
+        if not _gazetteer_carregado:
+            _gazetteer_carregado = True
+            if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+                try:
+                    _gazetteer = Gazetteer.carregar(GAZETTEER_PATH)
+                    print(f"✅ Gazetteer carregado: {len(_gazetteer)} entradas")
+                except Exception as e:
+                    print(f"⚠️  Erro ao carregar gazetteer '{GAZETTEER_PATH}': {e}")
+                    _gazetteer = None
+    return _gazetteer
@@ -0,0 +1,364 @@
+# Geocodificação com cache persistente compartilhado entre workers
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# TTLs configuráveis por ambiente (em horas)
+GEOCODING_TTL_HORAS = int(os.getenv('GEOCODING_TTL_HORAS', str(30 * 24)))
+GEOCODING_TTL_NEGATIVO_HORAS = int(os.getenv('GEOCODING_TTL_NEGATIVO_HORAS', '6'))
+
+# Provedor remoto (Nominatim) e limites de uso
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+NOMINATIM_USER_AGENT = os.getenv('NOMINATIM_USER_AGENT', 'milo-backend/1.0')
+GEOCODING_REQUISICOES_POR_SEGUNDO = float(os.getenv('GEOCODING_REQUISICOES_POR_SEGUNDO', '1'))
+GEOCODING_RAJADA = int(os.getenv('GEOCODING_RAJADA', '1'))
+# Nome do token bucket no banco (LimiteTaxa), compartilhado por todos os processos
+GEOCODING_LIMITE_NOME = 'nominatim'
+GEOCODING_MAX_WORKERS = int(os.getenv('GEOCODING_MAX_WORKERS', '4'))
+GEOCODING_TIMEOUT = float(os.getenv('GEOCODING_TIMEOUT', '10'))
+
+
+def normalizar_endereco(endereco):
+    """
+    Normaliza um endereço para uso como chave de cache:
+    remove acentos, caixa, pontuação redundante e espaços duplicados
+    """
+    texto = unicodedata.normalize('NFKD', str(endereco))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.lower()
+    texto = re.sub(r'[^\w,\-]+', ' ', texto)
+    texto = re.sub(r'\s*,\s*', ', ', texto)
+    texto = re.sub(r'\s+-\s*|\s*-\s+', ' - ', texto)
+    texto = re.sub(r'\b(\d{5})-(\d{3})\b', r'\1\2', texto)  # CEP sem hífen
+    texto = re.sub(r'\s+', ' ', texto)
+    return texto.strip(' ,')
+
+
+def chave_endereco(endereco):
+    """
+    Retorna a chave de cache (sha1 do endereço normalizado)
+    """
+    return hashlib.sha1(normalizar_endereco(endereco).encode('utf-8')).hexdigest()
+
+
+class GeocodificacaoStore:
+    """
+    Cache de geocodificação em banco de dados, compartilhado por todos os workers.
+    Guarda também resultados negativos (com TTL menor) e mantém contadores
+    de acertos/falhas do processo atual.
+    """
+
+    def __init__(self, ttl_horas=GEOCODING_TTL_HORAS, ttl_negativo_horas=GEOCODING_TTL_NEGATIVO_HORAS):
+        self.ttl = timedelta(hours=ttl_horas)
+        self.ttl_negativo = timedelta(hours=ttl_negativo_horas)
+        self._lock = threading.Lock()
+        self._contadores = {
+            'acertos': 0,
+            'acertos_negativos': 0,
+            'falhas': 0,
+            'expirados': 0,
+            'erros_banco': 0,
+        }
+
+    def _incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def obter(self, endereco):
+        """
+        Consulta o cache.
+        Retorna (encontrado_no_cache, coordenadas). Um resultado negativo
+        em cache retorna (True, None).
+        """
+        chave = chave_endereco(endereco)
+        encontrados = self.obter_muitos([endereco])
+        return chave in encontrados, encontrados.get(chave)
+
+    def obter_muitos(self, enderecos):
+        """
+        Consulta o cache para vários endereços com uma única consulta.
+        Retorna {chave: coordenadas} apenas para os encontrados no cache
+        (coordenadas None nos resultados negativos).
+        """
+        from .models import GeocodificacaoCache
+
+        chaves = {chave_endereco(endereco) for endereco in enderecos}
+        if not chaves:
+            return {}
+        try:
+            registros = list(GeocodificacaoCache.objects.filter(chave__in=chaves))
+        except DatabaseError as e:
+            print(f"Erro ao consultar cache de geocodificação: {e}")
+            with self._lock:
+                self._contadores['erros_banco'] += 1
+                self._contadores['falhas'] += len(chaves)
+            return {}
+
+        agora = timezone.now()
+        validos = [
+            registro for registro in registros
+            if agora - registro.data_atualizacao <= (self.ttl if registro.encontrado else self.ttl_negativo)
+        ]
+        if validos:
+            try:
+                GeocodificacaoCache.objects.filter(
+                    pk__in=[registro.pk for registro in validos]
+                ).update(acertos=F('acertos') + 1)
+            except DatabaseError:
+                pass
+
+        with self._lock:
+            acertos = sum(registro.encontrado for registro in validos)
+            self._contadores['acertos'] += acertos
+            self._contadores['acertos_negativos'] += len(validos) - acertos
+            self._contadores['expirados'] += len(registros) - len(validos)
+            self._contadores['falhas'] += len(chaves) - len(validos)
+        return {registro.chave: registro.coordenadas for registro in validos}
+
+    def salvar(self, endereco, coordenadas):
+        """
+        Armazena o resultado de uma geocodificação (None = não encontrado)
+        """
+        from .models import GeocodificacaoCache
+
+        encontrado = coordenadas is not None
+        try:
+            GeocodificacaoCache.objects.update_or_create(
+                chave=chave_endereco(endereco),
+                defaults={
+                    'endereco_normalizado': normalizar_endereco(endereco),
+                    'latitude': float(coordenadas[0]) if encontrado else None,
+                    'longitude': float(coordenadas[1]) if encontrado else None,
+                    'encontrado': encontrado,
+                    'data_atualizacao': timezone.now(),
+                }
+            )
+        except DatabaseError as e:
+            print(f"Erro ao salvar cache de geocodificação: {e}")
+            self._incrementar('erros_banco')
+
+    def limpar_expirados(self):
+        """
+        Remove do banco as entradas expiradas (positivas e negativas)
+        """
+        from .models import GeocodificacaoCache
+
+        agora = timezone.now()
+        try:
+            removidos, _ = GeocodificacaoCache.objects.filter(
+                encontrado=True, data_atualizacao__lt=agora - self.ttl
+            ).delete()
+            removidos_negativos, _ = GeocodificacaoCache.objects.filter(
+                encontrado=False, data_atualizacao__lt=agora - self.ttl_negativo
+            ).delete()
+            return removidos + removidos_negativos
+        except DatabaseError as e:
+            print(f"Erro ao limpar cache de geocodificação: {e}")
+            return 0
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de acertos/falhas do processo atual
+        """
+        with self._lock:
+            dados = dict(self._contadores)
+        consultas = dados['acertos'] + dados['acertos_negativos'] + dados['falhas']
+        dados['consultas'] = consultas
+        dados['taxa_acerto'] = (
+            (dados['acertos'] + dados['acertos_negativos']) / consultas if consultas else 0.0
+        )
+        return dados
+
+
+class TokenBucket:
+    """
+    Limitador de taxa do tipo token bucket compartilhado por todos os
+    processos: o estado fica em uma linha de LimiteTaxa, lida e atualizada
+    com select_for_update, então workers, comandos e servidores que usam o
+    mesmo banco dividem a mesma taxa. Repõe `taxa` tokens por segundo até
+    o limite de `capacidade`.
+    """
+
+    def __init__(self, nome, taxa, capacidade=1):
+        self.nome = nome
+        self.taxa = float(taxa)
+        self.capacidade = max(1, int(capacidade))
+
+    def _tentar_consumir(self):
+        """
+        Consome um token se houver. Retorna 0 ou a espera (em segundos)
+        até o próximo token.
+        """
+        from .models import LimiteTaxa
+
+        agora = timezone.now()
+        with transaction.atomic():
+            registro, _ = LimiteTaxa.objects.select_for_update().get_or_create(
+                nome=self.nome,
+                defaults={'tokens': float(self.capacidade), 'data_atualizacao': agora},
+            )
+            decorrido = max(0.0, (agora - registro.data_atualizacao).total_seconds())
+            tokens = min(self.capacidade, registro.tokens + decorrido * self.taxa)
+            espera = 0.0 if tokens >= 1 else (1 - tokens) / self.taxa
+            registro.tokens = tokens - 1 if tokens >= 1 else tokens
+            registro.data_atualizacao = agora
+            registro.save(update_fields=['tokens', 'data_atualizacao'])
+        return espera
+
+    def consumir(self, timeout=None):
+        """
+        Aguarda até haver um token disponível e o consome.
+        Retorna False se o timeout (em segundos) expirar antes disso.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                espera = self._tentar_consumir()
+            except DatabaseError as e:
+                # Sem o banco, espaça as requisições deste processo pela taxa
+                print(f"Erro no limitador de taxa compartilhado: {e}")
+                time.sleep(1 / self.taxa)
+                return True
+            if espera <= 0:
+                return True
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                espera = min(espera, restante)
+            time.sleep(espera)
+
+
+class GeocodificadorLote:
+    """
+    Geocodificador em lote: remove endereços duplicados, responde pelo
+    gazetteer local e pelo cache imediatamente e envia as falhas ao provedor
+    remoto em paralelo, por uma sessão HTTP com pool de conexões, respeitando
+    o token bucket.
+    """
+
+    def __init__(self, store=None, gazetteer=None, max_workers=GEOCODING_MAX_WORKERS,
+                 requisicoes_por_segundo=GEOCODING_REQUISICOES_POR_SEGUNDO,
+                 rajada=GEOCODING_RAJADA, url=NOMINATIM_URL, timeout=GEOCODING_TIMEOUT):
+        self.store = store or get_geocodificacao_store()
+        self.gazetteer = gazetteer
+        self.url = url
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.limitador = TokenBucket(GEOCODING_LIMITE_NOME, requisicoes_por_segundo, rajada)
+
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': NOMINATIM_USER_AGENT})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='geocodificacao')
+
+    def _consultar_provedor(self, endereco):
+        """
+        Consulta o provedor remoto (o token do limitador já foi consumido).
+        Retorna (resposta_valida, coordenadas); resposta_valida é False
+        em falhas transitórias, que não devem ser armazenadas no cache.
+        """
+        params = {
+            'q': endereco,
+            'format': 'json',
+            'limit': 1,
+            'countrycodes': 'br'  # Foco no Brasil
+        }
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            print(f"Erro na geocodificação de '{endereco}': {e}")
+            return False, None
+
+        if data:
+            return True, (float(data[0]['lat']), float(data[0]['lon']))
+        return True, None
+
+    def geocodificar_lote(self, enderecos, usar_cache=True):
+        """
+        Geocodifica uma lista de endereços preservando a ordem de entrada.
+        Endereços não encontrados retornam None.
+        """
+        resultados = {}
+        pendentes = {}
+        for endereco in enderecos:
+            chave = chave_endereco(endereco)
+            if chave in resultados or chave in pendentes:
+                continue
+            # 1º nível: gazetteer local (sem rede)
+            if self.gazetteer is not None:
+                coordenadas = self.gazetteer.localizar(endereco)
+                if coordenadas is not None:
+                    resultados[chave] = coordenadas
+                    continue
+            pendentes[chave] = endereco
+
+        # 2º nível: cache persistente (uma consulta para o lote)
+        if usar_cache and pendentes:
+            em_cache = self.store.obter_muitos(pendentes.values())
+            resultados.update(em_cache)
+            pendentes = {chave: endereco for chave, endereco in pendentes.items() if chave not in em_cache}
+
+        # 3º nível: provedor remoto. Os tokens são consumidos nesta thread
+        # (o limitador usa o banco) e as requisições seguem em paralelo
+        if pendentes:
+            futuros = []
+            for endereco in pendentes.values():
+                self.limitador.consumir()
+                futuros.append(self._executor.submit(self._consultar_provedor, endereco))
+            # Gravações no banco ficam na thread chamadora (conexão do request)
+            for (chave, endereco), futuro in zip(pendentes.items(), futuros):
+                resposta_valida, coordenadas = futuro.result()
+                resultados[chave] = coordenadas
+                if resposta_valida:
+                    self.store.salvar(endereco, coordenadas)
+
+        return [resultados[chave_endereco(endereco)] for endereco in enderecos]
+
+    def geocodificar(self, endereco, usar_cache=True):
+        """Geocodifica um único endereço"""
+        return self.geocodificar_lote([endereco], usar_cache=usar_cache)[0]
+
+
+# Instâncias compartilhadas por todas as variantes do serviço de rotas
+_geocodificacao_store = None
+_geocodificador_lote = None
+_singletons_lock = threading.Lock()
+
+
+def get_geocodificacao_store():
+    """Retorna instância singleton do cache de geocodificação"""
+    global _geocodificacao_store
+    with _singletons_lock:
+        if _geocodificacao_store is None:
+            _geocodificacao_store = GeocodificacaoStore()
+    return _geocodificacao_store
+
+
+def get_geocodificador():
+    """Retorna instância singleton do geocodificador em lote (token bucket compartilhado)"""
+    from .gazetteer import get_gazetteer
+
+    global _geocodificador_lote
+    store = get_geocodificacao_store()
+    gazetteer = get_gazetteer()
+    with _singletons_lock:
+        if _geocodificador_lote is None:
+            _geocodificador_lote = GeocodificadorLote(store=store, gazetteer=gazetteer)
+    return _geocodificador_lote
@@ -0,0 +1,82 @@
+# Geometria das rotas pelas vias: simplificação e codificação em polyline (algoritmo do Google)
+import os
+
+import numpy as np
+
+from .haversine import RAIO_TERRA_M
+
+# Com false, as rotas são salvas sem geometria
+ROTAS_GEOMETRIA = os.getenv('ROTAS_GEOMETRIA', 'true').lower() == 'true'
+
+# Distância máxima (m) de um ponto removido à linha simplificada (0 = sem simplificação)
+ROTAS_GEOMETRIA_TOLERANCIA_M = float(os.getenv('ROTAS_GEOMETRIA_TOLERANCIA_M', '5'))
+
+# Casas decimais das coordenadas na polyline (5 é o padrão do Google Maps)
+POLYLINE_PRECISAO = 5
+
+
+def simplificar(coordenadas, tolerancia_m=ROTAS_GEOMETRIA_TOLERANCIA_M):
+    """
+    Douglas-Peucker em uma projeção equirretangular local (metros): remove
+    os pontos a menos de `tolerancia_m` do trecho entre os pontos mantidos.
+    Usa a distância ao segmento (não à reta), para não cortar idas e
+    voltas pela mesma via.
+    """
+    pontos = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if tolerancia_m <= 0 or len(pontos) < 3:
+        return pontos.tolist()
+
+    lat, lon = np.radians(pontos[:, 0]), np.radians(pontos[:, 1])
+    xy = np.column_stack([lon * np.cos(lat.mean()), lat]) * RAIO_TERRA_M
+
+    manter = np.zeros(len(pontos), dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, len(pontos) - 1)]
+    while pilha:
+        i, j = pilha.pop()
+        if j <= i + 1:
+            continue
+        inicio, segmento, meio = xy[i], xy[j] - xy[i], xy[i + 1:j]
+        comprimento = segmento @ segmento
+        t = np.clip((meio - inicio) @ segmento / comprimento, 0.0, 1.0) if comprimento > 0 else 0.0
+        distancias = np.hypot(*(meio - (inicio + np.outer(t, segmento))).T)
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia_m:
+            k += i + 1
+            manter[k] = True
+            pilha.extend([(i, k), (k, j)])
+    return pontos[manter].tolist()
+
+
+def codificar_polyline(coordenadas, precisao=POLYLINE_PRECISAO):
+    """
+    Codifica uma sequência de (lat, lon) no formato de polyline do Google
+    (deltas inteiros em blocos de 5 bits como caracteres ASCII)
+    """
+    inteiros = np.rint(np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2) * 10 ** precisao).astype(np.int64)
+    deltas = np.diff(inteiros, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    partes = []
+    for valor in deltas.ravel().tolist():
+        valor = ~(valor << 1) if valor < 0 else valor << 1
+        while valor >= 0x20:
+            partes.append(chr((0x20 | (valor & 0x1f)) + 63))
+            valor >>= 5
+        partes.append(chr(valor + 63))
+    return ''.join(partes)
+
+
+def decodificar_polyline(texto, precisao=POLYLINE_PRECISAO):
+    """
+    Converte uma polyline do Google de volta em uma lista de [lat, lon]
+    """
+    valores = []
+    atual = deslocamento = 0
+    for caractere in texto:
+        byte = ord(caractere) - 63
+        atual |= (byte & 0x1f) << deslocamento
+        deslocamento += 5
+        if byte < 0x20:
+            valores.append(~(atual >> 1) if atual & 1 else atual >> 1)
+            atual = deslocamento = 0
+    inteiros = np.asarray(valores, dtype=np.int64).reshape(-1, 2)
+    return (np.cumsum(inteiros, axis=0) / 10 ** precisao).tolist()
@@ -0,0 +1,255 @@
+# Grafo viário em formato CSR (compressed sparse row) com o Dijkstra do scipy.sparse.csgraph
+import math
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+from .haversine import matriz_haversine
+
+# Métrica minimizada nas buscas: a outra é acumulada ao longo do mesmo caminho
+OBJETIVOS = ('distancia', 'tempo')
+
+# Máximo de custos (origens x nós do grafo) calculados por lote em matrizes()
+GRAFOS_CSR_LOTE = int(os.getenv('GRAFOS_CSR_LOTE', '4000000'))
+
+# As buscas de matrizes() param no custo de um caminho hipotético de
+# GRAFOS_CSR_LIMITE_FATOR vezes a maior distância em linha reta até um alvo
+# (para o tempo, percorrido a GRAFOS_CSR_LIMITE_VELOCIDADE_KMH); alvos
+# além disso são buscados de novo sem limite
+GRAFOS_CSR_LIMITE_FATOR = float(os.getenv('GRAFOS_CSR_LIMITE_FATOR', '2.0'))
+GRAFOS_CSR_LIMITE_VELOCIDADE_KMH = float(os.getenv('GRAFOS_CSR_LIMITE_VELOCIDADE_KMH', '30'))
+
+
+class GrafoCSR:
+    """
+    Lista de adjacência compacta:
+    offsets (int32, n+1), destinos (int32), comprimentos (m, float32) e
+    tempos de percurso (s, float32).
+    As arestas que saem do nó u estão em destinos[offsets[u]:offsets[u+1]].
+    Com as coordenadas dos nós (nos_lat, nos_lon), as buscas de matrizes()
+    param cedo, pela distância em linha reta até os alvos.
+    """
+
+    def __init__(self, offsets, destinos, comprimentos, tempos, versao=None, nos_lat=None, nos_lon=None):
+        self.offsets = offsets
+        self.destinos = destinos
+        self.comprimentos = comprimentos
+        self.tempos = tempos
+        self.versao = versao
+        self.nos_lat = nos_lat
+        self.nos_lon = nos_lon
+        self._matrizes = {}
+
+    @property
+    def num_nos(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def de_arestas(cls, num_nos, origens, destinos, comprimentos, tempos, versao=None):
+        """
+        Monta o CSR a partir de uma lista de arestas (origem, destino, comprimento, tempo)
+        """
+        origens = np.asarray(origens)
+        ordem = np.argsort(origens, kind='stable')
+        contagem = np.bincount(origens, minlength=num_nos)
+        offsets = np.zeros(num_nos + 1, dtype=np.int32)
+        np.cumsum(contagem, out=offsets[1:])
+        return cls(
+            offsets,
+            np.asarray(destinos, dtype=np.int32)[ordem],
+            np.asarray(comprimentos, dtype=np.float32)[ordem],
+            np.asarray(tempos, dtype=np.float32)[ordem],
+            versao=versao,
+        )
+
+    @classmethod
+    def de_compacto(cls, grafo):
+        """
+        Converte um GrafoCompacto em CSR. Com as arestas já ordenadas por
+        origem (caso de todos os grafos do GrafoStore), destinos e pesos são
+        usados sem cópia e continuam mapeados em memória, compartilhados
+        entre os processos; só os offsets são calculados.
+        """
+        origens = np.asarray(grafo.arestas_origem)
+        if not np.any(origens[1:] < origens[:-1]):
+            offsets = np.searchsorted(origens, np.arange(grafo.num_nos + 1)).astype(np.int32)
+            csr = cls(
+                offsets, grafo.arestas_destino, grafo.arestas_comprimento, grafo.arestas_tempo,
+                versao=grafo.versao,
+            )
+        else:
+            csr = cls.de_arestas(
+                grafo.num_nos,
+                grafo.arestas_origem,
+                grafo.arestas_destino,
+                grafo.arestas_comprimento,
+                grafo.arestas_tempo,
+                versao=grafo.versao,
+            )
+        csr.nos_lat, csr.nos_lon = grafo.nos_lat, grafo.nos_lon
+        return csr
+
+    def _arrays(self, objetivo):
+        """
+        (pesos minimizados, pesos acumulados): comprimentos e tempos, na
+        ordem do objetivo
+        """
+        if objetivo == 'tempo':
+            return self.tempos, self.comprimentos
+        return self.comprimentos, self.tempos
+
+    def pesos(self, objetivo='distancia'):
+        """
+        (offsets, destinos, pesos minimizados, pesos acumulados) em listas
+        Python, para a construção da contraction hierarchy (laço nó a nó)
+        """
+        minimizados, acumulados = self._arrays(objetivo)
+        return self.offsets.tolist(), self.destinos.tolist(), minimizados.tolist(), acumulados.tolist()
+
+    def _matriz(self, objetivo):
+        """
+        Matriz esparsa (scipy) dos pesos minimizados. Os offsets e destinos
+        são os próprios arrays do CSR (mapeados em memória quando vêm do
+        GrafoStore); só os pesos são convertidos para float64, exigido pelo csgraph.
+        """
+        matriz = self._matrizes.get(objetivo)
+        if matriz is None:
+            pesos = np.asarray(self._arrays(objetivo)[0], dtype=np.float64)
+            matriz = csr_matrix((pesos, self.destinos, self.offsets), shape=(self.num_nos, self.num_nos))
+            self._matrizes[objetivo] = matriz
+        return matriz
+
+    def _buscar(self, origens, objetivo='distancia', limite=math.inf):
+        """
+        Dijkstra do scipy a partir das origens: (custos, predecessores), um
+        array de n nós por origem (predecessor negativo: origem ou inalcançável)
+        """
+        return csgraph_dijkstra(
+            self._matriz(objetivo), directed=True, indices=origens, return_predecessors=True, limit=limite,
+        )
+
+    def _limites(self, nos, objetivo='distancia'):
+        """
+        Custo máximo buscado a partir de cada nó até os demais: o de um
+        caminho de GRAFOS_CSR_LIMITE_FATOR vezes a maior distância em linha
+        reta (inf sem as coordenadas dos nós)
+        """
+        if self.nos_lat is None or self.nos_lon is None:
+            return np.full(len(nos), math.inf)
+        indices = np.asarray(nos, dtype=np.int64)
+        coordenadas = np.stack([np.asarray(self.nos_lat)[indices], np.asarray(self.nos_lon)[indices]], axis=1)
+        limites = GRAFOS_CSR_LIMITE_FATOR * matriz_haversine(coordenadas).max(axis=1)
+        if objetivo == 'tempo':
+            limites /= GRAFOS_CSR_LIMITE_VELOCIDADE_KMH / 3.6
+        return limites
+
+    def _acumular(self, predecessores, alvos, objetivo='distancia'):
+        """
+        Soma a métrica não minimizada ao longo dos caminhos da árvore de
+        predecessores de cada origem até cada alvo. Todos os caminhos são
+        percorridos juntos, um passo vetorizado por aresta; a aresta de cada
+        passo é a de menor peso entre as que ligam os dois nós.
+        """
+        minimizados, acumulados = self._arrays(objetivo)
+        predecessores = np.atleast_2d(predecessores)
+        alvos = np.asarray(alvos, dtype=np.int64)
+        linhas = np.repeat(np.arange(len(predecessores)), len(alvos))
+        atuais = np.tile(alvos, len(predecessores))
+        somas = np.zeros(len(linhas), dtype=np.float64)
+
+        ativos = np.arange(len(linhas))
+        posicoes = np.arange(int(np.diff(self.offsets).max(initial=0)))
+        while len(ativos):
+            anteriores = predecessores[linhas[ativos], atuais[ativos]].astype(np.int64)
+            seguem = anteriores >= 0
+            ativos, anteriores = ativos[seguem], anteriores[seguem]
+            if not len(ativos):
+                break
+            arestas = self.offsets[anteriores][:, None] + posicoes
+            validas = arestas < self.offsets[anteriores + 1][:, None]
+            arestas = np.where(validas, arestas, 0)
+            validas &= self.destinos[arestas] == atuais[ativos][:, None]
+            escolhidas = np.argmin(np.where(validas, minimizados[arestas], math.inf), axis=1)
+            somas[ativos] += acumulados[arestas[np.arange(len(arestas)), escolhidas]]
+            atuais[ativos] = anteriores
+        return somas.reshape(len(predecessores), len(alvos))
+
+    def dijkstra(self, origem, alvos=None, limite=math.inf, objetivo='distancia'):
+        """
+        Caminhos mínimos a partir de `origem`, minimizando a distância ou o
+        tempo (`objetivo`); a outra métrica é somada ao longo do mesmo
+        caminho, sem outra busca. Retorna {nó: (custo, outra métrica)} para
+        os alvos (ou todos os nós) alcançados com custo até `limite`.
+        """
+        custos, predecessores = self._buscar(origem, objetivo, limite)
+        alcancados = np.flatnonzero(np.isfinite(custos)) if alvos is None else np.asarray(list(alvos), dtype=np.int64)
+        alcancados = alcancados[np.isfinite(custos[alcancados])]
+        outras = self._acumular(predecessores, alcancados, objetivo)[0]
+        return dict(zip(alcancados.tolist(), zip(custos[alcancados].tolist(), outras.tolist())))
+
+    def distancia(self, origem, destino):
+        """
+        Distância do caminho mínimo entre dois nós (math.inf se inalcançável)
+        """
+        if origem == destino:
+            return 0.0
+        return float(self._buscar(origem)[0][destino])
+
+    def caminho(self, origem, destino, objetivo='distancia'):
+        """
+        Nós do caminho mínimo de `origem` a `destino` pelo objetivo
+        (None se inalcançável)
+        """
+        _, predecessores = self._buscar(origem, objetivo)
+        if origem != destino and predecessores[destino] < 0:
+            return None
+        nos = [destino]
+        while nos[-1] != origem:
+            nos.append(int(predecessores[nos[-1]]))
+        nos.reverse()
+        return nos
+
+    def matrizes(self, nos, linhas=None, objetivo='distancia'):
+        """
+        Matrizes de distâncias (m) e de tempos (s), assimétricas, entre os
+        nós informados: uma busca de origem única por nó (no código C do
+        scipy), em lotes de origens limitados por GRAFOS_CSR_LOTE. Cada
+        busca minimiza o objetivo e para quando passa do limite de _limites
+        da sua origem (os alvos ficam todos definidos antes disso, salvo em
+        desvios grandes); uma origem com algum alvo não alcançado é buscada
+        de novo sem limite. A outra métrica é somada pela árvore de
+        predecessores. Com `linhas`, apenas essas origens são calculadas.
+        Pares inalcançáveis (ou não calculados) ficam com math.inf.
+        Retorna (distancias, tempos).
+        """
+        n = len(nos)
+        distancias = np.full((n, n), math.inf, dtype=np.float64)
+        tempos = np.full((n, n), math.inf, dtype=np.float64)
+        linhas = list(range(n) if linhas is None else linhas)
+        alvos = np.asarray(nos, dtype=np.int64)
+        limites = self._limites(nos, objetivo)
+        lote = max(1, GRAFOS_CSR_LOTE // max(self.num_nos, 1))
+        for inicio in range(0, len(linhas), lote):
+            bloco = linhas[inicio:inicio + lote]
+            custos = np.empty((len(bloco), self.num_nos), dtype=np.float64)
+            predecessores = np.empty((len(bloco), self.num_nos), dtype=np.int32)
+            for k, i in enumerate(bloco):
+                custos[k], predecessores[k] = self._buscar(nos[i], objetivo, float(limites[i]))
+                if math.isfinite(limites[i]) and np.isinf(custos[k, alvos]).any():
+                    custos[k], predecessores[k] = self._buscar(nos[i], objetivo)
+            minimizados = custos[:, alvos]
+            outras = self._acumular(predecessores, alvos, objetivo)
+            outras[np.isinf(minimizados)] = math.inf
+            if objetivo == 'tempo':
+                tempos[bloco], distancias[bloco] = minimizados, outras
+            else:
+                distancias[bloco], tempos[bloco] = minimizados, outras
+        return distancias, tempos
+
+    def matriz_distancias(self, nos, linhas=None):
+        """
+        Só a matriz de distâncias (caminhos mínimos em metros)
+        """
+        return self.matrizes(nos, linhas)[0]
@@ -0,0 +1,403 @@
+# Armazenamento em disco dos grafos viários, compartilhado entre workers
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+import numpy as np
+
+from .velocidades import tempos_percurso, velocidade_via
+
+# Diretório dos grafos persistidos e validade (em dias) antes de novo download
+GRAFOS_DIR = os.getenv(
+    'GRAFOS_DIR',
+    str(Path(__file__).resolve().parent.parent / 'dados' / 'grafos')
+)
+GRAFOS_TTL_DIAS = float(os.getenv('GRAFOS_TTL_DIAS', '30'))
+
+ARRAYS_GRAFO = (
+    'nos_osm',
+    'nos_lat',
+    'nos_lon',
+    'arestas_origem',
+    'arestas_destino',
+    'arestas_comprimento',
+    'arestas_tempo',
+)
+
+# Arrays que podem faltar em grafos persistidos por versões anteriores
+ARRAYS_OPCIONAIS = ('arestas_tempo',)
+
+
+class GrafoCompacto:
+    """
+    Grafo viário em arrays NumPy:
+    nós (id OSM, lat, lon) e arestas (índice de origem, índice de destino,
+    comprimento em metros, tempo de percurso em segundos), ordenadas por
+    origem. Sem arestas_tempo, o tempo é o comprimento à velocidade padrão
+    (VELOCIDADE_PADRAO_KMH). Quando carregado do
+    GrafoStore, os arrays são mapeados em memória somente leitura, de forma
+    que todos os workers compartilham as mesmas páginas físicas.
+    """
+
+    def __init__(self, nos_osm, nos_lat, nos_lon, arestas_origem, arestas_destino,
+                 arestas_comprimento, arestas_tempo=None, meta=None):
+        self.nos_osm = nos_osm
+        self.nos_lat = nos_lat
+        self.nos_lon = nos_lon
+        self.arestas_origem = arestas_origem
+        self.arestas_destino = arestas_destino
+        self.arestas_comprimento = arestas_comprimento
+        if arestas_tempo is None:
+            arestas_tempo = tempos_percurso(arestas_comprimento)
+        self.arestas_tempo = arestas_tempo
+        self.meta = meta or {}
+
+    @property
+    def num_nos(self):
+        return len(self.nos_osm)
+
+    @property
+    def num_arestas(self):
+        return len(self.arestas_origem)
+
+    @property
+    def versao(self):
+        """Identificador do conteúdo do grafo (muda quando o grafo muda)"""
+        if 'versao' not in self.meta:
+            self.meta['versao'] = calcular_versao(self)
+        return self.meta['versao']
+
+    def indices(self, nos_osm):
+        """
+        Converte ids OSM em índices internos (os nós estão ordenados por id)
+        """
+        return np.searchsorted(self.nos_osm, np.asarray(nos_osm, dtype=np.int64)).tolist()
+
+    @classmethod
+    def de_networkx(cls, G, meta=None):
+        """
+        Converte um MultiDiGraph do OSMnx em arrays compactos.
+        Os nós ficam ordenados por id OSM e arestas paralelas são
+        reduzidas à de menor comprimento. O tempo de percurso é o
+        travel_time do OSMnx (ox.add_edge_travel_times) ou, sem ele, vem
+        do maxspeed / tipo de via.
+        """
+        nos_osm = np.sort(np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes()))
+        indice = {no: i for i, no in enumerate(nos_osm.tolist())}
+        nos_lat = np.array([G.nodes[no]['y'] for no in nos_osm.tolist()], dtype=np.float64)
+        nos_lon = np.array([G.nodes[no]['x'] for no in nos_osm.tolist()], dtype=np.float64)
+
+        menores = {}
+        for u, v, dados in G.edges(data=True):
+            par = (indice[u], indice[v])
+            comprimento = float(dados.get('length', 0.0))
+            if par not in menores or comprimento < menores[par][0]:
+                tempo = dados.get('travel_time')
+                if tempo is None:
+                    tempo = comprimento / (velocidade_via(dados.get('highway'), dados.get('maxspeed')) / 3.6)
+                menores[par] = (comprimento, float(tempo))
+
+        pares = sorted(menores)
+        arestas_origem = np.array([u for u, _ in pares], dtype=np.int32)
+        arestas_destino = np.array([v for _, v in pares], dtype=np.int32)
+        arestas_comprimento = np.array([menores[p][0] for p in pares], dtype=np.float32)
+        arestas_tempo = np.array([menores[p][1] for p in pares], dtype=np.float32)
+
+        return cls(nos_osm, nos_lat, nos_lon, arestas_origem, arestas_destino,
+                   arestas_comprimento, arestas_tempo, meta=dict(meta or {}))
+
+    def para_networkx(self):
+        """
+        Reconstrói um MultiDiGraph compatível com o OSMnx (atributos x, y,
+        length, travel_time)
+        """
+        import networkx as nx
+
+        G = nx.MultiDiGraph(crs='epsg:4326')
+        nos_osm = self.nos_osm.tolist()
+        G.add_nodes_from(
+            (no, {'x': lon, 'y': lat})
+            for no, lat, lon in zip(nos_osm, self.nos_lat.tolist(), self.nos_lon.tolist())
+        )
+        G.add_edges_from(
+            (nos_osm[u], nos_osm[v], {'length': comprimento, 'travel_time': tempo})
+            for u, v, comprimento, tempo in zip(
+                self.arestas_origem.tolist(),
+                self.arestas_destino.tolist(),
+                self.arestas_comprimento.tolist(),
+                self.arestas_tempo.tolist(),
+            )
+        )
+        return G
+
+
+def calcular_versao(grafo):
+    """
+    Hash curto do conteúdo do grafo (nós e arestas)
+    """
+    h = hashlib.sha1()
+    for nome in ('nos_osm', 'arestas_origem', 'arestas_destino', 'arestas_comprimento', 'arestas_tempo'):
+        h.update(np.ascontiguousarray(getattr(grafo, nome)).tobytes())
+    return h.hexdigest()[:16]
+
+
+class GrafoStore:
+    """
+    Armazena cada região como um diretório de arquivos .npy (um por array)
+    mais um meta.json. Cada gravação cria um diretório de versão
+    (.{chave}.v-...) e `chave` é um link simbólico para a versão atual,
+    trocado de forma atômica (os.replace); a leitura usa mmap somente leitura.
+    """
+
+    def __init__(self, diretorio=GRAFOS_DIR, ttl_dias=GRAFOS_TTL_DIAS):
+        self.diretorio = Path(diretorio)
+        self.ttl = ttl_dias * 24 * 60 * 60
+        self._carregados = {}
+        self._lock = threading.Lock()
+
+    def _caminho(self, chave):
+        return self.diretorio / chave
+
+    def _versao_atual(self, chave):
+        """
+        Diretório da versão atual da região (o destino do link; em
+        armazenamentos gravados antes das versões, o próprio diretório)
+        """
+        return self._caminho(chave).resolve()
+
+    @contextmanager
+    def trava(self, nome):
+        """
+        Trava exclusiva entre processos (flock em .{nome}.lock no diretório
+        do armazenamento); sem fcntl, só entre threads deste processo
+        """
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            with self._lock:
+                yield
+            return
+        with open(self.diretorio / f".{nome}.lock", 'a') as arquivo:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+    def existe(self, chave):
+        meta = self._caminho(chave) / 'meta.json'
+        if not meta.exists():
+            return False
+        if time.time() - meta.stat().st_mtime < self.ttl:
+            return True
+        # Grafos importados de extratos locais (meta 'expira': false) não expiram
+        try:
+            with open(meta, encoding='utf-8') as arquivo:
+                return json.load(arquivo).get('expira', True) is False
+        except (OSError, ValueError):
+            return False
+
+    def salvar(self, chave, grafo):
+        """
+        Persiste o grafo em disco de forma atômica: os arquivos vão para um
+        novo diretório de versão e o link `chave` passa a apontar para ele
+        com os.replace, sem intervalo em que a região fica ausente. A troca
+        é feita sob a trava da região, então gravações simultâneas não
+        falham: vale a última.
+        """
+        grafo.meta['chave'] = chave
+        grafo.meta.setdefault('criado_em', time.time())
+        grafo.meta['versao'] = grafo.versao
+        grafo.meta['num_nos'] = grafo.num_nos
+        grafo.meta['num_arestas'] = grafo.num_arestas
+
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        sufixo = f"{os.getpid()}-{threading.get_ident()}-{time.time_ns()}"
+        temporario = self.diretorio / f".{chave}.tmp-{sufixo}"
+        temporario.mkdir()
+        try:
+            for nome in ARRAYS_GRAFO:
+                np.save(temporario / f"{nome}.npy", np.ascontiguousarray(getattr(grafo, nome)))
+            with open(temporario / 'meta.json', 'w', encoding='utf-8') as arquivo:
+                json.dump(grafo.meta, arquivo)
+        except BaseException:
+            shutil.rmtree(temporario, ignore_errors=True)
+            raise
+
+        destino = self._caminho(chave)
+        with self.trava(chave):
+            versao = self.diretorio / f".{chave}.v-{sufixo}"
+            os.rename(temporario, versao)
+            if destino.exists() and not destino.is_symlink():
+                # Diretório gravado antes das versões: vira uma versão comum
+                os.rename(destino, self.diretorio / f".{chave}.v-legado-{sufixo}")
+            link = self.diretorio / f".{chave}.link-{sufixo}"
+            os.symlink(versao.name, link)
+            os.replace(link, destino)
+            # Versões anteriores: leitores que já mapearam os arquivos
+            # continuam com eles (o conteúdo só é liberado quando desmapeado)
+            for anterior in self.diretorio.glob(f".{chave}.v-*"):
+                if anterior != versao:
+                    shutil.rmtree(anterior, ignore_errors=True)
+
+        with self._lock:
+            self._carregados.pop(chave, None)
+
+    def carregar(self, chave):
+        """
+        Carrega o grafo mapeando os arrays em memória (somente leitura).
+        Retorna None se a região não estiver no disco ou estiver expirada.
+        """
+        with self._lock:
+            grafo = self._carregados.get(chave)
+        if grafo is not None:
+            return grafo
+
+        if not self.existe(chave):
+            return None
+
+        # Todos os arquivos são lidos da mesma versão; se ela for trocada
+        # (e removida) durante a leitura, lê a nova
+        for tentativa in range(3):
+            caminho = self._versao_atual(chave)
+            try:
+                with open(caminho / 'meta.json', encoding='utf-8') as arquivo:
+                    meta = json.load(arquivo)
+                arrays = {
+                    nome: np.load(caminho / f"{nome}.npy", mmap_mode='r')
+                    for nome in ARRAYS_GRAFO
+                    if nome not in ARRAYS_OPCIONAIS or (caminho / f"{nome}.npy").exists()
+                }
+                break
+            except (OSError, ValueError) as e:
+                if tentativa < 2 and self._versao_atual(chave) != caminho:
+                    continue
+                print(f"Erro ao carregar grafo '{chave}' do disco: {e}")
+                return None
+
+        grafo = GrafoCompacto(meta=meta, **arrays)
+        with self._lock:
+            self._carregados[chave] = grafo
+        return grafo
+
+    def salvar_arrays(self, chave, prefixo, arrays, meta=None):
+        """
+        Persiste arrays auxiliares de uma região (ex.: índices derivados do
+        grafo) no diretório da versão atual, como {prefixo}_{nome}.npy +
+        {prefixo}.json; uma nova versão da região não herda esses arrays
+        """
+        caminho = self._versao_atual(chave)
+        if not caminho.exists():
+            raise FileNotFoundError(f"Região '{chave}' não está no armazenamento")
+        sufixo = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        for nome, array in arrays.items():
+            temporario = caminho / f"{prefixo}_{nome}{sufixo}.npy"
+            np.save(temporario, np.ascontiguousarray(array))
+            os.replace(temporario, caminho / f"{prefixo}_{nome}.npy")
+        temporario = caminho / f"{prefixo}{sufixo}.json"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(meta or {}, arquivo)
+        os.replace(temporario, caminho / f"{prefixo}.json")
+
+    def carregar_arrays(self, chave, prefixo, nomes):
+        """
+        Carrega arrays auxiliares de uma região (mmap somente leitura).
+        Retorna (arrays, meta) ou None se não existirem.
+        """
+        caminho = self._versao_atual(chave)
+        if not (caminho / f"{prefixo}.json").exists():
+            return None
+        try:
+            with open(caminho / f"{prefixo}.json", encoding='utf-8') as arquivo:
+                meta = json.load(arquivo)
+            arrays = {
+                nome: np.load(caminho / f"{prefixo}_{nome}.npy", mmap_mode='r')
+                for nome in nomes
+            }
+        except (OSError, ValueError) as e:
+            print(f"Erro ao carregar '{prefixo}' da região '{chave}': {e}")
+            return None
+        return arrays, meta
+
+    def remover(self, chave):
+        """
+        Remove a região do disco (link e versões). Leitores que já mapearam
+        os arquivos continuam com eles até desmapeá-los.
+        """
+        destino = self._caminho(chave)
+        with self.trava(chave):
+            if destino.is_symlink():
+                destino.unlink()
+            elif destino.exists():
+                shutil.rmtree(destino, ignore_errors=True)
+            for versao in self.diretorio.glob(f".{chave}.v-*"):
+                shutil.rmtree(versao, ignore_errors=True)
+        with self._lock:
+            self._carregados.pop(chave, None)
+
+    def marcar_uso(self, chave):
+        """
+        Registra o uso da região no mtime do diretório da versão (o meta.json,
+        que conta a validade, não é tocado)
+        """
+        try:
+            os.utime(self._versao_atual(chave))
+        except OSError:
+            pass
+
+    def ultimo_uso(self, chave):
+        """Momento do último uso (ou gravação) da região; 0 se não existir"""
+        try:
+            return self._versao_atual(chave).stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def chaves(self):
+        """Lista as regiões persistidas"""
+        if not self.diretorio.exists():
+            return []
+        return sorted(
+            p.name for p in self.diretorio.iterdir()
+            if p.is_dir() and not p.name.startswith('.')
+        )
+
+    def versoes(self):
+        """
+        Versão atual de cada região persistida e não expirada ({chave: versão}),
+        lida do meta.json sem carregar os arrays
+        """
+        versoes = {}
+        for chave in self.chaves():
+            if not self.existe(chave):
+                continue
+            try:
+                with open(self._caminho(chave) / 'meta.json', encoding='utf-8') as arquivo:
+                    versao = json.load(arquivo).get('versao')
+            except (OSError, ValueError):
+                continue
+            if versao:
+                versoes[chave] = versao
+        return versoes
+
+
+# Instância compartilhada
+_grafo_store = None
+_grafo_store_lock = threading.Lock()
+
+
+def get_grafo_store():
+    """Retorna instância singleton do armazenamento de grafos"""
+    global _grafo_store
+    with _grafo_store_lock:
+        if _grafo_store is None:
+            _grafo_store = GrafoStore()
+    return _grafo_store
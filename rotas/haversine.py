@@ -0,0 +1,36 @@
+# Distâncias em linha reta (haversine) vetorizadas com NumPy
+import numpy as np
+
+RAIO_TERRA_M = 6371000.0
+
+
+def _radianos(coordenadas):
+    """
+    Converte uma sequência de (lat, lon) em graus para arrays de lat e lon em radianos
+    """
+    arr = np.radians(np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2))
+    return arr[:, 0], arr[:, 1]
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def matriz_haversine(coordenadas):
+    """
+    Matriz n x n de distâncias em metros, calculada em um único broadcast
+    """
+    lat, lon = _radianos(coordenadas)
+    return _haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def distancias_pares(origens, destinos):
+    """
+    Distâncias em metros entre origens[i] e destinos[i]
+    """
+    lat1, lon1 = _radianos(origens)
+    lat2, lon2 = _radianos(destinos)
+    return _haversine(lat1, lon1, lat2, lon2)
+
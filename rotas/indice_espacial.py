@@ -0,0 +1,175 @@
+# Índice espacial em grade uniforme para associar coordenadas aos nós do grafo
+import math
+import os
+
+import numpy as np
+
+from .haversine import RAIO_TERRA_M, distancias_pares
+
+# Quantidade média de nós por célula usada para dimensionar a grade
+NOS_POR_CELULA = int(os.getenv('INDICE_ESPACIAL_NOS_POR_CELULA', '16'))
+
+PREFIXO = 'indice'
+ARRAYS_INDICE = ('celulas_offsets', 'celulas_nos')
+
+
+class IndiceEspacial:
+    """
+    Grade uniforme sobre os nós de um GrafoCompacto, em uma projeção
+    equiretangular (metros) centrada na região.
+
+    Os nós ficam agrupados por célula em `celulas_nos`; os nós da célula c
+    estão em celulas_nos[celulas_offsets[c]:celulas_offsets[c+1]]. A consulta
+    examina anéis de células ao redor de cada ponto até que o nó mais
+    próximo encontrado esteja garantidamente mais perto que qualquer nó de
+    fora do anel, então o custo não depende do tamanho do grafo.
+    """
+
+    def __init__(self, nos_lat, nos_lon, celulas_offsets, celulas_nos, meta, versao=None):
+        self.nos_lat = nos_lat
+        self.nos_lon = nos_lon
+        self.celulas_offsets = celulas_offsets
+        self.celulas_nos = celulas_nos
+        self.meta = meta
+        self.versao = versao
+        self._cos_lat = math.cos(math.radians(meta['lat_ref']))
+
+    @property
+    def num_celulas(self):
+        return len(self.celulas_offsets) - 1
+
+    @staticmethod
+    def _projetar(lat, lon, cos_lat):
+        """Projeção equiretangular em metros"""
+        return (
+            np.radians(np.asarray(lon, dtype=np.float64)) * cos_lat * RAIO_TERRA_M,
+            np.radians(np.asarray(lat, dtype=np.float64)) * RAIO_TERRA_M,
+        )
+
+    @classmethod
+    def construir(cls, grafo, nos_por_celula=NOS_POR_CELULA):
+        """
+        Monta a grade a partir dos arrays de nós de um GrafoCompacto
+        """
+        lat_ref = float(np.mean(grafo.nos_lat)) if grafo.num_nos else 0.0
+        cos_lat = math.cos(math.radians(lat_ref))
+        x, y = cls._projetar(grafo.nos_lat, grafo.nos_lon, cos_lat)
+
+        x_min, y_min = float(x.min()), float(y.min())
+        largura = max(float(x.max()) - x_min, 1.0)
+        altura = max(float(y.max()) - y_min, 1.0)
+        # Células quadradas com ~nos_por_celula nós em média
+        tamanho = max(math.sqrt(largura * altura * nos_por_celula / max(grafo.num_nos, 1)), 1.0)
+        colunas = int(largura // tamanho) + 1
+        linhas = int(altura // tamanho) + 1
+
+        celula = ((y - y_min) // tamanho).astype(np.int64) * colunas + ((x - x_min) // tamanho).astype(np.int64)
+        celulas_nos = np.argsort(celula, kind='stable').astype(np.int32)
+        offsets = np.zeros(linhas * colunas + 1, dtype=np.int32)
+        np.cumsum(np.bincount(celula, minlength=linhas * colunas), out=offsets[1:])
+
+        meta = {
+            'lat_ref': lat_ref,
+            'x_min': x_min,
+            'y_min': y_min,
+            'tamanho_m': tamanho,
+            'colunas': colunas,
+            'linhas': linhas,
+        }
+        return cls(grafo.nos_lat, grafo.nos_lon, offsets, celulas_nos, meta, versao=grafo.versao)
+
+    def _candidatos(self, cx, cy, anel):
+        """
+        Nós das células do anel `anel` (borda do quadrado de lado 2*anel+1)
+        ao redor da célula (cx, cy)
+        """
+        colunas, linhas = self.meta['colunas'], self.meta['linhas']
+        if anel == 0:
+            celulas = [(cx, cy)]
+        else:
+            celulas = [(cx + dx, cy + d) for d in (-anel, anel) for dx in range(-anel, anel + 1)]
+            celulas += [(cx + d, cy + dy) for d in (-anel, anel) for dy in range(-anel + 1, anel)]
+        offsets = self.celulas_offsets
+        partes = [
+            self.celulas_nos[offsets[c]:offsets[c + 1]]
+            for c in (y * colunas + x for x, y in celulas if 0 <= x < colunas and 0 <= y < linhas)
+        ]
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int32)
+
+    def mais_proximos(self, coordenadas):
+        """
+        Associa cada (lat, lon) ao nó mais próximo do grafo em uma consulta em lote.
+        Retorna (índices dos nós, distâncias em metros), ambos arrays NumPy.
+        """
+        coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+        n = len(coordenadas)
+        meta = self.meta
+        tamanho = meta['tamanho_m']
+        x, y = self._projetar(coordenadas[:, 0], coordenadas[:, 1], self._cos_lat)
+        gx = (x - meta['x_min']) / tamanho
+        gy = (y - meta['y_min']) / tamanho
+        # Pontos fora da grade começam pela célula de borda mais próxima
+        cx = np.clip(np.floor(gx), 0, meta['colunas'] - 1).astype(np.int64)
+        cy = np.clip(np.floor(gy), 0, meta['linhas'] - 1).astype(np.int64)
+        # Distância do ponto até a célula inicial (zero se estiver dentro da grade)
+        fora = np.hypot(np.maximum(np.abs(gx - cx - 0.5) - 0.5, 0.0),
+                        np.maximum(np.abs(gy - cy - 0.5) - 0.5, 0.0)) * tamanho
+
+        melhores = np.full(n, -1, dtype=np.int64)
+        distancias = np.full(n, np.inf)
+        pendentes = np.arange(n)
+        anel = 0
+        max_anel = max(meta['colunas'], meta['linhas'])
+
+        while len(pendentes) and anel <= max_anel:
+            candidatos = [self._candidatos(cx[i], cy[i], anel) for i in pendentes]
+            tamanhos = np.array([len(c) for c in candidatos])
+            com_candidatos = tamanhos > 0
+            if com_candidatos.any():
+                # Todas as distâncias do anel, de todas as paradas, em um único cálculo
+                todos = np.concatenate(candidatos).astype(np.int64)
+                dono = np.repeat(pendentes, tamanhos)
+                d = distancias_pares(
+                    coordenadas[dono],
+                    np.column_stack([self.nos_lat[todos], self.nos_lon[todos]]),
+                )
+                inicios = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])[com_candidatos]
+                minimos = np.minimum.reduceat(d, inicios)
+                posicoes = inicios + np.array([
+                    np.argmin(d[inicio:inicio + t])
+                    for inicio, t in zip(inicios, tamanhos[com_candidatos])
+                ])
+                alvo = pendentes[com_candidatos]
+                melhorou = minimos < distancias[alvo]
+                distancias[alvo[melhorou]] = minimos[melhorou]
+                melhores[alvo[melhorou]] = todos[posicoes[melhorou]]
+
+            # Qualquer nó fora dos anéis já vistos está a pelo menos (anel * tamanho) de distância
+            garantido = distancias[pendentes] <= np.maximum(fora[pendentes], anel * tamanho)
+            pendentes = pendentes[~garantido]
+            anel += 1
+
+        return melhores, distancias
+
+    def arrays(self):
+        """Arrays para persistência no GrafoStore"""
+        return {'celulas_offsets': self.celulas_offsets, 'celulas_nos': self.celulas_nos}
+
+    def salvar(self, store, chave):
+        """Persiste o índice junto do grafo da região"""
+        store.salvar_arrays(chave, PREFIXO, self.arrays(), dict(self.meta, versao=self.versao))
+
+    @classmethod
+    def carregar(cls, store, chave, grafo):
+        """
+        Carrega o índice persistido (mapeado em memória), ou None se não
+        existir ou tiver sido gerado para outra versão do grafo
+        """
+        dados = store.carregar_arrays(chave, PREFIXO, ARRAYS_INDICE)
+        if dados is None:
+            return None
+        arrays, meta = dados
+        if meta.pop('versao', None) != grafo.versao:
+            return None
+        return cls(grafo.nos_lat, grafo.nos_lon, arrays['celulas_offsets'], arrays['celulas_nos'],
+                   meta, versao=grafo.versao)
@@ -0,0 +1,270 @@
+# Fila de jobs de otimização de rotas no banco de dados, com pool de workers
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from produtos.models import MovimentacaoEstoque
+from .models import RotaJob, Veiculo
+from .pedidos import (
+    baixar_estoque,
+    criar_rota,
+    devolver_estoque,
+    montar_enderecos,
+    observacao_saida,
+)
+
+# Threads que processam jobs dentro de cada processo web
+ROTAS_JOBS_WORKERS = int(os.getenv('ROTAS_JOBS_WORKERS', '2'))
+
+# Com false, os jobs ficam só na fila e são executados pelo comando processar_rotas
+ROTAS_JOBS_NO_PROCESSO = os.getenv('ROTAS_JOBS_NO_PROCESSO', 'true').lower() == 'true'
+
+# Jobs "processando" há mais tempo que isso são considerados abandonados
+# (worker reiniciado no meio da otimização) e voltam para a fila
+ROTAS_JOBS_TIMEOUT_MINUTOS = float(os.getenv('ROTAS_JOBS_TIMEOUT_MINUTOS', '15'))
+ROTAS_JOBS_MAX_TENTATIVAS = int(os.getenv('ROTAS_JOBS_MAX_TENTATIVAS', '2'))
+
+# Intervalo (s) em que cada processo web consulta a fila mesmo sem jobs
+# novos, retomando os pendentes e abandonados após um reinício (0 desliga)
+ROTAS_JOBS_INTERVALO_S = float(os.getenv('ROTAS_JOBS_INTERVALO_S', '60'))
+
+
+def enfileirar_job(usuario, dados, veiculo, produtos_validados):
+    """
+    Cria o job e reserva o estoque na mesma transação. O processamento é
+    disparado após o commit (quando ROTAS_JOBS_NO_PROCESSO está ativo).
+    """
+    with transaction.atomic():
+        job = RotaJob.objects.create(
+            usuario=usuario,
+            parametros={
+                'enderecos': montar_enderecos(usuario, dados),
+                'veiculo_id': veiculo.id if veiculo else None,
+                'nome_motorista': dados.get('nome_motorista', ''),
+                'preco_combustivel': (
+                    str(dados['preco_combustivel']) if dados.get('preco_combustivel') is not None else None
+                ),
+                'produtos_quantidades': dados['produtos_quantidades'],
+                'max_ms': dados.get('max_ms'),
+            },
+        )
+        movimentacoes = baixar_estoque(usuario, produtos_validados, f'Reserva para o job de rota {job.id}')
+        job.parametros['reservas'] = [
+            {
+                'produto_id': movimentacao.produto_id,
+                'quantidade': movimentacao.quantidade,
+                'movimentacao_id': movimentacao.id,
+            }
+            for movimentacao in movimentacoes
+        ]
+        job.save(update_fields=['parametros'])
+
+        if ROTAS_JOBS_NO_PROCESSO:
+            transaction.on_commit(get_fila_jobs().notificar)
+    return job
+
+
+def recuperar_abandonados():
+    """
+    Devolve à fila (ou marca como erro, após ROTAS_JOBS_MAX_TENTATIVAS)
+    os jobs presos em "processando"
+    """
+    limite = timezone.now() - timedelta(minutes=ROTAS_JOBS_TIMEOUT_MINUTOS)
+    abandonados = RotaJob.objects.filter(status='processando', data_inicio__lt=limite)
+    abandonados.filter(tentativas__lt=ROTAS_JOBS_MAX_TENTATIVAS).update(status='pendente', data_inicio=None)
+    for job in abandonados.filter(tentativas__gte=ROTAS_JOBS_MAX_TENTATIVAS):
+        falhar_job(job, 'Tempo limite de processamento excedido')
+
+
+def reivindicar_proximo():
+    """
+    Retira o job pendente mais antigo da fila e o marca como "processando".
+    Em bancos com SKIP LOCKED, vários workers consultam a fila sem disputar
+    a mesma linha; a atualização condicional garante que cada job seja
+    reivindicado uma única vez em qualquer banco.
+    """
+    while True:
+        with transaction.atomic():
+            fila = RotaJob.objects.filter(status='pendente').order_by('data_criacao')
+            if connection.features.has_select_for_update_skip_locked:
+                fila = fila.select_for_update(skip_locked=True)
+            job = fila.first()
+            if job is None:
+                return None
+            reivindicado = RotaJob.objects.filter(id=job.id, status='pendente').update(
+                status='processando',
+                data_inicio=timezone.now(),
+                tentativas=F('tentativas') + 1,
+            )
+        if reivindicado:
+            job.refresh_from_db()
+            return job
+
+
+def falhar_job(job, mensagem):
+    """
+    Marca o job como erro e devolve o estoque reservado
+    """
+    with transaction.atomic():
+        atualizado = RotaJob.objects.filter(id=job.id).exclude(status__in=['concluido', 'erro']).update(
+            status='erro',
+            erro=mensagem,
+            data_conclusao=timezone.now(),
+        )
+        if atualizado:
+            devolver_estoque(
+                job.usuario,
+                job.parametros.get('reservas', []),
+                f'Estorno da reserva do job de rota {job.id}',
+            )
+
+
+def processar_job(job, motor):
+    """
+    Executa a otimização de um job reivindicado e cria a Rota
+    """
+    parametros = job.parametros
+    try:
+        veiculo = None
+        if parametros.get('veiculo_id'):
+            veiculo = Veiculo.objects.filter(id=parametros['veiculo_id'], usuario=job.usuario).first()
+        preco_combustivel = parametros.get('preco_combustivel')
+        if preco_combustivel is not None:
+            preco_combustivel = Decimal(preco_combustivel)
+
+        inicio = time.time()
+        resultado = motor.otimizar_rota(
+            parametros['enderecos'], veiculo, parametros['produtos_quantidades'], preco_combustivel,
+            max_ms=parametros.get('max_ms'), aguardar_vaga=True, usuario=job.usuario
+        )
+        if not resultado['sucesso']:
+            falhar_job(job, f'Erro na otimização da rota: {resultado.get("erro", "Erro desconhecido")}')
+            return
+
+        with transaction.atomic():
+            rota = criar_rota(
+                job.usuario, resultado, veiculo,
+                parametros.get('nome_motorista'), parametros['produtos_quantidades']
+            )
+            # A reserva passa a ser a saída de estoque da rota
+            MovimentacaoEstoque.objects.filter(
+                id__in=[reserva['movimentacao_id'] for reserva in parametros.get('reservas', [])]
+            ).update(observacao=observacao_saida(rota))
+            RotaJob.objects.filter(id=job.id).update(
+                status='concluido',
+                rota=rota,
+                data_conclusao=timezone.now(),
+            )
+        print(f"✅ Job de rota {job.id} concluído em {time.time() - inicio:.1f}s (rota {rota.id})")
+    except Exception as e:
+        print(f"Erro ao processar job de rota {job.id}: {e}")
+        falhar_job(job, f'Erro na otimização da rota: {str(e)}')
+
+
+def processar_pendentes(motor, limite=None):
+    """
+    Processa jobs da fila até esvaziá-la (ou até `limite` jobs).
+    Retorna a quantidade processada.
+    """
+    processados = 0
+    recuperar_abandonados()
+    while limite is None or processados < limite:
+        job = reivindicar_proximo()
+        if job is None:
+            break
+        processar_job(job, motor)
+        processados += 1
+    return processados
+
+
+class FilaJobs:
+    """
+    Pool de threads que consome a fila de jobs dentro do processo web.
+    Cada notificação garante que haja uma thread drenando a fila, até
+    `workers` threads simultâneas; uma thread só termina quando não chegou
+    nenhuma notificação desde a última vez em que esvaziou a fila. Uma
+    thread de verificação notifica a fila a cada `intervalo` segundos, para
+    que jobs que ficaram pendentes ou abandonados (worker reiniciado) sejam
+    retomados sem esperar o próximo job enfileirado.
+    """
+
+    def __init__(self, workers=ROTAS_JOBS_WORKERS, intervalo=ROTAS_JOBS_INTERVALO_S):
+        self.workers = workers
+        self.intervalo = intervalo
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rotas-jobs')
+        self._ativos = 0
+        self._notificado = False
+        self._lock = threading.Lock()
+        self._verificacao = None
+        self._parar = threading.Event()
+
+    def iniciar_verificacao(self):
+        """
+        Inicia (ou reinicia, após um fork) a thread de verificação periódica
+        """
+        if self.intervalo <= 0:
+            return
+        with self._lock:
+            if self._verificacao is not None and self._verificacao.is_alive():
+                return
+            self._parar.clear()
+            self._verificacao = threading.Thread(target=self._verificar, name='rotas-jobs-verificacao', daemon=True)
+            self._verificacao.start()
+
+    def parar_verificacao(self):
+        self._parar.set()
+
+    def _verificar(self):
+        while True:
+            self.notificar()
+            if self._parar.wait(self.intervalo):
+                return
+
+    def notificar(self):
+        with self._lock:
+            self._notificado = True
+            if self._ativos >= self.workers:
+                return
+            self._ativos += 1
+        self._executor.submit(self._drenar)
+
+    def _drenar(self):
+        from .motor import get_motor_rotas
+
+        try:
+            while True:
+                with self._lock:
+                    self._notificado = False
+                close_old_connections()
+                try:
+                    processar_pendentes(get_motor_rotas())
+                except Exception as e:
+                    print(f"Erro no worker de jobs de rota: {e}")
+                with self._lock:
+                    if not self._notificado:
+                        self._ativos -= 1
+                        return
+        finally:
+            connection.close()
+
+
+# Instância compartilhada
+_fila_jobs = None
+_fila_jobs_lock = threading.Lock()
+
+
+def get_fila_jobs():
+    """Retorna instância singleton do pool de workers de jobs"""
+    global _fila_jobs
+    with _fila_jobs_lock:
+        if _fila_jobs is None:
+            _fila_jobs = FilaJobs()
+    _fila_jobs.iniciar_verificacao()
+    return _fila_jobs
@@ -0,0 +1,314 @@
+# Grafos viários por ladrilhos de grade fixa, baixados sob demanda e unidos por região
+import math
+import os
+import threading
+
+import numpy as np
+
+from .grafos import GrafoCompacto
+
+# Lado do ladrilho em graus (0.05° ≈ 5.5 km) e margem em torno das paradas
+GRAFOS_LADRILHO_GRAUS = float(os.getenv('GRAFOS_LADRILHO_GRAUS', '0.05'))
+GRAFOS_LADRILHOS_MARGEM_GRAUS = float(os.getenv('GRAFOS_LADRILHOS_MARGEM_GRAUS', '0.01'))
+
+# Rotas que precisariam de mais ladrilhos que isso usam distância em linha reta
+GRAFOS_LADRILHOS_MAX = int(os.getenv('GRAFOS_LADRILHOS_MAX', '49'))
+
+# Uma região já unida que contém a faixa pedida é reaproveitada se não tiver
+# mais que este múltiplo de ladrilhos; acima de GRAFOS_REGIOES_MAX regiões
+# unidas no disco, as usadas há mais tempo são removidas
+GRAFOS_REGIAO_REUSO_FATOR = float(os.getenv('GRAFOS_REGIAO_REUSO_FATOR', '4'))
+GRAFOS_REGIOES_MAX = int(os.getenv('GRAFOS_REGIOES_MAX', '64'))
+
+# Com false, ladrilhos ausentes do disco não são baixados (grafos só de extratos
+# importados com importar_osm) e as paradas fora deles usam linha reta
+GRAFOS_DOWNLOAD = os.getenv('GRAFOS_DOWNLOAD', 'true').lower() == 'true'
+
+PREFIXO_LADRILHO = 'ladrilho_'
+PREFIXO_REGIAO = 'ladrilhos_'
+
+# Um lock por ladrilho: threads que precisam do mesmo ladrilho esperam um único download
+_locks_ladrilhos = {}
+_locks_ladrilhos_lock = threading.Lock()
+
+
+def _lock_ladrilho(chave):
+    with _locks_ladrilhos_lock:
+        return _locks_ladrilhos.setdefault(chave, threading.Lock())
+
+
+def faixa_ladrilhos(coordenadas, margem=GRAFOS_LADRILHOS_MARGEM_GRAUS, lado=GRAFOS_LADRILHO_GRAUS):
+    """
+    Intervalo de ladrilhos (i0, j0, i1, j1), inclusive, que cobre a caixa
+    delimitadora das coordenadas mais a margem (i: latitude, j: longitude)
+    """
+    lats = [lat for lat, lon in coordenadas]
+    lons = [lon for lat, lon in coordenadas]
+    return (
+        math.floor((min(lats) - margem) / lado),
+        math.floor((min(lons) - margem) / lado),
+        math.floor((max(lats) + margem) / lado),
+        math.floor((max(lons) + margem) / lado),
+    )
+
+
+def ladrilhos_da_faixa(faixa):
+    i0, j0, i1, j1 = faixa
+    return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+
+def chave_ladrilho(i, j):
+    return f"{PREFIXO_LADRILHO}{i}_{j}"
+
+
+def chave_regiao(faixa):
+    return PREFIXO_REGIAO + '_'.join(str(valor) for valor in faixa)
+
+
+def faixa_da_chave(chave):
+    """Faixa (i0, j0, i1, j1) de uma chave de região, ou None"""
+    if not chave.startswith(PREFIXO_REGIAO):
+        return None
+    try:
+        faixa = tuple(int(valor) for valor in chave[len(PREFIXO_REGIAO):].split('_'))
+    except ValueError:
+        return None
+    return faixa if len(faixa) == 4 else None
+
+
+def contem_faixa(externa, interna):
+    return (externa[0] <= interna[0] and externa[1] <= interna[1]
+            and externa[2] >= interna[2] and externa[3] >= interna[3])
+
+
+def limites_ladrilho(i, j, lado=GRAFOS_LADRILHO_GRAUS):
+    """(sul, oeste, norte, leste) do ladrilho em graus"""
+    return i * lado, j * lado, (i + 1) * lado, (j + 1) * lado
+
+
+def grafo_vazio(meta=None):
+    return GrafoCompacto(
+        np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64),
+        np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32),
+        np.empty(0, dtype=np.float32), meta=dict(meta or {}),
+    )
+
+
+def baixar_ladrilho(i, j):
+    """
+    Baixa do OpenStreetMap as vias do ladrilho. As arestas que cruzam a
+    borda são mantidas, para que ladrilhos vizinhos compartilhem os mesmos
+    nós OSM e possam ser unidos. O grafo não é simplificado: os nós
+    intermediários das vias são os pontos de união nas bordas, o traçado
+    da geometria das rotas (o GrafoCompacto não guarda a geometria das
+    arestas) e os pontos de snap das paradas.
+    """
+    import osmnx as ox
+
+    sul, oeste, norte, leste = limites_ladrilho(i, j)
+    meta = {'ladrilho': [i, j], 'limites': [sul, oeste, norte, leste]}
+    try:
+        if int(ox.__version__.split('.')[0]) >= 2:
+            G = ox.graph_from_bbox(
+                (oeste, sul, leste, norte), network_type='drive',
+                simplify=False, retain_all=True, truncate_by_edge=True
+            )
+        else:
+            G = ox.graph_from_bbox(
+                norte, sul, leste, oeste, network_type='drive',
+                simplify=False, retain_all=True, truncate_by_edge=True
+            )
+    except ValueError as e:
+        # Ladrilho sem vias (mar, área rural; o OSMnx levanta InsufficientResponseError,
+        # subclasse de ValueError): fica salvo vazio para não baixar de novo
+        print(f"Ladrilho {i},{j} sem vias: {e}")
+        return grafo_vazio(meta)
+    return GrafoCompacto.de_networkx(G, meta=meta)
+
+
+def unir_ladrilhos(grafos, meta=None):
+    """
+    Une grafos de ladrilhos em um único grafo roteável: nós repetidos
+    (mesmo id OSM, nas bordas) viram um só e arestas repetidas ficam com
+    o menor comprimento (e o tempo de percurso dessa aresta)
+    """
+    grafos = [grafo for grafo in grafos if grafo.num_nos]
+    if not grafos:
+        return grafo_vazio(meta)
+
+    todos_osm = np.concatenate([grafo.nos_osm for grafo in grafos])
+    nos_osm, primeiro = np.unique(todos_osm, return_index=True)
+    nos_lat = np.concatenate([grafo.nos_lat for grafo in grafos])[primeiro]
+    nos_lon = np.concatenate([grafo.nos_lon for grafo in grafos])[primeiro]
+
+    # Arestas de cada ladrilho reindexadas pelos ids OSM no grafo unido
+    origem = np.concatenate([
+        np.searchsorted(nos_osm, np.asarray(grafo.nos_osm)[grafo.arestas_origem]) for grafo in grafos
+    ])
+    destino = np.concatenate([
+        np.searchsorted(nos_osm, np.asarray(grafo.nos_osm)[grafo.arestas_destino]) for grafo in grafos
+    ])
+    comprimento = np.concatenate([grafo.arestas_comprimento for grafo in grafos])
+    tempo = np.concatenate([grafo.arestas_tempo for grafo in grafos])
+
+    # Ordena por (origem, destino, comprimento) e mantém a primeira de cada par
+    ordem = np.lexsort((comprimento, destino, origem))
+    origem, destino, comprimento, tempo = origem[ordem], destino[ordem], comprimento[ordem], tempo[ordem]
+    unicas = np.ones(len(origem), dtype=bool)
+    unicas[1:] = (origem[1:] != origem[:-1]) | (destino[1:] != destino[:-1])
+
+    return GrafoCompacto(
+        nos_osm, nos_lat, nos_lon,
+        origem[unicas].astype(np.int32), destino[unicas].astype(np.int32),
+        comprimento[unicas].astype(np.float32), tempo[unicas].astype(np.float32),
+        meta=dict(meta or {}),
+    )
+
+
+def dividir_em_ladrilhos(grafo, lado=GRAFOS_LADRILHO_GRAUS):
+    """
+    Recorta um grafo grande (ex.: extrato de um estado) nos ladrilhos da
+    grade, com a mesma regra do download: cada ladrilho leva as arestas com
+    ao menos uma ponta dentro dele, junto dos dois nós. Retorna
+    {(i, j): GrafoCompacto} para todos os ladrilhos da caixa do grafo,
+    inclusive os sem vias.
+    """
+    if not grafo.num_nos:
+        return {}
+    nos_lat = np.asarray(grafo.nos_lat)
+    nos_lon = np.asarray(grafo.nos_lon)
+    ladrilho_i = np.floor(nos_lat / lado).astype(np.int64)
+    ladrilho_j = np.floor(nos_lon / lado).astype(np.int64)
+    origem = np.asarray(grafo.arestas_origem)
+    destino = np.asarray(grafo.arestas_destino)
+
+    # Pares (ladrilho, aresta) pelas duas pontas de cada aresta, sem repetição
+    arestas = np.arange(len(origem))
+    pares_i = np.concatenate([ladrilho_i[origem], ladrilho_i[destino]])
+    pares_j = np.concatenate([ladrilho_j[origem], ladrilho_j[destino]])
+    pares_aresta = np.concatenate([arestas, arestas])
+    pares = np.unique(np.stack([pares_i, pares_j, pares_aresta], axis=1), axis=0)
+    inicios = np.flatnonzero(np.concatenate([[True], np.any(pares[1:, :2] != pares[:-1, :2], axis=1)]))
+    grupos = np.split(pares, inicios[1:])
+
+    faixa = (ladrilho_i.min(), ladrilho_j.min(), ladrilho_i.max(), ladrilho_j.max())
+    resultado = {
+        (int(i), int(j)): grafo_vazio({'ladrilho': [int(i), int(j)]})
+        for i, j in ladrilhos_da_faixa(faixa)
+    }
+    for grupo in grupos:
+        i, j = int(grupo[0, 0]), int(grupo[0, 1])
+        selecionadas = grupo[:, 2]
+        nos = np.unique(np.concatenate([origem[selecionadas], destino[selecionadas]]))
+        resultado[(i, j)] = GrafoCompacto(
+            np.asarray(grafo.nos_osm)[nos], nos_lat[nos], nos_lon[nos],
+            np.searchsorted(nos, origem[selecionadas]).astype(np.int32),
+            np.searchsorted(nos, destino[selecionadas]).astype(np.int32),
+            np.asarray(grafo.arestas_comprimento)[selecionadas],
+            np.asarray(grafo.arestas_tempo)[selecionadas],
+            meta={'ladrilho': [i, j], 'limites': list(limites_ladrilho(i, j, lado))},
+        )
+    return resultado
+
+
+def obter_ladrilho(store, i, j, baixar=None):
+    """
+    Ladrilho do armazenamento em disco, baixado e persistido na primeira vez
+    (com baixar=False, ladrilhos ausentes ficam vazios; padrão GRAFOS_DOWNLOAD)
+    """
+    chave = chave_ladrilho(i, j)
+    grafo = store.carregar(chave)
+    if grafo is not None:
+        return grafo
+    if not (GRAFOS_DOWNLOAD if baixar is None else baixar):
+        return grafo_vazio({'ladrilho': [i, j]})
+    with _lock_ladrilho(chave):
+        grafo = store.carregar(chave)
+        if grafo is not None:
+            return grafo
+        print(f"🗺️  Baixando ladrilho {i},{j}...")
+        grafo = baixar_ladrilho(i, j)
+        try:
+            store.salvar(chave, grafo)
+        except OSError as e:
+            print(f"Erro ao salvar ladrilho em disco: {e}")
+        return grafo
+
+
+def _versoes(grafos, ladrilhos):
+    return {chave_ladrilho(i, j): grafo.versao for (i, j), grafo in zip(ladrilhos, grafos)}
+
+
+def regioes_contendo(store, faixa, fator=GRAFOS_REGIAO_REUSO_FATOR):
+    """
+    Regiões unidas no disco que contêm a faixa, com até `fator` vezes o
+    seu número de ladrilhos, da menor para a maior: [(chave, faixa)]
+    """
+    limite = fator * len(ladrilhos_da_faixa(faixa))
+    candidatas = []
+    for chave in store.chaves():
+        outra = faixa_da_chave(chave)
+        if outra is None or outra == faixa or not contem_faixa(outra, faixa):
+            continue
+        quantidade = len(ladrilhos_da_faixa(outra))
+        if quantidade <= limite:
+            candidatas.append((quantidade, chave, outra))
+    return [(chave, outra) for _, chave, outra in sorted(candidatas)]
+
+
+def despejar_regioes(store, limite=GRAFOS_REGIOES_MAX, manter=()):
+    """
+    Remove do disco as regiões unidas usadas há mais tempo, até restarem
+    `limite` (os ladrilhos ficam). Retorna as chaves removidas.
+    """
+    chaves = [chave for chave in store.chaves() if chave.startswith(PREFIXO_REGIAO)]
+    if len(chaves) <= limite:
+        return []
+    chaves.sort(key=store.ultimo_uso, reverse=True)
+    removidas = [chave for chave in chaves[limite:] if chave not in manter]
+    for chave in removidas:
+        store.remover(chave)
+    if removidas:
+        print(f"🧹 {len(removidas)} região(ões) sem uso recente removida(s) do disco")
+    return removidas
+
+
+def montar_regiao(store, faixa, baixar=None):
+    """
+    Grafo roteável da faixa de ladrilhos, como (chave, grafo). Usa a região
+    unida da faixa ou, se não houver, uma já unida que a contenha (a chave
+    retornada é a dessa região); só une os ladrilhos quando nenhuma está em
+    dia com as versões deles. A união é persistida (junto dela ficam o
+    índice espacial e a contraction hierarchy) e, acima de
+    GRAFOS_REGIOES_MAX, as regiões usadas há mais tempo saem do disco.
+    """
+    chave = chave_regiao(faixa)
+    ladrilhos = ladrilhos_da_faixa(faixa)
+    grafos = [obter_ladrilho(store, i, j, baixar) for i, j in ladrilhos]
+    versoes = _versoes(grafos, ladrilhos)
+
+    regiao = store.carregar(chave)
+    if regiao is not None and regiao.meta.get('ladrilhos') == versoes:
+        store.marcar_uso(chave)
+        return chave, regiao
+
+    for outra_chave, outra_faixa in regioes_contendo(store, faixa):
+        outra = store.carregar(outra_chave)
+        if outra is None:
+            continue
+        unidos = outra.meta.get('ladrilhos') or {}
+        if any(unidos.get(nome) != versao for nome, versao in versoes.items()):
+            continue
+        # Os demais ladrilhos só são conferidos no disco, sem download
+        outros = [ladrilho for ladrilho in ladrilhos_da_faixa(outra_faixa) if chave_ladrilho(*ladrilho) not in versoes]
+        if unidos == {**versoes, **_versoes([obter_ladrilho(store, i, j, False) for i, j in outros], outros)}:
+            store.marcar_uso(outra_chave)
+            return outra_chave, outra
+
+    regiao = unir_ladrilhos(grafos, meta={'faixa': list(faixa), 'ladrilhos': versoes})
+    try:
+        store.salvar(chave, regiao)
+        despejar_regioes(store, manter={chave})
+    except OSError as e:
+        print(f"Erro ao salvar região em disco: {e}")
+    return chave, regiao
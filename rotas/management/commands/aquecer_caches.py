@@ -0,0 +1,103 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rotas.geocodificacao import get_geocodificador
+from rotas.grafos import get_grafo_store
+from rotas.indice_espacial import IndiceEspacial
+from rotas.ladrilhos import GRAFOS_LADRILHOS_MAX, faixa_ladrilhos, ladrilhos_da_faixa, montar_regiao
+from rotas.models import Rota
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Pré-carrega geocodificações e grafos das regiões dos clientes nos caches persistentes (deploy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30, help='Considera as rotas geradas nesse período')
+        parser.add_argument('--max-enderecos', type=int, default=500, help='Endereços de rotas mais frequentes a geocodificar')
+        parser.add_argument('--workers', type=int, default=4, help='Regiões de grafo montadas em paralelo')
+        parser.add_argument('--sem-geocodificacao', action='store_true')
+        parser.add_argument('--sem-grafos', action='store_true')
+
+    def _coletar(self, options):
+        """
+        Endereços das empresas, endereços frequentes das rotas recentes e
+        coordenadas dessas rotas (já geocodificadas)
+        """
+        empresas = list(dict.fromkeys(
+            endereco for endereco in (usuario.endereco_completo() for usuario in Usuario.objects.all())
+            if endereco != 'Endereço incompleto'
+        ))
+        frequencia = Counter()
+        coordenadas_rotas = []
+        desde = timezone.now() - timedelta(days=options['dias'])
+        for enderecos, coordenadas in Rota.objects.filter(data_geracao__gte=desde).values_list(
+            'enderecos_otimizados', 'coordenadas_otimizadas'
+        ).iterator():
+            frequencia.update(enderecos or [])
+            if coordenadas:
+                coordenadas_rotas.append([tuple(coordenada) for coordenada in coordenadas])
+        frequentes = [endereco for endereco, _ in frequencia.most_common(options['max_enderecos'])]
+        return empresas, frequentes, coordenadas_rotas
+
+    def _aquecer_regiao(self, store, faixa):
+        chave, compacto = montar_regiao(store, faixa)
+        if compacto.num_nos and IndiceEspacial.carregar(store, chave, compacto) is None:
+            IndiceEspacial.construir(compacto).salvar(store, chave)
+        return chave, compacto.num_nos
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        empresas, frequentes, coordenadas_rotas = self._coletar(options)
+        self.stdout.write(
+            f'{len(empresas)} empresa(s), {len(frequentes)} endereço(s) frequente(s), '
+            f'{len(coordenadas_rotas)} rota(s) recente(s)'
+        )
+
+        # 1. Geocodificação (o geocodificador já paraleliza e respeita o limite do provedor)
+        coordenadas_empresas = []
+        if not options['sem_geocodificacao']:
+            etapa = time.perf_counter()
+            enderecos = list(dict.fromkeys(empresas + frequentes))
+            resultados = get_geocodificador().geocodificar_lote(enderecos)
+            coordenadas_empresas = [c for c in resultados[:len(empresas)] if c is not None]
+            encontrados = sum(1 for c in resultados if c is not None)
+            self.stdout.write(
+                f'Geocodificação: {encontrados}/{len(enderecos)} endereço(s) em {time.perf_counter() - etapa:.1f}s'
+            )
+
+        # 2. Grafos: região de cada rota recente e ladrilhos em volta de cada empresa
+        if not options['sem_grafos']:
+            etapa = time.perf_counter()
+            faixas = {faixa_ladrilhos(coordenadas) for coordenadas in coordenadas_rotas}
+            faixas.update(faixa_ladrilhos([coordenada]) for coordenada in coordenadas_empresas)
+            grandes = {faixa for faixa in faixas if len(ladrilhos_da_faixa(faixa)) > GRAFOS_LADRILHOS_MAX}
+            faixas -= grandes
+            if grandes:
+                self.stdout.write(self.style.WARNING(
+                    f'{len(grandes)} região(ões) com mais de {GRAFOS_LADRILHOS_MAX} ladrilhos ignorada(s)'
+                ))
+
+            store = get_grafo_store()
+            falhas = 0
+            with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+                futuros = {executor.submit(self._aquecer_regiao, store, faixa): faixa for faixa in faixas}
+                for futuro in as_completed(futuros):
+                    try:
+                        chave, num_nos = futuro.result()
+                        self.stdout.write(f'  {chave}: {num_nos} nós')
+                    except Exception as e:
+                        falhas += 1
+                        self.stderr.write(self.style.WARNING(f'  {futuros[futuro]}: {e}'))
+            ladrilhos = {ladrilho for faixa in faixas for ladrilho in ladrilhos_da_faixa(faixa)}
+            self.stdout.write(
+                f'Grafos: {len(faixas) - falhas}/{len(faixas)} região(ões), {len(ladrilhos)} ladrilho(s) '
+                f'em {time.perf_counter() - etapa:.1f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Caches aquecidos em {time.perf_counter() - inicio:.1f}s'))
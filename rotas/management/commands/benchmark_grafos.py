@@ -0,0 +1,123 @@
+import math
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from rotas.contracao import ContracaoHierarquica
+from rotas.grafo_csr import GrafoCSR
+from rotas.grafos import GrafoCompacto, get_grafo_store
+from rotas.velocidades import tempos_percurso
+
+
+def gerar_grade(lado, semente=0):
+    """
+    Grafo sintético em grade (lado x lado) com ~85% das ruas em mão dupla
+    e velocidades de 30 a 60 km/h, usado quando não há região persistida para o benchmark
+    """
+    rng = np.random.default_rng(semente)
+    n = lado * lado
+    indices = np.arange(n).reshape(lado, lado)
+    pares = np.concatenate([
+        np.stack([indices[:, :-1].ravel(), indices[:, 1:].ravel()], axis=1),
+        np.stack([indices[:-1, :].ravel(), indices[1:, :].ravel()], axis=1),
+    ])
+    comprimentos = rng.uniform(80, 120, len(pares))
+    volta = rng.random(len(pares)) < 0.85
+    origens = np.concatenate([pares[:, 0], pares[volta, 1]])
+    destinos = np.concatenate([pares[:, 1], pares[volta, 0]])
+    pesos = np.concatenate([comprimentos, comprimentos[volta] * rng.uniform(1.0, 1.3, volta.sum())])
+    velocidades = rng.choice([30.0, 40.0, 60.0], len(pesos))
+    ordem = np.lexsort((destinos, origens))
+    linhas, colunas = np.divmod(np.arange(n), lado)
+    return GrafoCompacto(
+        nos_osm=np.arange(n, dtype=np.int64),
+        nos_lat=-9.7 + linhas * 0.0009,
+        nos_lon=-35.8 + colunas * 0.0009,
+        arestas_origem=origens[ordem].astype(np.int32),
+        arestas_destino=destinos[ordem].astype(np.int32),
+        arestas_comprimento=pesos[ordem].astype(np.float32),
+        arestas_tempo=tempos_percurso(pesos[ordem], velocidades[ordem]),
+        meta={'chave': f'grade_{lado}x{lado}'},
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compara o cálculo da matriz de distâncias: NetworkX x CSR x contraction hierarchy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regiao', help='Chave de uma região persistida no GrafoStore')
+        parser.add_argument('--grade', type=int, default=80, help='Lado da grade sintética (sem --regiao)')
+        parser.add_argument('--paradas', type=int, default=30)
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--sem-networkx', action='store_true', help='Não mede o caminho antigo (lento)')
+
+    def _medir(self, funcao):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        return resultado, (time.perf_counter() - inicio) * 1000
+
+    def handle(self, *args, **options):
+        store = get_grafo_store()
+        if options['regiao']:
+            compacto = store.carregar(options['regiao'])
+            if compacto is None:
+                raise CommandError(f"Região '{options['regiao']}' não encontrada")
+            ch = ContracaoHierarquica.carregar(store, options['regiao'], compacto.versao)
+        else:
+            compacto = gerar_grade(options['grade'], options['semente'])
+            ch = None
+
+        self.stdout.write(f"Grafo {compacto.meta.get('chave')}: {compacto.num_nos} nós, {compacto.num_arestas} arestas")
+        csr, t_csr = self._medir(lambda: GrafoCSR.de_compacto(compacto))
+        self.stdout.write(f'Conversão para CSR: {t_csr:.1f} ms')
+
+        if ch is None:
+            ch, t_ch = self._medir(lambda: ContracaoHierarquica.construir(csr))
+            self.stdout.write(f'Pré-processamento CH: {t_ch / 1000:.1f} s ({ch.num_atalhos} atalhos)')
+
+        random.seed(options['semente'])
+        nos = random.sample(range(compacto.num_nos), min(options['paradas'], compacto.num_nos))
+        n = len(nos)
+
+        m_csr, t_m_csr = self._medir(lambda: csr.matriz_distancias(nos))
+        m_ch, t_m_ch = self._medir(lambda: ch.matriz_distancias(nos))
+        _, t_p2p = self._medir(lambda: [ch.distancia(nos[0], destino) for destino in nos[1:]])
+
+        linhas = [
+            ('CSR, uma busca por parada', t_m_csr),
+            ('CH, muitos-para-muitos', t_m_ch),
+        ]
+
+        if not options['sem_networkx']:
+            import networkx as nx
+
+            G = compacto.para_networkx()
+            ids = compacto.nos_osm
+
+            def matriz_networkx():
+                matriz = np.full((n, n), math.inf)
+                for i in range(n):
+                    for j in range(n):
+                        try:
+                            matriz[i][j] = nx.shortest_path_length(G, int(ids[nos[i]]), int(ids[nos[j]]), weight='length')
+                        except nx.NetworkXNoPath:
+                            pass
+                return matriz
+
+            m_nx, t_m_nx = self._medir(matriz_networkx)
+            linhas.insert(0, ('NetworkX shortest_path_length (n² pares)', t_m_nx))
+            alcancaveis = np.isfinite(m_nx)
+            erro = float(np.max(np.abs(m_nx[alcancaveis] - m_ch[alcancaveis]))) if alcancaveis.any() else 0.0
+            self.stdout.write(f'Diferença máxima CH x NetworkX: {erro:.3f} m')
+
+        alcancaveis = np.isfinite(m_csr)
+        if not np.array_equal(alcancaveis, np.isfinite(m_ch)) or \
+                np.max(np.abs(m_csr[alcancaveis] - m_ch[alcancaveis])) > 1.0:
+            self.stderr.write(self.style.ERROR('Divergência entre CSR e CH!'))
+
+        self.stdout.write(f'\nMatriz {n}x{n}:')
+        for nome, tempo in linhas:
+            self.stdout.write(f'  {nome:<45} {tempo:10.1f} ms')
+        self.stdout.write(f"  {'CH, consulta ponto a ponto (média)':<45} {t_p2p / max(n - 1, 1):10.3f} ms")
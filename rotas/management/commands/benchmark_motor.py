@@ -0,0 +1,171 @@
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rotas.management.commands.benchmark_grafos import gerar_grade
+
+GRAFOS = ('ladrilhos', 'linha_reta')
+SOLVERS = ('nativo', 'ortools')
+
+
+class GeocodificadorFixo:
+    """
+    Geocodificador do benchmark: endereços 'no_<i>' são os nós da grade
+    sintética (sem provedor externo nem banco)
+    """
+
+    def __init__(self, compacto):
+        self.nos_lat = compacto.nos_lat
+        self.nos_lon = compacto.nos_lon
+
+    def geocodificar(self, endereco, usar_cache=True):
+        i = int(endereco.split('_')[1])
+        return float(self.nos_lat[i]), float(self.nos_lon[i])
+
+    def geocodificar_lote(self, enderecos, usar_cache=True):
+        return [self.geocodificar(endereco) for endereco in enderecos]
+
+
+class Command(BaseCommand):
+    help = 'Mede a partida a frio e o custo por requisição de cada combinação de backends do motor de rotas'
+    # As verificações carregariam as URLs (e o motor) antes da medição da importação
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grade', type=int, default=80, help='Lado da grade sintética')
+        parser.add_argument('--paradas', type=int, default=30)
+        parser.add_argument('--requisicoes', type=int, default=10, help='Requisições medidas após a primeira')
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--pool', action='store_true', help='Matriz e TSP no pool de processos')
+        parser.add_argument('--combinacao', help='grafos:solver (uso interno: mede uma combinação neste processo)')
+        parser.add_argument('--diretorio', help='GrafoStore com os ladrilhos (uso interno)')
+
+    def handle(self, *args, **options):
+        if options['combinacao']:
+            resultado = self._medir_combinacao(options)
+            self.stdout.write(json.dumps(resultado))
+            return
+
+        from rotas.grafos import GrafoStore
+        from rotas.ladrilhos import chave_ladrilho, dividir_em_ladrilhos
+        from rotas.motor import detectar_capacidades
+
+        capacidades = detectar_capacidades()
+        solvers = [nome for nome in SOLVERS if nome != 'ortools' or capacidades['ortools']]
+        if 'ortools' not in solvers:
+            self.stdout.write(self.style.WARNING('OR-Tools não instalado: combinações com ortools ignoradas'))
+
+        # Ladrilhos da grade sintética, gravados uma vez e copiados para cada
+        # combinação (todas partem do mesmo disco, sem regiões já unidas)
+        base = tempfile.mkdtemp(prefix='benchmark_motor_')
+        try:
+            origem = os.path.join(base, 'ladrilhos')
+            store = GrafoStore(origem)
+            for (i, j), ladrilho in dividir_em_ladrilhos(gerar_grade(options['grade'], options['semente'])).items():
+                store.salvar(chave_ladrilho(i, j), ladrilho)
+
+            resultados = []
+            for grafos in GRAFOS:
+                for nome_solver in solvers:
+                    diretorio = os.path.join(base, f'{grafos}_{nome_solver}')
+                    shutil.copytree(origem, diretorio)
+                    resultados.append(self._executar(f'{grafos}:{nome_solver}', diretorio, options))
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
+
+        n = options['paradas']
+        self.stdout.write(
+            f"\nGrade {options['grade']}x{options['grade']}, {n} paradas, {options['requisicoes']} requisições por combinação:"
+        )
+        self.stdout.write(
+            f"  {'grafos:solver':<22} {'import':>9} {'motor':>9} {'1ª req':>9} {'frio':>9} "
+            f"{'mediana':>9} {'p90':>9} {'km médio':>9}"
+        )
+        for r in resultados:
+            self.stdout.write(
+                f"  {r['combinacao']:<22} {r['importacao_ms']:9.1f} {r['criacao_ms']:9.1f} {r['primeira_ms']:9.1f} "
+                f"{r['frio_ms']:9.1f} {r['mediana_ms']:9.1f} {r['p90_ms']:9.1f} {r['distancia_media_km']:9.2f}"
+            )
+        self.stdout.write('  (tempos em ms; frio = import + motor + 1ª requisição)')
+
+    def _executar(self, combinacao, diretorio, options):
+        """
+        Mede a combinação em um processo novo, para que a partida a frio
+        inclua as importações de cada backend
+        """
+        comando = [
+            sys.executable, '-m', 'django', 'benchmark_motor',
+            '--combinacao', combinacao, '--diretorio', diretorio,
+            '--grade', str(options['grade']), '--paradas', str(options['paradas']),
+            '--requisicoes', str(options['requisicoes']), '--semente', str(options['semente']),
+        ] + (['--pool'] if options['pool'] else [])
+        ambiente = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE))
+        ambiente['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), ambiente.get('PYTHONPATH')]))
+        self.stdout.write(f'Medindo {combinacao}...')
+        processo = subprocess.run(comando, capture_output=True, text=True, env=ambiente)
+        if processo.returncode != 0:
+            raise CommandError(f'{combinacao} falhou:\n{processo.stderr}')
+        return json.loads(processo.stdout.strip().splitlines()[-1])
+
+    def _medir_combinacao(self, options):
+        grafos, nome_solver = options['combinacao'].split(':')
+        if grafos not in GRAFOS or nome_solver not in SOLVERS:
+            raise CommandError(f"Combinação inválida: {options['combinacao']}")
+
+        inicio = time.perf_counter()
+        from rotas import motor as modulo_motor
+        from rotas.grafos import GrafoStore
+        importacao_ms = (time.perf_counter() - inicio) * 1000
+
+        compacto = gerar_grade(options['grade'], options['semente'])
+        geocodificador = GeocodificadorFixo(compacto)
+        random.seed(options['semente'])
+        requisicoes = [
+            [f'no_{i}' for i in random.sample(range(compacto.num_nos), options['paradas'] + 1)]
+            for _ in range(options['requisicoes'] + 1)
+        ]
+
+        # Sem caches de pares e de soluções: cada requisição é resolvida do zero
+        inicio = time.perf_counter()
+        if grafos == 'ladrilhos':
+            provedor = modulo_motor.ProvedorLadrilhos(GrafoStore(options['diretorio']), baixar=False)
+        else:
+            provedor = modulo_motor.SemGrafo()
+        solver_tsp = modulo_motor.SolverOrTools() if nome_solver == 'ortools' else modulo_motor.SolverNativo()
+        motor = modulo_motor.criar_motor(
+            solver_tsp=solver_tsp, grafos=provedor, geocodificador=geocodificador, usar_caches=False,
+            usar_pool=options['pool'],
+        )
+        criacao_ms = (time.perf_counter() - inicio) * 1000
+
+        tempos, distancias = [], []
+        for enderecos in requisicoes:
+            inicio = time.perf_counter()
+            resultado = motor.otimizar_rota(enderecos)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            if not resultado['sucesso']:
+                raise CommandError(resultado['erro'])
+            distancias.append(resultado['distancia_total_km'])
+
+        quentes = sorted(tempos[1:]) or tempos
+        return {
+            'combinacao': options['combinacao'],
+            'backends': motor.backends,
+            'importacao_ms': round(importacao_ms, 1),
+            'criacao_ms': round(criacao_ms, 1),
+            'primeira_ms': round(tempos[0], 1),
+            'frio_ms': round(importacao_ms + criacao_ms + tempos[0], 1),
+            'mediana_ms': round(statistics.median(quentes), 1),
+            'p90_ms': round(quentes[int(0.9 * (len(quentes) - 1))], 1),
+            'distancia_media_km': round(statistics.mean(distancias), 2),
+            'ortools_importado': 'ortools' in sys.modules,
+        }
@@ -0,0 +1,54 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rotas.extrato_osm import grafo_do_extrato
+from rotas.grafos import get_grafo_store
+from rotas.ladrilhos import chave_ladrilho, dividir_em_ladrilhos
+
+
+class Command(BaseCommand):
+    help = 'Importa um extrato OSM local (.osm, .osm.pbf ou GraphML) para os ladrilhos do armazenamento de grafos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do extrato (.osm, .osm.pbf ou .graphml)')
+        parser.add_argument(
+            '--expirar', action='store_true',
+            help='Os ladrilhos importados expiram como os baixados (padrão: permanentes)'
+        )
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+
+        inicio = time.perf_counter()
+        try:
+            grafo = grafo_do_extrato(caminho)
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f'{caminho.name}: {grafo.num_nos} nós, {grafo.num_arestas} arestas trafegáveis '
+            f'({time.perf_counter() - inicio:.1f}s)'
+        )
+        if not grafo.num_nos:
+            raise CommandError('Nenhuma via trafegável encontrada no extrato')
+
+        etapa = time.perf_counter()
+        ladrilhos = dividir_em_ladrilhos(grafo)
+        store = get_grafo_store()
+        vazios = 0
+        for (i, j), ladrilho in ladrilhos.items():
+            ladrilho.meta['fonte'] = str(caminho)
+            if not options['expirar']:
+                ladrilho.meta['expira'] = False
+            vazios += not ladrilho.num_nos
+            store.salvar(chave_ladrilho(i, j), ladrilho)
+
+        # As regiões unidas a partir dos ladrilhos antigos são refeitas no próximo
+        # uso, porque as versões dos ladrilhos mudaram
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(ladrilhos)} ladrilho(s) gravado(s) em {store.diretorio} ({vazios} sem vias) '
+            f'em {time.perf_counter() - etapa:.1f}s'
+        ))
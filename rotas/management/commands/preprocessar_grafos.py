@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rotas.contracao import ContracaoHierarquica, construir_e_salvar
+from rotas.distancias import get_cache_distancias
+from rotas.grafo_csr import OBJETIVOS
+from rotas.grafos import get_grafo_store
+from rotas.indice_espacial import IndiceEspacial
+from rotas.ladrilhos import PREFIXO_LADRILHO
+from rotas.motor import ROTAS_OBJETIVO
+
+
+class Command(BaseCommand):
+    help = 'Gera o índice espacial e a contraction hierarchy dos grafos regionais persistidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regiao', action='append', help='Chave da região (pode repetir). Padrão: todas, exceto ladrilhos avulsos')
+        parser.add_argument('--forcar', action='store_true', help='Regera mesmo se já existir para a versão atual')
+        parser.add_argument('--objetivo', choices=OBJETIVOS, default=ROTAS_OBJETIVO,
+                            help='Métrica minimizada pela hierarquia (padrão: ROTAS_OBJETIVO)')
+
+    def handle(self, *args, **options):
+        store = get_grafo_store()
+        # Ladrilhos isolados não são roteados; só as regiões formadas pela união deles
+        chaves = options['regiao'] or [
+            chave for chave in store.chaves() if not chave.startswith(PREFIXO_LADRILHO)
+        ]
+        if not chaves:
+            raise CommandError(f'Nenhuma região encontrada em {store.diretorio}')
+
+        objetivo = options['objetivo']
+        for chave in chaves:
+            compacto = store.carregar(chave)
+            if compacto is None:
+                self.stderr.write(self.style.WARNING(f'{chave}: região não encontrada ou expirada'))
+                continue
+            if options['forcar'] or IndiceEspacial.carregar(store, chave, compacto) is None:
+                indice = IndiceEspacial.construir(compacto)
+                indice.salvar(store, chave)
+                self.stdout.write(f'{chave}: índice espacial com {indice.num_celulas} células')
+            if not options['forcar'] and ContracaoHierarquica.carregar(store, chave, compacto.versao, objetivo):
+                self.stdout.write(f'{chave}: hierarquia por {objetivo} já existe (versão {compacto.versao})')
+                continue
+
+            def progresso(contraidos, total, decorrido):
+                self.stdout.write(f'  {contraidos}/{total} nós contraídos ({decorrido:.1f}s)')
+
+            self.stdout.write(f'{chave}: {compacto.num_nos} nós, {compacto.num_arestas} arestas')
+            inicio = time.time()
+            ch, construida = construir_e_salvar(
+                store, chave, compacto, objetivo=objetivo, progresso=progresso, forcar=options['forcar'],
+            )
+            if not construida:
+                self.stdout.write(f'{chave}: hierarquia por {objetivo} gerada por outro processo')
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{chave}: {ch.num_atalhos} atalhos gerados em {time.time() - inicio:.1f}s'
+            ))
+
+        # Distâncias das versões que não estão mais no armazenamento (regiões
+        # regravadas, despejadas ou expiradas) nunca mais são consultadas
+        removidos = get_cache_distancias().limpar_versoes(store.versoes().values())
+        if removidos:
+            self.stdout.write(f'{removidos} distância(s) em cache de versões antigas do grafo removida(s)')
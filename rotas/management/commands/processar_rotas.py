@@ -0,0 +1,59 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from rotas.jobs import ROTAS_JOBS_WORKERS, processar_pendentes
+from rotas.motor import get_motor_rotas
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de jobs de otimização de rotas (worker dedicado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=ROTAS_JOBS_WORKERS, help='Threads consumindo a fila')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre consultas à fila vazia')
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e encerra')
+
+    def handle(self, *args, **options):
+        motor = get_motor_rotas()
+        parar = threading.Event()
+        totais = []
+
+        def consumir():
+            processados = 0
+            try:
+                while not parar.is_set():
+                    close_old_connections()
+                    feitos = processar_pendentes(motor)
+                    processados += feitos
+                    if options['uma_vez']:
+                        break
+                    if not feitos:
+                        parar.wait(options['intervalo'])
+            finally:
+                totais.append(processados)
+                connection.close()
+
+        threads = [
+            threading.Thread(target=consumir, name=f'processar-rotas-{i}', daemon=True)
+            for i in range(max(options['workers'], 1))
+        ]
+        self.stdout.write(f"Processando jobs de rota com {len(threads)} worker(s)...")
+        inicio = time.time()
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Encerrando após os jobs em andamento...')
+            parar.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(totais)} job(s) processado(s) em {time.time() - inicio:.1f}s'
+        ))
@@ -0,0 +1,65 @@
+# Matrizes de distância/tempo das rotas salvas (binário int32 em RotaMatriz)
+import numpy as np
+
+from django.db import DatabaseError
+
+
+def salvar_matriz_rota(rota, distancias, tempos, nos_osm=None, versao=None):
+    """
+    Grava (ou substitui) as matrizes da rota. `distancias` (m) e `tempos`
+    (s) são n x n na ordem de visita; `nos_osm` são os nós do grafo de cada
+    parada (None quando as distâncias são em linha reta).
+    """
+    from .models import RotaMatriz
+
+    distancias = np.asarray(distancias)
+    RotaMatriz.objects.update_or_create(
+        rota=rota,
+        defaults={
+            'versao_grafo': versao if nos_osm is not None else None,
+            'paradas': len(distancias),
+            'distancias': np.rint(distancias).astype('<i4').tobytes(),
+            'tempos': np.rint(tempos).astype('<i4').tobytes(),
+            'nos': np.asarray(nos_osm, dtype='<i8').tobytes() if nos_osm is not None else None,
+        },
+    )
+
+
+def carregar_matriz_rota(rota):
+    """
+    Retorna {'distancias', 'tempos', 'nos_osm', 'versao'} (arrays NumPy na
+    ordem de visita) ou None se a rota não tem matriz salva
+    """
+    from .models import RotaMatriz
+
+    try:
+        registro = RotaMatriz.objects.filter(rota=rota).first()
+    except DatabaseError as e:
+        print(f"Erro ao carregar matriz da rota {rota.id}: {e}")
+        return None
+    if registro is None:
+        return None
+    n = registro.paradas
+    return {
+        'distancias': np.frombuffer(bytes(registro.distancias), dtype='<i4').reshape(n, n),
+        'tempos': np.frombuffer(bytes(registro.tempos), dtype='<i4').reshape(n, n),
+        'nos_osm': np.frombuffer(bytes(registro.nos), dtype='<i8') if registro.nos else None,
+        'versao': registro.versao_grafo,
+    }
+
+
+def matriz_na_ordem(matriz, ordem):
+    """
+    Reordena as linhas e colunas da matriz (e dos nós) para a ordem de
+    visita `ordem` (rota fechada: o retorno à origem é descartado)
+    """
+    ordem = list(ordem[:-1]) if len(ordem) > 1 and ordem[-1] == ordem[0] else list(ordem)
+    distancias = np.asarray(matriz['distancias'])[np.ix_(ordem, ordem)]
+    tempos = np.asarray(matriz['tempos'])[np.ix_(ordem, ordem)]
+    nos_osm = matriz.get('nos_osm')
+    return {
+        'distancias': distancias,
+        'tempos': tempos,
+        'nos_osm': [int(nos_osm[i]) for i in ordem] if nos_osm is not None else None,
+        'versao': matriz.get('versao'),
+    }
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0005_add_preco_combustivel_usado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodificacaoCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64, unique=True, verbose_name='Chave (hash do endereço normalizado)')),
+                ('endereco_normalizado', models.TextField(verbose_name='Endereço Normalizado')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='Latitude')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='Longitude')),
+                ('encontrado', models.BooleanField(default=True, verbose_name='Endereço Encontrado')),
+                ('acertos', models.PositiveIntegerField(default=0, verbose_name='Acertos no Cache')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('data_atualizacao', models.DateTimeField(verbose_name='Última Consulta ao Provedor')),
+            ],
+            options={
+                'verbose_name': 'Geocodificação em Cache',
+                'verbose_name_plural': 'Geocodificações em Cache',
+                'ordering': ['-data_atualizacao'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0006_geocodificacaocache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistanciaCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao_grafo', models.CharField(max_length=16, verbose_name='Versão do Grafo')),
+                ('no_origem', models.BigIntegerField(verbose_name='Nó de Origem (OSM)')),
+                ('no_destino', models.BigIntegerField(verbose_name='Nó de Destino (OSM)')),
+                ('distancia_m', models.FloatField(blank=True, null=True, verbose_name='Distância (m)')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+            ],
+            options={
+                'verbose_name': 'Distância em Cache',
+                'verbose_name_plural': 'Distâncias em Cache',
+                'constraints': [models.UniqueConstraint(fields=('versao_grafo', 'no_origem', 'no_destino'), name='distancia_cache_par_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0007_distanciacache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RotaJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=12, verbose_name='Status do Job')),
+                ('parametros', models.JSONField(verbose_name='Parâmetros da Otimização')),
+                ('erro', models.TextField(blank=True, verbose_name='Mensagem de Erro')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('data_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Início do Processamento')),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True, verbose_name='Fim do Processamento')),
+                ('rota', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job', to='rotas.rota', verbose_name='Rota Gerada')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuário Responsável')),
+            ],
+            options={
+                'verbose_name': 'Job de Rota',
+                'verbose_name_plural': 'Jobs de Rotas',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'data_criacao'], name='rota_job_fila_idx')],
+            },
+        ),
+    ]
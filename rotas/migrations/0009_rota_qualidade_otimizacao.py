@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0008_rotajob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rota',
+            name='qualidade_otimizacao',
+            field=models.JSONField(blank=True, null=True, verbose_name='Qualidade da Otimização (método, gap e tempo)'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0009_rota_qualidade_otimizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RotaSolucaoCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=40, unique=True, verbose_name='Chave (hash do problema)')),
+                ('versao_grafo', models.CharField(max_length=16, verbose_name='Versão do Grafo')),
+                ('nos_rota', models.JSONField(verbose_name='Nós na Ordem de Visita (OSM)')),
+                ('distancia_m', models.FloatField(verbose_name='Distância Total (m)')),
+                ('tempo_minutos', models.IntegerField(verbose_name='Tempo Estimado (minutos)')),
+                ('qualidade', models.JSONField(blank=True, null=True, verbose_name='Qualidade da Otimização')),
+                ('acertos', models.PositiveIntegerField(default=0, verbose_name='Acertos no Cache')),
+                ('data_criacao', models.DateTimeField(verbose_name='Data de Criação')),
+            ],
+            options={
+                'verbose_name': 'Solução de Rota em Cache',
+                'verbose_name_plural': 'Soluções de Rotas em Cache',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
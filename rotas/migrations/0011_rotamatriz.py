@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0010_rotasolucaocache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RotaMatriz',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao_grafo', models.CharField(blank=True, max_length=16, null=True, verbose_name='Versão do Grafo (vazia para distâncias em linha reta)')),
+                ('paradas', models.PositiveIntegerField(verbose_name='Número de Paradas (origem incluída)')),
+                ('distancias', models.BinaryField(verbose_name='Distâncias (m, int32)')),
+                ('tempos', models.BinaryField(verbose_name='Tempos de Deslocamento (s, int32)')),
+                ('nos', models.BinaryField(blank=True, null=True, verbose_name='Nós do Grafo (ids OSM, int64)')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+                ('rota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='matriz', to='rotas.rota', verbose_name='Rota')),
+            ],
+            options={
+                'verbose_name': 'Matriz da Rota',
+                'verbose_name_plural': 'Matrizes das Rotas',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0011_rotamatriz'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='distanciacache',
+            name='distancia_cache_par_unico',
+        ),
+        migrations.AddField(
+            model_name='distanciacache',
+            name='objetivo',
+            field=models.CharField(default='distancia', max_length=10, verbose_name='Objetivo'),
+        ),
+        migrations.AddField(
+            model_name='distanciacache',
+            name='tempo_s',
+            field=models.FloatField(blank=True, null=True, verbose_name='Tempo de Percurso (s)'),
+        ),
+        migrations.AddConstraint(
+            model_name='distanciacache',
+            constraint=models.UniqueConstraint(fields=('versao_grafo', 'objetivo', 'no_origem', 'no_destino'), name='distancia_cache_par_objetivo_unico'),
+        ),
+    ]
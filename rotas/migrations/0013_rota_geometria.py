@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0012_distanciacache_tempo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rota',
+            name='geometria',
+            field=models.TextField(blank=True, null=True, verbose_name='Traçado pelas Vias (polyline codificada)'),
+        ),
+    ]
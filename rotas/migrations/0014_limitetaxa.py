@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rotas', '0013_rota_geometria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LimiteTaxa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50, unique=True, verbose_name='Nome')),
+                ('tokens', models.FloatField(verbose_name='Tokens Disponíveis')),
+                ('data_atualizacao', models.DateTimeField(verbose_name='Última Reposição')),
+            ],
+            options={
+                'verbose_name': 'Limite de Taxa',
+                'verbose_name_plural': 'Limites de Taxa',
+            },
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.core.validators import MinValueValidator
 from usuarios.models import Usuario
@@ -98,6 +100,16 @@ class Rota(models.Model):
     )
     produtos_quantidades = models.JSONField(verbose_name="Produtos e Quantidades")
     link_maps = models.URLField(max_length=500, verbose_name="Link do Google Maps")
+    geometria = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Traçado pelas Vias (polyline codificada)"
+    )
+    qualidade_otimizacao = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Qualidade da Otimização (método, gap e tempo)"
+    )
     status = models.CharField(
         max_length=15,
         choices=STATUS_CHOICES,
@@ -117,3 +129,188 @@ class Rota(models.Model):
 
     def __str__(self):
         return f"Rota {self.id} - {self.nome_motorista} ({self.get_status_display()})"
+
+
+class GeocodificacaoCache(models.Model):
+    """
+    Cache persistente de geocodificação compartilhado entre workers.
+    Resultados negativos (endereço não encontrado) também são armazenados.
+    """
+    chave = models.CharField(max_length=64, unique=True, verbose_name="Chave (hash do endereço normalizado)")
+    endereco_normalizado = models.TextField(verbose_name="Endereço Normalizado")
+    latitude = models.FloatField(null=True, blank=True, verbose_name="Latitude")
+    longitude = models.FloatField(null=True, blank=True, verbose_name="Longitude")
+    encontrado = models.BooleanField(default=True, verbose_name="Endereço Encontrado")
+    acertos = models.PositiveIntegerField(default=0, verbose_name="Acertos no Cache")
+    data_criacao = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+    data_atualizacao = models.DateTimeField(verbose_name="Última Consulta ao Provedor")
+
+    class Meta:
+        verbose_name = "Geocodificação em Cache"
+        verbose_name_plural = "Geocodificações em Cache"
+        ordering = ['-data_atualizacao']
+
+    def __str__(self):
+        if self.encontrado:
+            return f"{self.endereco_normalizado} ({self.latitude}, {self.longitude})"
+        return f"{self.endereco_normalizado} (não encontrado)"
+
+    @property
+    def coordenadas(self):
+        if not self.encontrado:
+            return None
+        return (self.latitude, self.longitude)
+
+
+class LimiteTaxa(models.Model):
+    """
+    Estado de um token bucket compartilhado entre todos os processos
+    (workers do gunicorn, comandos e servidores que usam o mesmo banco)
+    """
+    nome = models.CharField(max_length=50, unique=True, verbose_name="Nome")
+    tokens = models.FloatField(verbose_name="Tokens Disponíveis")
+    data_atualizacao = models.DateTimeField(verbose_name="Última Reposição")
+
+    class Meta:
+        verbose_name = "Limite de Taxa"
+        verbose_name_plural = "Limites de Taxa"
+
+    def __str__(self):
+        return f"{self.nome}: {self.tokens:.2f} tokens"
+
+
+class DistanciaCache(models.Model):
+    """
+    Distância e tempo do caminho mínimo entre dois nós do grafo viário, por
+    versão do grafo e objetivo (caminho mais curto ou mais rápido).
+    Distância nula indica que o destino é inalcançável a partir da origem.
+    """
+    versao_grafo = models.CharField(max_length=16, verbose_name="Versão do Grafo")
+    objetivo = models.CharField(max_length=10, default='distancia', verbose_name="Objetivo")
+    no_origem = models.BigIntegerField(verbose_name="Nó de Origem (OSM)")
+    no_destino = models.BigIntegerField(verbose_name="Nó de Destino (OSM)")
+    distancia_m = models.FloatField(null=True, blank=True, verbose_name="Distância (m)")
+    tempo_s = models.FloatField(null=True, blank=True, verbose_name="Tempo de Percurso (s)")
+    data_criacao = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+
+    class Meta:
+        verbose_name = "Distância em Cache"
+        verbose_name_plural = "Distâncias em Cache"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['versao_grafo', 'objetivo', 'no_origem', 'no_destino'],
+                name='distancia_cache_par_objetivo_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.no_origem} -> {self.no_destino}: {self.distancia_m} m ({self.versao_grafo})"
+
+
+class RotaJob(models.Model):
+    """
+    Pedido de otimização de rota executado em segundo plano.
+    O estoque é reservado na criação do job; a rota é criada pelo worker
+    (fila no próprio banco de dados).
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=12,
+        choices=STATUS_CHOICES,
+        default='pendente',
+        verbose_name="Status do Job"
+    )
+    parametros = models.JSONField(verbose_name="Parâmetros da Otimização")
+    rota = models.OneToOneField(
+        Rota,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='job',
+        verbose_name="Rota Gerada"
+    )
+    erro = models.TextField(blank=True, verbose_name="Mensagem de Erro")
+    tentativas = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        verbose_name="Usuário Responsável"
+    )
+    data_criacao = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+    data_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Início do Processamento")
+    data_conclusao = models.DateTimeField(null=True, blank=True, verbose_name="Fim do Processamento")
+
+    class Meta:
+        verbose_name = "Job de Rota"
+        verbose_name_plural = "Jobs de Rotas"
+        ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'data_criacao'], name='rota_job_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.get_status_display()})"
+
+
+class RotaSolucaoCache(models.Model):
+    """
+    Solução de rota já calculada, identificada pelo conjunto de nós das
+    paradas (sem considerar a ordem), o depósito, os parâmetros de custo e
+    a versão do grafo
+    """
+    chave = models.CharField(max_length=40, unique=True, verbose_name="Chave (hash do problema)")
+    versao_grafo = models.CharField(max_length=16, verbose_name="Versão do Grafo")
+    nos_rota = models.JSONField(verbose_name="Nós na Ordem de Visita (OSM)")
+    distancia_m = models.FloatField(verbose_name="Distância Total (m)")
+    tempo_minutos = models.IntegerField(verbose_name="Tempo Estimado (minutos)")
+    qualidade = models.JSONField(null=True, blank=True, verbose_name="Qualidade da Otimização")
+    acertos = models.PositiveIntegerField(default=0, verbose_name="Acertos no Cache")
+    data_criacao = models.DateTimeField(verbose_name="Data de Criação")
+
+    class Meta:
+        verbose_name = "Solução de Rota em Cache"
+        verbose_name_plural = "Soluções de Rotas em Cache"
+        ordering = ['-data_criacao']
+
+    def __str__(self):
+        return f"{len(self.nos_rota)} nós, {self.distancia_m:.0f} m ({self.versao_grafo})"
+
+
+class RotaMatriz(models.Model):
+    """
+    Matrizes de distância e tempo usadas na otimização de uma rota, em
+    binário compacto (int32, n x n, na ordem de visita das paradas, sem o
+    retorno à origem) junto dos nós do grafo de cada parada. Permite
+    reotimizar, auditar e gerar relatórios sem recalcular a matriz.
+    """
+    rota = models.OneToOneField(
+        Rota,
+        on_delete=models.CASCADE,
+        related_name='matriz',
+        verbose_name="Rota"
+    )
+    versao_grafo = models.CharField(
+        max_length=16,
+        null=True,
+        blank=True,
+        verbose_name="Versão do Grafo (vazia para distâncias em linha reta)"
+    )
+    paradas = models.PositiveIntegerField(verbose_name="Número de Paradas (origem incluída)")
+    distancias = models.BinaryField(verbose_name="Distâncias (m, int32)")
+    tempos = models.BinaryField(verbose_name="Tempos de Deslocamento (s, int32)")
+    nos = models.BinaryField(null=True, blank=True, verbose_name="Nós do Grafo (ids OSM, int64)")
+    data_atualizacao = models.DateTimeField(auto_now=True, verbose_name="Última Atualização")
+
+    class Meta:
+        verbose_name = "Matriz da Rota"
+        verbose_name_plural = "Matrizes das Rotas"
+
+    def __str__(self):
+        return f"Matriz da rota {self.rota_id} ({self.paradas} paradas)"
@@ -0,0 +1,1095 @@
+# Motor único de otimização de rotas, com backends plugáveis:
+# geocodificador, provedor de grafos, construtor de matriz e solver do TSP
+import importlib.util
+import os
+import threading
+import time
+
+import numpy as np
+
+from . import solver
+from .contracao import ContracaoHierarquica
+from .distancias import get_cache_distancias
+from .geocodificacao import get_geocodificador
+from .geometria import ROTAS_GEOMETRIA, codificar_polyline, simplificar
+from .grafo_csr import OBJETIVOS, GrafoCSR
+from .grafos import get_grafo_store
+from .haversine import matriz_haversine
+from .indice_espacial import IndiceEspacial
+from .ladrilhos import (
+    GRAFOS_DOWNLOAD,
+    GRAFOS_LADRILHOS_MAX,
+    PREFIXO_REGIAO,
+    chave_regiao,
+    faixa_ladrilhos,
+    ladrilhos_da_faixa,
+    montar_regiao,
+)
+from .matrizes import carregar_matriz_rota, matriz_na_ordem
+from .processos import ROTAS_POOL_PROCESSOS, BrokenProcessPool, PoolSaturado, TimeoutError, get_pool_solver
+from .solucoes import chave_solucao, get_cache_solucoes, reordenar
+
+# Com false, nenhuma biblioteca pesada é importada (OR-Tools, OSMnx): solver
+# nativo e grafos só dos ladrilhos já presentes no disco
+ENABLE_HEAVY_LIBS = os.getenv('ENABLE_HEAVY_LIBS', 'true').lower() == 'true'
+
+# Escolha dos backends: auto (pelas capacidades detectadas) ou forçada
+ROTAS_SOLVER = os.getenv('ROTAS_SOLVER', 'auto')  # auto | nativo | ortools
+ROTAS_GRAFOS = os.getenv('ROTAS_GRAFOS', 'auto')  # auto | ladrilhos | linha_reta
+
+# Métrica minimizada pelos caminhos e pelo TSP; as duas matrizes (distância e
+# tempo de percurso) saem sempre das mesmas buscas
+ROTAS_OBJETIVO = os.getenv('ROTAS_OBJETIVO', 'distancia')  # distancia | tempo
+
+# Distância máxima (em metros) entre uma parada e o nó mais próximo do grafo;
+# acima disso a parada está fora da malha e usa distância em linha reta
+SNAP_DISTANCIA_MAXIMA_M = float(os.getenv('SNAP_DISTANCIA_MAXIMA_M', '1000'))
+
+# Intervalo (s) entre as buscas no disco pela contraction hierarchy de uma
+# região em memória que ainda não a tem (gerada por preprocessar_grafos)
+GRAFOS_CONTRACAO_VERIFICAR_S = float(os.getenv('GRAFOS_CONTRACAO_VERIFICAR_S', '60'))
+
+# Prazo padrão da busca local ao adicionar ou remover paradas de uma rota existente
+ROTAS_EDICAO_MAX_MS = int(os.getenv('ROTAS_EDICAO_MAX_MS', '50'))
+
+# Modelo de custo da rota (também faz parte da chave do cache de soluções).
+# A velocidade média só vale para os trechos em linha reta: no grafo, o
+# tempo vem da velocidade de cada via.
+VELOCIDADE_MEDIA_KMH = 40
+TEMPO_PARADA_MINUTOS = 5
+PARAMETROS_CUSTO = {
+    'objetivo': ROTAS_OBJETIVO,
+    'tempos': 'velocidade_das_vias',
+    'velocidade_kmh': VELOCIDADE_MEDIA_KMH,
+    'parada_min': TEMPO_PARADA_MINUTOS,
+}
+
+# Preços base de combustível (R$/L, GNV em R$/m³)
+PRECOS_COMBUSTIVEL = {
+    'diesel': 5.80,
+    'gasolina': 6.36,
+    'etanol': 4.20,
+    'gnv': 3.50,
+}
+
+
+def matrizes_linha_reta(coordenadas):
+    """
+    Matrizes de distâncias (m) e tempos (s) em linha reta, à velocidade média
+    """
+    distancias = matriz_haversine(coordenadas)
+    return {
+        'distancias': distancias.astype(np.int64).tolist(),
+        'tempos': (distancias / (VELOCIDADE_MEDIA_KMH / 3.6)).astype(np.int64).tolist(),
+    }
+
+
+def detectar_capacidades():
+    """
+    Verifica quais bibliotecas opcionais estão instaladas sem importá-las
+    (a importação do OR-Tools e do OSMnx fica para o primeiro uso)
+    """
+    def instalado(modulo):
+        try:
+            return importlib.util.find_spec(modulo) is not None
+        except (ImportError, ValueError):
+            return False
+
+    return {
+        'ortools': ENABLE_HEAVY_LIBS and instalado('ortools'),
+        'osmnx': ENABLE_HEAVY_LIBS and instalado('osmnx'),
+        'osmium': instalado('osmium'),
+        'download_grafos': ENABLE_HEAVY_LIBS and GRAFOS_DOWNLOAD and instalado('osmnx'),
+    }
+
+
+_capacidades = None
+_capacidades_lock = threading.Lock()
+
+
+def get_capacidades():
+    """Capacidades detectadas uma única vez por processo"""
+    global _capacidades
+    with _capacidades_lock:
+        if _capacidades is None:
+            _capacidades = detectar_capacidades()
+            print(f"🔧 Capacidades do motor de rotas: {_capacidades}")
+    return _capacidades
+
+
+# ---------------------------------------------------------------------------
+# Provedores de grafos
+# ---------------------------------------------------------------------------
+
+class ProvedorLadrilhos:
+    """
+    Regiões formadas pela união dos ladrilhos de grade fixa que cobrem as
+    paradas, com cache em memória e em disco. Cada região traz os arrays
+    compactos, o grafo CSR, o índice espacial dos nós e, quando existir,
+    a contraction hierarchy do objetivo.
+    """
+    nome = 'ladrilhos'
+
+    def __init__(self, store=None, baixar=GRAFOS_DOWNLOAD, ttl=60 * 60, objetivo=ROTAS_OBJETIVO):
+        self.store = store or get_grafo_store()
+        self.baixar = baixar
+        self.ttl = ttl
+        self.objetivo = objetivo
+        self._regioes = {}
+        self._lock = threading.Lock()
+
+    def obter_regiao(self, coordenadas):
+        """
+        Região que cobre as coordenadas, ou None (sem grafo para a área ou
+        paradas espalhadas demais)
+        """
+        faixa = faixa_ladrilhos(coordenadas)
+        chave = chave_regiao(faixa)
+        quantidade = len(ladrilhos_da_faixa(faixa))
+        if quantidade > GRAFOS_LADRILHOS_MAX:
+            print(f"⚠️  Paradas espalhadas demais ({quantidade} ladrilhos), usando linha reta")
+            return None
+
+        with self._lock:
+            regiao = self._regioes.get(chave)
+        if regiao is not None and time.time() - regiao['timestamp'] < self.ttl:
+            self._verificar_contracao(chave, regiao)
+            return regiao
+
+        # Ladrilhos e união vêm do disco (mapeados em memória); só os
+        # ladrilhos ausentes são baixados. A região pode ser uma maior, já
+        # unida, que contém a faixa (e que talvez já esteja em memória)
+        try:
+            chave_unida, compacto = montar_regiao(self.store, faixa, baixar=self.baixar)
+        except Exception as e:
+            print(f"Erro ao baixar grafo: {e}")
+            return None
+        if not compacto.num_nos:
+            return None
+
+        with self._lock:
+            regiao = self._regioes.get(chave_unida)
+        if (regiao is None or regiao['compacto'].versao != compacto.versao
+                or time.time() - regiao['timestamp'] >= self.ttl):
+            regiao = self._registrar(chave_unida, compacto)
+        with self._lock:
+            self._regioes[chave] = regiao
+        return regiao
+
+    def _registrar(self, chave, compacto):
+        """
+        Converte a região para CSR (uma única vez), anexa índice espacial e
+        contraction hierarchy e a coloca no cache em memória
+        """
+        regiao = {
+            'chave': chave,
+            'compacto': compacto,
+            'csr': GrafoCSR.de_compacto(compacto),
+            'diretorio': str(self.store.diretorio),
+            'timestamp': time.time(),
+        }
+        self._anexar_indice(chave, regiao)
+        self._anexar_contracao(chave, regiao)
+        with self._lock:
+            self._regioes[chave] = regiao
+        return regiao
+
+    def carregar_persistidas(self, limite=None):
+        """
+        Coloca no cache em memória as regiões já unidas no disco (as mais
+        recentes primeiro, até `limite`). Usado no pré-carregamento antes do
+        fork. Retorna as chaves carregadas.
+        """
+        chaves = [chave for chave in self.store.chaves() if chave.startswith(PREFIXO_REGIAO)]
+        chaves.sort(key=lambda chave: (self.store.diretorio / chave).stat().st_mtime, reverse=True)
+        carregadas = []
+        for chave in chaves[:limite]:
+            compacto = self.store.carregar(chave)
+            if compacto is None or not compacto.num_nos:
+                continue
+            self._registrar(chave, compacto)
+            carregadas.append(chave)
+        return carregadas
+
+    def _anexar_indice(self, chave, regiao):
+        """
+        Anexa à região o índice espacial dos nós (carregado do disco ou
+        construído e persistido na primeira vez)
+        """
+        compacto = regiao['compacto']
+        indice = IndiceEspacial.carregar(self.store, chave, compacto)
+        if indice is None:
+            indice = IndiceEspacial.construir(compacto)
+            try:
+                indice.salvar(self.store, chave)
+            except OSError as e:
+                print(f"Erro ao salvar índice espacial em disco: {e}")
+        regiao['indice'] = indice
+
+    def _anexar_contracao(self, chave, regiao):
+        """
+        Anexa à região a contraction hierarchy persistida para o objetivo,
+        se houver (enquanto não houver, as consultas usam o CSR). A
+        hierarquia é gerada pelo comando preprocessar_grafos, fora dos workers.
+        """
+        regiao['ch'] = ContracaoHierarquica.carregar(self.store, chave, regiao['compacto'].versao, self.objetivo)
+        regiao['ch_verificada'] = time.time()
+
+    def _verificar_contracao(self, chave, regiao):
+        """
+        Procura de novo no disco, a cada GRAFOS_CONTRACAO_VERIFICAR_S, a
+        hierarquia de uma região em memória que ainda não a tem
+        """
+        if regiao['ch'] is None and time.time() - regiao['ch_verificada'] > GRAFOS_CONTRACAO_VERIFICAR_S:
+            self._anexar_contracao(chave, regiao)
+
+    def limpar_expirados(self):
+        agora = time.time()
+        with self._lock:
+            for chave in [c for c, r in self._regioes.items() if agora - r['timestamp'] > self.ttl]:
+                del self._regioes[chave]
+
+
+class SemGrafo:
+    """Sem grafo viário: todas as distâncias em linha reta"""
+    nome = 'linha_reta'
+
+    def obter_regiao(self, coordenadas):
+        return None
+
+    def carregar_persistidas(self, limite=None):
+        return []
+
+    def limpar_expirados(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Construtores de matriz
+# ---------------------------------------------------------------------------
+
+class MatrizGrafo:
+    """
+    Matrizes pelo grafo da região: paradas mapeadas para os nós mais
+    próximos pelo índice espacial e uma busca por parada no CSR ou na
+    contraction hierarchy, que devolve distância e tempo de percurso de
+    cada par. Pares já calculados em rotas anteriores vêm do cache de
+    distâncias (quando informado). Sem região, paradas fora da malha e pares
+    inalcançáveis usam a linha reta. Com usar_pool, as buscas rodam no pool
+    de processos.
+    """
+    nome = 'grafo'
+
+    def __init__(self, cache_distancias=None, usar_pool=False):
+        self.cache_distancias = cache_distancias
+        self.usar_pool = usar_pool
+
+    def localizar(self, coordenadas, regiao):
+        """
+        Nós do grafo de cada parada: {'nos', 'nos_osm', 'versao', 'fora_da_malha'}
+        (nos_osm None sem região)
+        """
+        if regiao is None:
+            return {'nos': None, 'nos_osm': None, 'versao': None, 'fora_da_malha': np.empty(0, dtype=np.int64)}
+        compacto = regiao['compacto']
+        nos, distancias_snap = regiao['indice'].mais_proximos(coordenadas)
+
+        # Pré-filtro: paradas longe demais do nó encontrado ficam fora da malha
+        fora_da_malha = np.flatnonzero(distancias_snap > SNAP_DISTANCIA_MAXIMA_M)
+        if len(fora_da_malha):
+            print(f"⚠️  {len(fora_da_malha)} parada(s) fora da malha viária, usando linha reta")
+        return {
+            'nos': nos.tolist(),
+            'nos_osm': compacto.nos_osm[nos].tolist(),
+            'versao': compacto.versao,
+            'fora_da_malha': fora_da_malha,
+        }
+
+    def _grafo(self, regiao, objetivo):
+        """Hierarquia da região, se construída para o objetivo, senão o CSR"""
+        ch = regiao.get('ch')
+        return ch if ch is not None and ch.objetivo == objetivo else regiao['csr']
+
+    def _matrizes(self, regiao, nos, linhas, objetivo, aguardar_vaga):
+        """
+        Buscas no grafo da região: no pool de processos, quando ativo e a
+        região estiver persistida, senão na thread atual
+        """
+        pool = get_pool_solver() if self.usar_pool else None
+        if pool is not None and 'diretorio' in regiao:
+            try:
+                return pool.matrizes(regiao, nos, linhas, objetivo, aguardar=aguardar_vaga)
+            except LookupError as e:
+                # Região que não pôde ser persistida: só existe neste processo
+                print(f"⚠️  {e}")
+        return self._grafo(regiao, objetivo).matrizes(nos, linhas=linhas, objetivo=objetivo)
+
+    def caminhos(self, regiao, pares, objetivo='distancia', aguardar_vaga=False):
+        """
+        Nós (índices da região) dos caminhos mínimos entre os pares de nós
+        informados, None nos inalcançáveis. Roda onde rodam as matrizes.
+        """
+        pool = get_pool_solver() if self.usar_pool else None
+        if pool is not None and 'diretorio' in regiao:
+            try:
+                return pool.caminhos(regiao, pares, objetivo, aguardar=aguardar_vaga)
+            except LookupError as e:
+                print(f"⚠️  {e}")
+        grafo = self._grafo(regiao, objetivo)
+        return [grafo.caminho(origem, destino, objetivo) for origem, destino in pares]
+
+    def construir(self, coordenadas, regiao, paradas, aguardar_vaga=False, objetivo='distancia'):
+        """
+        Matrizes de distâncias (metros) e de tempos (segundos) das paradas
+        localizadas por `localizar`, pelos caminhos que minimizam o
+        objetivo: {'distancias', 'tempos'}, listas de listas de int. As
+        matrizes são assimétricas (mãos únicas).
+        """
+        if regiao is None:
+            return matrizes_linha_reta(coordenadas)
+
+        nos, nos_osm, versao = paradas['nos'], paradas['nos_osm'], paradas['versao']
+        n = len(nos)
+        usar_cache = self.cache_distancias is not None
+        conhecidos = {}
+        linhas = None
+
+        if usar_cache:
+            pares = [(nos_osm[i], nos_osm[j]) for i in range(n) for j in range(n) if nos_osm[i] != nos_osm[j]]
+            conhecidos = self.cache_distancias.obter_muitos(versao, pares, objetivo)
+            linhas = sorted({
+                i for i in range(n) for j in range(n)
+                if nos_osm[i] != nos_osm[j] and (nos_osm[i], nos_osm[j]) not in conhecidos
+            })
+
+        # Só executa buscas para as origens que ainda têm pares desconhecidos
+        if linhas is None or linhas:
+            distancias, tempos = self._matrizes(regiao, nos, linhas, objetivo, aguardar_vaga)
+            if usar_cache:
+                novos = {
+                    (nos_osm[i], nos_osm[j]): (float(distancias[i][j]), float(tempos[i][j]))
+                    for i in linhas for j in range(n) if nos_osm[i] != nos_osm[j]
+                }
+                self.cache_distancias.salvar_muitos(versao, novos, objetivo)
+                conhecidos.update(novos)
+
+        matriz = np.zeros((n, n), dtype=np.float64)
+        matriz_tempos = np.zeros((n, n), dtype=np.float64)
+        for i in range(n):
+            for j in range(n):
+                if i == j:
+                    continue
+                if usar_cache:
+                    matriz[i][j], matriz_tempos[i][j] = conhecidos.get((nos_osm[i], nos_osm[j]), (0.0, 0.0))
+                else:
+                    matriz[i][j], matriz_tempos[i][j] = distancias[i][j], tempos[i][j]
+
+        # Fallback para linha reta (matriz haversine vetorizada, à velocidade média)
+        fora_da_malha = paradas['fora_da_malha']
+        if len(fora_da_malha):
+            matriz[fora_da_malha, :] = np.inf
+            matriz[:, fora_da_malha] = np.inf
+            np.fill_diagonal(matriz, 0.0)
+        inalcancaveis = np.isinf(matriz)
+        if inalcancaveis.any():
+            linha_reta = matriz_haversine(coordenadas)[inalcancaveis]
+            matriz[inalcancaveis] = linha_reta
+            matriz_tempos[inalcancaveis] = linha_reta / (VELOCIDADE_MEDIA_KMH / 3.6)
+
+        return {
+            'distancias': matriz.astype(np.int64).tolist(),
+            'tempos': matriz_tempos.astype(np.int64).tolist(),
+        }
+
+
+class MatrizHaversine:
+    """Matriz sempre em linha reta (ignora a região)"""
+    nome = 'linha_reta'
+
+    def localizar(self, coordenadas, regiao):
+        return {'nos': None, 'nos_osm': None, 'versao': None, 'fora_da_malha': np.empty(0, dtype=np.int64)}
+
+    def construir(self, coordenadas, regiao, paradas, aguardar_vaga=False, objetivo='distancia'):
+        return matrizes_linha_reta(coordenadas)
+
+
+# ---------------------------------------------------------------------------
+# Solvers do TSP
+# ---------------------------------------------------------------------------
+
+class SolverNativo:
+    """
+    Solver NumPy (rotas/solver.py): exato até SOLVER_EXATO_MAX_PONTOS,
+    senão vizinho mais próximo + 2-opt/Or-opt até o prazo
+    """
+    nome = 'nativo'
+
+    def resolver(self, matriz, max_ms=None):
+        return solver.resolver(matriz, max_ms if max_ms is not None else solver.SOLVER_MAX_MS)
+
+
+class SolverOrTools:
+    """
+    OR-Tools para rotas grandes sem prazo do cliente. Rotas pequenas são
+    resolvidas de forma exata (Held-Karp), sem montar o modelo do OR-Tools,
+    e com `max_ms` usa o modo anytime do solver nativo. O OR-Tools só é
+    importado na primeira rota que precisar dele.
+    """
+    nome = 'ortools'
+
+    def resolver(self, matriz, max_ms=None):
+        if max_ms is not None or len(matriz) <= solver.SOLVER_EXATO_MAX_PONTOS:
+            return solver.resolver(matriz, max_ms or 0)
+
+        try:
+            from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+        except ImportError as e:
+            print(f"⚠️  OR-Tools não disponível ({e}). Usando busca local.")
+            return solver.resolver(matriz)
+
+        inicio = time.perf_counter()
+        manager = pywrapcp.RoutingIndexManager(len(matriz), 1, 0)  # 1 veículo, início em 0
+        routing = pywrapcp.RoutingModel(manager)
+
+        def callback(from_index, to_index):
+            return matriz[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+        transit_callback_index = routing.RegisterTransitCallback(callback)
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+        # Estratégia balanceada para rotas maiores, com limite de 5 segundos
+        # que inclui o limite inferior (na fração final do prazo)
+        prazo, prazo_limite = solver.dividir_prazo(inicio, 5000)
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.SAVINGS
+        search_parameters.time_limit.FromMilliseconds(max(int(1000 * (prazo - time.perf_counter())), 1))
+        search_parameters.log_search = False
+
+        solution = routing.SolveWithParameters(search_parameters)
+        if not solution:
+            # Fallback: vizinho mais próximo + 2-opt/Or-opt
+            return solver.resolver(matriz)
+
+        index = routing.Start(0)
+        rota = []
+        while not routing.IsEnd(index):
+            rota.append(manager.IndexToNode(index))
+            index = solution.Value(routing.NextVar(index))
+        rota.append(rota[0])  # volta ao início
+
+        custo = solver.custo_rota(matriz, rota)
+        limite = solver.limite_inferior(matriz, custo, prazo=prazo_limite)
+        return {
+            'rota': rota,
+            'custo': custo,
+            'limite_inferior': limite,
+            'gap_percentual': solver.gap_percentual(custo, limite),
+            'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1),
+            'metodo': 'ortools',
+        }
+
+
+# ---------------------------------------------------------------------------
+# Motor
+# ---------------------------------------------------------------------------
+
+class MotorRotas:
+    """
+    Otimização de rotas (ordem de visita, distância, tempo e custo) sobre
+    backends plugáveis. Todos os caches são opcionais: None desliga. Com
+    usar_pool, o TSP é resolvido no pool de processos (rotas/processos.py).
+    O `objetivo` ('distancia' ou 'tempo') é a matriz minimizada pelo TSP.
+    """
+
+    def __init__(self, geocodificador, grafos, matriz, solver_tsp, cache_solucoes=None, usar_pool=False,
+                 objetivo=ROTAS_OBJETIVO):
+        self.geocodificador = geocodificador
+        self.grafos = grafos
+        self.matriz = matriz
+        self.solver = solver_tsp
+        self.cache_solucoes = cache_solucoes
+        self.usar_pool = usar_pool
+        self.objetivo = objetivo
+        self.parametros_custo = dict(PARAMETROS_CUSTO, objetivo=objetivo)
+
+        # Cache para preços de combustível
+        self._precos_cache = {}
+        self._precos_ttl = 30 * 60  # 30 minutos em segundos
+
+        # Contador para limpeza periódica de cache
+        self._cache_cleanup_counter = 0
+
+    @property
+    def backends(self):
+        return {
+            'grafos': self.grafos.nome,
+            'matriz': self.matriz.nome,
+            'solver': self.solver.nome,
+            'objetivo': self.objetivo,
+        }
+
+    def estatisticas(self):
+        """
+        Backends, fila do pool de processos e contadores dos caches do processo atual
+        """
+        pool = get_pool_solver() if self.usar_pool else None
+        store = getattr(self.geocodificador, 'store', None)
+        cache_distancias = getattr(self.matriz, 'cache_distancias', None)
+        return {
+            'backends': self.backends,
+            'pool': pool.estatisticas() if pool is not None else None,
+            'geocodificacao': store.estatisticas() if store is not None else None,
+            'distancias': cache_distancias.estatisticas() if cache_distancias is not None else None,
+            'solucoes': self.cache_solucoes.estatisticas() if self.cache_solucoes is not None else None,
+        }
+
+    # -- combustível e custo ------------------------------------------------
+
+    def obter_preco_combustivel(self, tipo_combustivel):
+        """
+        Retorna preços de combustível com cache
+        """
+        cache_key = f"preco_{tipo_combustivel}"
+        if cache_key in self._precos_cache:
+            cached_data = self._precos_cache[cache_key]
+            if time.time() - cached_data['timestamp'] < self._precos_ttl:
+                return cached_data['preco']
+
+        preco = PRECOS_COMBUSTIVEL.get(tipo_combustivel, 5.80)
+        self._precos_cache[cache_key] = {
+            'preco': preco,
+            'timestamp': time.time()
+        }
+        return preco
+
+    def calcular_consumo_combustivel(self, distancia_total_km, veiculo):
+        """
+        Calcula o consumo de combustível baseado no tipo de combustível
+        """
+        if not veiculo:
+            # Veículo padrão: gasolina com 8.0 km/L
+            return float(distancia_total_km) / 8.0, 'litros'
+
+        eficiencia = float(veiculo.eficiencia_km_l)
+        if veiculo.tipo_combustivel == 'gnv':
+            # Para GNV: eficiência em km/m³
+            return float(distancia_total_km) / eficiencia, 'metros_cubicos'
+        # Para outros combustíveis: eficiência em km/L
+        return float(distancia_total_km) / eficiencia, 'litros'
+
+    def calcular_valor_rota(self, distancia_total_km, veiculo, preco_combustivel_personalizado=None):
+        """
+        Calcula o valor da rota baseado no consumo de combustível e preço
+        """
+        consumo_combustivel, _ = self.calcular_consumo_combustivel(distancia_total_km, veiculo)
+        if preco_combustivel_personalizado is not None:
+            preco_combustivel = float(preco_combustivel_personalizado)
+        else:
+            tipo_combustivel = veiculo.tipo_combustivel if veiculo else 'gasolina'
+            preco_combustivel = self.obter_preco_combustivel(tipo_combustivel)
+        return consumo_combustivel * preco_combustivel, preco_combustivel
+
+    # -- geocodificação -----------------------------------------------------
+
+    def geocodificar_endereco(self, endereco):
+        """Geocodifica um único endereço"""
+        return self.geocodificador.geocodificar(endereco)
+
+    def geocodificar_enderecos(self, enderecos):
+        """
+        Geocodifica vários endereços em lote (deduplicados, em paralelo e com cache)
+        """
+        return self.geocodificador.geocodificar_lote(enderecos)
+
+    def geocodificar_usuario(self, usuario):
+        """
+        Localiza o endereço cadastrado da empresa pelos campos estruturados
+        (CEP, rua, bairro e cidade) no gazetteer local, sem extrair o CEP do
+        texto de endereco_completo(). None sem gazetteer ou sem correspondência.
+        """
+        gazetteer = getattr(self.geocodificador, 'gazetteer', None)
+        return gazetteer.localizar_usuario(usuario) if gazetteer is not None else None
+
+    # -- distâncias e link ----------------------------------------------------
+
+    def calcular_distancia_real(self, matrizes, rota_otimizada):
+        """
+        Distância total (km) e tempo estimado (minutos) da rota pelas
+        matrizes de distâncias e de tempos ({'distancias', 'tempos'}),
+        incluindo o retorno à origem (empresa)
+        """
+        if len(rota_otimizada) < 2:
+            return 0, 0
+
+        distancia_total_km = solver.custo_rota(matrizes['distancias'], rota_otimizada) / 1000
+        tempo_percurso_s = solver.custo_rota(matrizes['tempos'], rota_otimizada)
+        if len(rota_otimizada) > 2 and rota_otimizada[0] == rota_otimizada[-1]:
+            # Rota completa com retorno à origem
+            num_paradas = len(rota_otimizada) - 2  # -2 porque origem e retorno contam como 1
+        else:
+            num_paradas = len(rota_otimizada) - 1
+
+        # Tempo estimado: percurso pela matriz de tempos + tempo de parada
+        tempo_estimado_minutos = int(tempo_percurso_s / 60) + num_paradas * TEMPO_PARADA_MINUTOS
+        return distancia_total_km, tempo_estimado_minutos
+
+    def _custos(self, matrizes):
+        """Matriz minimizada pelo TSP (distâncias ou tempos, pelo objetivo)"""
+        return matrizes['tempos' if self.objetivo == 'tempo' else 'distancias']
+
+    def _limite_inferior(self, limite):
+        """Limite inferior do TSP na unidade do objetivo (km ou minutos; None sem limite)"""
+        if self.objetivo == 'tempo':
+            return {'limite_inferior_min': round(limite / 60, 1) if limite is not None else None}
+        return {'limite_inferior_km': round(limite / 1000, 2) if limite is not None else None}
+
+    def gerar_link_maps(self, coordenadas_otimizadas):
+        """
+        Gera link do Google Maps com a rota otimizada
+        Garante que o destino seja a origem (empresa) para mostrar o retorno
+        """
+        if not coordenadas_otimizadas:
+            return ""
+
+        # Remove o retorno duplicado à origem (o destino do link já é a origem)
+        if len(coordenadas_otimizadas) > 1 and coordenadas_otimizadas[0] == coordenadas_otimizadas[-1]:
+            coordenadas_para_link = coordenadas_otimizadas[:-1]
+        else:
+            coordenadas_para_link = coordenadas_otimizadas
+
+        origem = f"{coordenadas_para_link[0][0]},{coordenadas_para_link[0][1]}"
+        waypoints = "|".join(f"{lat},{lon}" for lat, lon in coordenadas_para_link[1:])
+
+        link = f"https://www.google.com/maps/dir/?api=1&origin={origem}&destination={origem}"
+        if waypoints:
+            link += f"&waypoints={waypoints}"
+        return link
+
+    def _limpar_cache_expirado(self):
+        """
+        Remove entradas expiradas dos caches para evitar vazamento de memória
+        """
+        store = getattr(self.geocodificador, 'store', None)
+        if store is not None:
+            store.limpar_expirados()
+        if self.cache_solucoes is not None:
+            self.cache_solucoes.limpar_expirados()
+        self.grafos.limpar_expirados()
+
+        agora = time.time()
+        for chave in [c for c, d in self._precos_cache.items() if agora - d['timestamp'] > self._precos_ttl]:
+            del self._precos_cache[chave]
+
+    # -- otimização -----------------------------------------------------------
+
+    def _resolver(self, matriz, max_ms=None, aguardar_vaga=False):
+        """
+        Resolve o TSP no pool de processos (quando ativo). Se o job exceder
+        o tempo limite ou for interrompido pela reciclagem do pool, usa a
+        solução rápida do solver nativo nesta thread.
+        """
+        pool = get_pool_solver() if self.usar_pool else None
+        if pool is None:
+            return self.solver.resolver(matriz, max_ms)
+        try:
+            return pool.resolver(self.solver, matriz, max_ms, aguardar=aguardar_vaga)
+        except TimeoutError:
+            print(f"⚠️  Tempo limite do pool excedido ({pool.timeout_s}s), usando vizinho mais próximo")
+            return solver.resolver(matriz, 0)
+        except BrokenProcessPool:
+            print("⚠️  Pool de processos reciclado durante o job, usando vizinho mais próximo")
+            return solver.resolver(matriz, 0)
+
+    def _matriz_paradas(self, coordenadas):
+        """
+        Matrizes de distâncias (metros) e de tempos (segundos) entre
+        coordenadas já geocodificadas. Retorna {'distancias', 'tempos',
+        'nos_osm', 'versao'}; se o grafo falhar, as matrizes são em linha reta.
+        """
+        regiao = self.grafos.obter_regiao(coordenadas) if len(coordenadas) > 1 else None
+        try:
+            paradas = self.matriz.localizar(coordenadas, regiao)
+            matrizes = self.matriz.construir(coordenadas, regiao, paradas, objetivo=self.objetivo)
+        except PoolSaturado:
+            raise
+        except Exception as e:
+            print(f"Erro ao processar grafo: {e}")
+            paradas = MatrizHaversine().localizar(coordenadas, None)
+            matrizes = MatrizHaversine().construir(coordenadas, None, paradas)
+        return dict(paradas, **matrizes)
+
+    def _matriz_da_cacheada(self, coordenadas, regiao, paradas, ordem, aguardar_vaga=False):
+        """
+        Matriz na ordem de visita de uma solução do cache de soluções, para
+        que a rota salva possa ser editada sem recalculá-la. Vem do cache de
+        distâncias, que já tem os pares da solução (sem ele, das buscas no
+        grafo). None se falhar.
+        """
+        try:
+            matrizes = self.matriz.construir(coordenadas, regiao, paradas, aguardar_vaga, self.objetivo)
+        except Exception as e:
+            print(f"⚠️  Matriz da solução em cache não montada: {e}")
+            return None
+        return matriz_na_ordem(dict(matrizes, nos_osm=paradas['nos_osm'], versao=paradas['versao']), ordem)
+
+    def _geometria(self, coordenadas, ordem, regiao=None, paradas=None, aguardar_vaga=False):
+        """
+        Traçado da rota pelas vias como polyline codificada (simplificada):
+        o caminho mínimo de cada trecho entre paradas consecutivas, com as
+        coordenadas das paradas nas pontas. Trechos fora da malha ou sem
+        caminho ficam em linha reta. Retorna None se a geometria estiver
+        desligada (ROTAS_GEOMETRIA) ou falhar.
+        """
+        if not ROTAS_GEOMETRIA or len(ordem) < 2:
+            return None
+        try:
+            if regiao is None:
+                regiao = self.grafos.obter_regiao(coordenadas)
+            if regiao is not None and (paradas is None or paradas.get('nos') is None):
+                paradas = self.matriz.localizar(coordenadas, regiao)
+
+            trechos = list(zip(ordem, ordem[1:]))
+            caminhos = [None] * len(trechos)
+            if regiao is not None and paradas.get('nos') is not None:
+                nos = paradas['nos']
+                fora_da_malha = set(paradas['fora_da_malha'].tolist())
+                calcular = [
+                    k for k, (a, b) in enumerate(trechos)
+                    if a not in fora_da_malha and b not in fora_da_malha and nos[a] != nos[b]
+                ]
+                if calcular:
+                    pares = [(nos[trechos[k][0]], nos[trechos[k][1]]) for k in calcular]
+                    for k, caminho in zip(calcular, self.matriz.caminhos(regiao, pares, self.objetivo, aguardar_vaga)):
+                        caminhos[k] = caminho
+
+            pontos = [coordenadas[ordem[0]]]
+            for (_, b), caminho in zip(trechos, caminhos):
+                if caminho:
+                    compacto = regiao['compacto']
+                    pontos.extend(zip(
+                        np.asarray(compacto.nos_lat)[caminho].tolist(),
+                        np.asarray(compacto.nos_lon)[caminho].tolist(),
+                    ))
+                pontos.append(coordenadas[b])
+            return codificar_polyline(simplificar(pontos))
+        except Exception as e:
+            print(f"Erro ao gerar geometria da rota: {e}")
+            return None
+
+    def _resultado(self, enderecos, coordenadas, ordem, distancia_total_km, tempo_estimado_minutos,
+                   veiculo, preco_combustivel_personalizado, qualidade, matriz=None, geometria=None):
+        """
+        Monta o resultado de otimizar_rota / adicionar_parada / remover_parada
+        a partir da ordem de visita (rota fechada na origem)
+        """
+        coordenadas_otimizadas = [list(coordenadas[i]) for i in ordem]
+        valor_rota, preco_combustivel = self.calcular_valor_rota(
+            distancia_total_km, veiculo, preco_combustivel_personalizado
+        )
+        return {
+            'enderecos_otimizados': [enderecos[i] for i in ordem],
+            'coordenadas_otimizadas': coordenadas_otimizadas,  # Inclui retorno à origem
+            'distancia_total_km': distancia_total_km,
+            'tempo_estimado_minutos': tempo_estimado_minutos,
+            'valor_rota': valor_rota,
+            'preco_combustivel_usado': preco_combustivel,
+            'link_maps': self.gerar_link_maps(coordenadas_otimizadas),
+            'qualidade': qualidade,
+            'matriz': matriz,
+            'geometria': geometria,
+            'sucesso': True
+        }
+
+    def otimizar_rota(self, enderecos, veiculo=None, produtos_quantidades=None, preco_combustivel_personalizado=None,
+                      max_ms=None, aguardar_vaga=False, usuario=None):
+        """
+        Otimiza a ordem de visita. enderecos[0] é a origem (empresa), onde a
+        rota começa e termina; com `usuario`, a origem é localizada pelos
+        campos do cadastro antes do texto. `max_ms` é o prazo do cliente para a
+        resolução do TSP (modo anytime). Com o pool de processos cheio, o
+        resultado vem com 'ocupado' (ou, com aguardar_vaga, espera a vaga).
+        """
+        try:
+            # Limpeza periódica de cache (a cada 10 otimizações)
+            self._cache_cleanup_counter += 1
+            if self._cache_cleanup_counter % 10 == 0:
+                self._limpar_cache_expirado()
+
+            # 1. Geocodifica todos os endereços em lote (com cache); a origem,
+            # quando possível, pelos campos estruturados do cadastro
+            origem = self.geocodificar_usuario(usuario) if usuario is not None and enderecos else None
+            if origem is not None:
+                coordenadas = [origem] + self.geocodificar_enderecos(enderecos[1:])
+            else:
+                coordenadas = self.geocodificar_enderecos(enderecos)
+            if None in coordenadas:
+                return {
+                    'sucesso': False,
+                    'erro': 'Não foi possível geocodificar todos os endereços'
+                }
+            if len(coordenadas) < 2:
+                return self._resultado(enderecos, coordenadas, [0], 0, 0, veiculo,
+                                       preco_combustivel_personalizado, {'metodo': 'exato'})
+
+            # 2. Região do grafo e nós das paradas (índice espacial)
+            regiao = self.grafos.obter_regiao(coordenadas)
+            try:
+                paradas = self.matriz.localizar(coordenadas, regiao)
+            except Exception as e:
+                print(f"Erro ao processar grafo: {e}")
+                regiao = None
+                paradas = MatrizHaversine().localizar(coordenadas, None)
+            nos_osm, versao = paradas['nos_osm'], paradas['versao']
+
+            # 3. Cache de soluções (mesmo depósito e mesmo conjunto de paradas, em
+            # qualquer ordem). Paradas fora da malha usam coordenadas, então esses
+            # pedidos não entram no cache.
+            chave_cache = None
+            if self.cache_solucoes is not None and nos_osm is not None and not len(paradas['fora_da_malha']):
+                chave_cache = chave_solucao(versao, nos_osm[0], nos_osm[1:], self.parametros_custo)
+                cacheada = self.cache_solucoes.obter(chave_cache)
+                ordem = reordenar(nos_osm, cacheada['nos']) if cacheada is not None else None
+                if ordem is not None:
+                    ordem.append(ordem[0])
+                    return self._resultado(
+                        enderecos, coordenadas, ordem,
+                        cacheada['distancia_m'] / 1000, cacheada['tempo_minutos'],
+                        veiculo, preco_combustivel_personalizado,
+                        dict(cacheada['qualidade'] or {}, cache=True),
+                        self._matriz_da_cacheada(coordenadas, regiao, paradas, ordem, aguardar_vaga),
+                        geometria=self._geometria(coordenadas, ordem, regiao, paradas, aguardar_vaga),
+                    )
+
+            # 4. Matrizes de distâncias e de tempos, nas mesmas buscas
+            # (contraction hierarchy, CSR ou linha reta)
+            try:
+                matrizes = self.matriz.construir(coordenadas, regiao, paradas, aguardar_vaga, self.objetivo)
+            except PoolSaturado:
+                raise
+            except Exception as e:
+                print(f"Erro ao processar grafo: {e}")
+                chave_cache = None
+                paradas = MatrizHaversine().localizar(coordenadas, None)
+                nos_osm, versao = None, None
+                matrizes = MatrizHaversine().construir(coordenadas, None, paradas)
+
+            # 5. Resolve o TSP na matriz do objetivo
+            solucao = self._resolver(self._custos(matrizes), max_ms, aguardar_vaga)
+            ordem = solucao['rota']
+
+            # 6. Distância e tempo pelas matrizes
+            distancia_total_km, tempo_estimado_minutos = self.calcular_distancia_real(matrizes, ordem)
+            qualidade = {
+                'metodo': solucao['metodo'],
+                'objetivo': self.objetivo,
+                'gap_percentual': solucao['gap_percentual'],
+                **self._limite_inferior(solucao['limite_inferior']),
+                'tempo_ms': solucao['tempo_ms'],
+                'distancias': 'grafo' if nos_osm is not None else 'linha_reta',
+            }
+            if chave_cache is not None:
+                self.cache_solucoes.salvar(
+                    chave_cache, versao, [nos_osm[i] for i in ordem[:-1]],
+                    distancia_total_km * 1000, tempo_estimado_minutos, qualidade
+                )
+
+            matriz_rota = matriz_na_ordem({
+                'distancias': matrizes['distancias'],
+                'tempos': matrizes['tempos'],
+                'nos_osm': nos_osm,
+                'versao': versao,
+            }, ordem)
+            return self._resultado(
+                enderecos, coordenadas, ordem, distancia_total_km, tempo_estimado_minutos,
+                veiculo, preco_combustivel_personalizado, qualidade, matriz_rota,
+                geometria=self._geometria(coordenadas, ordem, regiao, paradas, aguardar_vaga),
+            )
+
+        except PoolSaturado as e:
+            print(f"⚠️  {e}")
+            return {
+                'sucesso': False,
+                'erro': str(e),
+                'ocupado': True
+            }
+        except Exception as e:
+            print(f"Erro na otimização da rota: {e}")
+            return {
+                'sucesso': False,
+                'erro': str(e)
+            }
+
+    # -- edição de rotas salvas -------------------------------------------------
+
+    def _paradas_da_rota(self, rota):
+        """
+        Endereços e coordenadas da rota salva na ordem de visita, sem o
+        retorno final à origem
+        """
+        enderecos = list(rota.enderecos_otimizados)
+        coordenadas = [tuple(coordenada) for coordenada in rota.coordenadas_otimizadas]
+        if len(coordenadas) > 1 and coordenadas[-1] == coordenadas[0]:
+            enderecos, coordenadas = enderecos[:-1], coordenadas[:-1]
+        return enderecos, coordenadas
+
+    def _reotimizar(self, rota, enderecos, coordenadas, paradas, ordem, max_ms=None):
+        """
+        Aplica a busca local a partir de `ordem` (rota fechada em índices de
+        `coordenadas`) e recalcula distância, tempo, valor e link da rota.
+        A ordem atual já é uma boa solução, então o prazo padrão é curto; o
+        limite inferior é calculado dentro do mesmo prazo.
+        `paradas` é o retorno de _matriz_paradas.
+        """
+        inicio = time.perf_counter()
+        matriz = self._custos(paradas)
+        prazo, prazo_limite = solver.dividir_prazo(inicio, max_ms if max_ms is not None else ROTAS_EDICAO_MAX_MS)
+        ordem, melhorias = solver.busca_local(matriz, ordem, prazo)
+
+        distancia_total_km, tempo_estimado_minutos = self.calcular_distancia_real(paradas, ordem)
+        custo = solver.custo_rota(matriz, ordem)
+        limite = solver.limite_inferior(matriz, custo, prazo=prazo_limite)
+        qualidade = {
+            'metodo': 'incremental',
+            'objetivo': self.objetivo,
+            'gap_percentual': solver.gap_percentual(custo, limite),
+            **self._limite_inferior(limite),
+            'melhorias': melhorias,
+            'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1),
+        }
+        return self._resultado(
+            enderecos, coordenadas, ordem, distancia_total_km, tempo_estimado_minutos,
+            rota.veiculo, rota.preco_combustivel_usado, qualidade,
+            matriz_na_ordem(paradas, ordem),
+            geometria=self._geometria(coordenadas, ordem, paradas=paradas),
+        )
+
+    def adicionar_parada(self, rota, endereco, max_ms=None):
+        """
+        Insere uma parada na rota salva sem reotimizar do zero: a nova
+        parada entra na posição de menor acréscimo de distância e a ordem
+        passa por uma busca local curta. Só o novo endereço é geocodificado
+        e as distâncias entre as paradas existentes vêm do cache de pares.
+        """
+        try:
+            enderecos, coordenadas = self._paradas_da_rota(rota)
+            coordenada = self.geocodificar_endereco(endereco)
+            if coordenada is None:
+                return {
+                    'sucesso': False,
+                    'erro': 'Não foi possível geocodificar o endereço'
+                }
+            enderecos.append(endereco)
+            coordenadas.append(tuple(coordenada))
+
+            paradas = self._matriz_paradas(coordenadas)
+            ordem = solver.insercao_mais_barata(
+                self._custos(paradas), list(range(len(coordenadas) - 1)) + [0], len(coordenadas) - 1
+            )
+            return self._reotimizar(rota, enderecos, coordenadas, paradas, ordem, max_ms)
+        except PoolSaturado as e:
+            return {
+                'sucesso': False,
+                'erro': str(e),
+                'ocupado': True
+            }
+        except Exception as e:
+            print(f"Erro ao adicionar parada à rota {rota.id}: {e}")
+            return {
+                'sucesso': False,
+                'erro': str(e)
+            }
+
+    def remover_parada(self, rota, indice, max_ms=None):
+        """
+        Remove a parada na posição `indice` de enderecos_otimizados (a origem,
+        posição 0, não pode ser removida) e reaplica a busca local curta
+        """
+        try:
+            enderecos, coordenadas = self._paradas_da_rota(rota)
+            if not 1 <= indice < len(enderecos):
+                return {
+                    'sucesso': False,
+                    'erro': f'Parada {indice} não existe na rota'
+                }
+            if len(enderecos) <= 2:
+                return {
+                    'sucesso': False,
+                    'erro': 'A rota precisa manter ao menos uma parada'
+                }
+            # A matriz salva com a rota já tem as distâncias entre as paradas restantes
+            salva = carregar_matriz_rota(rota)
+            if salva is not None and len(salva['distancias']) == len(enderecos):
+                restantes = [i for i in range(len(enderecos)) if i != indice]
+                paradas = matriz_na_ordem(salva, restantes)
+                paradas['distancias'] = paradas['distancias'].tolist()
+                paradas['tempos'] = paradas['tempos'].tolist()
+            else:
+                paradas = None
+            del enderecos[indice]
+            del coordenadas[indice]
+            if paradas is None:
+                paradas = self._matriz_paradas(coordenadas)
+            ordem = list(range(len(coordenadas))) + [0]
+            return self._reotimizar(rota, enderecos, coordenadas, paradas, ordem, max_ms)
+        except PoolSaturado as e:
+            return {
+                'sucesso': False,
+                'erro': str(e),
+                'ocupado': True
+            }
+        except Exception as e:
+            print(f"Erro ao remover parada da rota {rota.id}: {e}")
+            return {
+                'sucesso': False,
+                'erro': str(e)
+            }
+
+
+def criar_motor(solver_tsp=None, grafos=None, geocodificador=None, usar_caches=True,
+                usar_pool=ROTAS_POOL_PROCESSOS > 0, objetivo=ROTAS_OBJETIVO):
+    """
+    Monta o motor com os backends escolhidos por ROTAS_SOLVER / ROTAS_GRAFOS
+    ou, em 'auto', pelas capacidades detectadas. Os argumentos substituem
+    backends específicos (benchmark e testes); com usar_caches=False não há
+    cache de pares de distâncias nem de soluções (nada é gravado no banco) e
+    com usar_pool=False matriz e TSP são calculados na thread da requisição.
+    """
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f'Objetivo inválido: {objetivo} (use {" ou ".join(OBJETIVOS)})')
+    capacidades = get_capacidades()
+
+    if solver_tsp is None:
+        escolha = ROTAS_SOLVER
+        if escolha == 'auto':
+            escolha = 'ortools' if capacidades['ortools'] else 'nativo'
+        solver_tsp = SolverOrTools() if escolha == 'ortools' else SolverNativo()
+
+    if grafos is None:
+        grafos = SemGrafo() if ROTAS_GRAFOS == 'linha_reta' else ProvedorLadrilhos(
+            baixar=capacidades['download_grafos'], objetivo=objetivo
+        )
+
+    return MotorRotas(
+        geocodificador=geocodificador or get_geocodificador(),
+        grafos=grafos,
+        matriz=MatrizGrafo(get_cache_distancias() if usar_caches else None, usar_pool=usar_pool),
+        solver_tsp=solver_tsp,
+        cache_solucoes=get_cache_solucoes() if usar_caches else None,
+        usar_pool=usar_pool,
+        objetivo=objetivo,
+    )
+
+
+# Instância singleton para reutilizar caches entre requisições (e entre os jobs)
+_motor = None
+_motor_lock = threading.Lock()
+
+
+def get_motor_rotas():
+    """Retorna instância singleton do motor de rotas"""
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            _motor = criar_motor()
+            print(f"🚚 Motor de rotas: {_motor.backends}")
+    return _motor
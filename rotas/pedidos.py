@@ -0,0 +1,240 @@
+# Regras do pedido de rota compartilhadas pela view síncrona e pelos jobs
+from decimal import Decimal
+
+from django.db import transaction
+
+from produtos.models import Produto, MovimentacaoEstoque
+from .matrizes import salvar_matriz_rota
+from .models import Rota, RotaMatriz, Veiculo
+
+
+class ErroPedidoRota(Exception):
+    """Pedido de rota inválido (a mensagem é devolvida ao cliente)"""
+
+
+def validar_pedido(usuario, dados):
+    """
+    Valida veículo, produtos e quantidades de um pedido de rota.
+    Retorna (veiculo, produtos_validados) ou lança ErroPedidoRota.
+    """
+    veiculo_id = dados.get('veiculo_id')
+
+    # Verifica se o veículo pertence ao usuário (se fornecido)
+    veiculo = None
+    if veiculo_id:
+        try:
+            veiculo = Veiculo.objects.get(id=veiculo_id, usuario=usuario)
+        except Veiculo.DoesNotExist:
+            raise ErroPedidoRota('Veículo não encontrado ou não pertence ao usuário')
+
+    return veiculo, validar_produtos(usuario, dados['produtos_quantidades'])
+
+
+def validar_produtos(usuario, produtos_quantidades):
+    """
+    Valida produtos e quantidades (consulta em lote) e confere o estoque.
+    Retorna a lista de {'produto', 'quantidade'} ou lança ErroPedidoRota.
+    """
+    # Extrai IDs dos produtos para consulta em lote
+    produto_ids = [item.get('produto_id') for item in produtos_quantidades if item.get('produto_id')]
+    quantidades = [item.get('quantidade', 0) for item in produtos_quantidades]
+
+    # Validações básicas
+    if not produto_ids or any(q <= 0 for q in quantidades):
+        raise ErroPedidoRota('Produto ID e quantidade são obrigatórios e quantidade deve ser > 0')
+
+    # Consulta em lote todos os produtos
+    try:
+        produtos_dict = Produto.objects.filter(idProduto__in=produto_ids, usuario=usuario).in_bulk()
+    except Exception as e:
+        raise ErroPedidoRota(f'Erro na validação de produtos: {str(e)}')
+
+    produtos_validados = []
+    for item in produtos_quantidades:
+        produto_id = item.get('produto_id')
+        quantidade = item.get('quantidade', 0)
+
+        if produto_id not in produtos_dict:
+            raise ErroPedidoRota(f'Produto com ID {produto_id} não encontrado')
+
+        produto = produtos_dict[produto_id]
+        if produto.estoque_atual < quantidade:
+            raise ErroPedidoRota(
+                f'Estoque insuficiente para o produto {produto.nome}. Disponível: {produto.estoque_atual}'
+            )
+
+        produtos_validados.append({
+            'produto': produto,
+            'quantidade': quantidade
+        })
+
+    return produtos_validados
+
+
+def montar_enderecos(usuario, dados):
+    """
+    Endereços da rota: a empresa (origem) seguida dos destinos.
+    A rota sempre começa e termina na empresa.
+    """
+    return [usuario.endereco_completo()] + list(dados['enderecos_destino'])
+
+
+def criar_rota(usuario, resultado, veiculo, nome_motorista, produtos_quantidades):
+    """
+    Cria a Rota a partir do resultado de MotorRotas.otimizar_rota
+    (com a matriz usada na otimização, quando houver)
+    """
+    rota = Rota.objects.create(
+        enderecos_otimizados=resultado['enderecos_otimizados'],
+        coordenadas_otimizadas=resultado['coordenadas_otimizadas'],
+        distancia_total_km=resultado['distancia_total_km'],
+        tempo_estimado_minutos=resultado['tempo_estimado_minutos'],
+        veiculo=veiculo,
+        nome_motorista=nome_motorista if nome_motorista else None,
+        valor_rota=resultado['valor_rota'],
+        preco_combustivel_usado=resultado['preco_combustivel_usado'],
+        produtos_quantidades=produtos_quantidades,
+        link_maps=resultado['link_maps'],
+        geometria=resultado.get('geometria'),
+        qualidade_otimizacao=resultado.get('qualidade'),
+        usuario=usuario
+    )
+    if resultado.get('matriz'):
+        salvar_matriz_rota(rota, **resultado['matriz'])
+    return rota
+
+
+def observacao_saida(rota):
+    motorista_info = rota.nome_motorista if rota.nome_motorista else 'Sem motorista'
+    return f'Saída para rota {rota.id} - {motorista_info}'
+
+
+def baixar_estoque(usuario, produtos_validados, observacao):
+    """
+    Dá saída no estoque dos produtos do pedido, registrando as movimentações.
+    As linhas dos produtos são bloqueadas e o estoque é conferido de novo,
+    já que outro pedido pode ter consumido o saldo após a validação.
+    Retorna as movimentações criadas.
+    """
+    with transaction.atomic():
+        ids = [item['produto'].idProduto for item in produtos_validados]
+        produtos = Produto.objects.select_for_update().filter(idProduto__in=ids).in_bulk()
+        movimentacoes = []
+        for item in produtos_validados:
+            produto = produtos[item['produto'].idProduto]
+            quantidade = item['quantidade']
+            if produto.estoque_atual < quantidade:
+                raise ErroPedidoRota(
+                    f'Estoque insuficiente para o produto {produto.nome}. Disponível: {produto.estoque_atual}'
+                )
+            estoque_anterior = produto.estoque_atual
+            produto.estoque_atual -= quantidade
+            produto.save()
+
+            # Registra movimentação de estoque
+            movimentacoes.append(MovimentacaoEstoque.objects.create(
+                produto=produto,
+                tipo='saida',
+                quantidade=quantidade,
+                estoque_anterior=estoque_anterior,
+                estoque_atual=produto.estoque_atual,
+                observacao=observacao,
+                usuario=usuario
+            ))
+        return movimentacoes
+
+
+def devolver_estoque(usuario, reservas, observacao):
+    """
+    Devolve ao estoque as quantidades reservadas (movimentações de entrada).
+    `reservas` é uma lista de {'produto_id': ..., 'quantidade': ...}.
+    """
+    with transaction.atomic():
+        ids = [reserva['produto_id'] for reserva in reservas]
+        produtos = Produto.objects.select_for_update().filter(idProduto__in=ids).in_bulk()
+        for reserva in reservas:
+            produto = produtos.get(reserva['produto_id'])
+            if produto is None:
+                continue
+            estoque_anterior = produto.estoque_atual
+            produto.estoque_atual += reserva['quantidade']
+            produto.save()
+            MovimentacaoEstoque.objects.create(
+                produto=produto,
+                tipo='entrada',
+                quantidade=reserva['quantidade'],
+                estoque_anterior=estoque_anterior,
+                estoque_atual=produto.estoque_atual,
+                observacao=observacao,
+                usuario=usuario
+            )
+
+
+def somar_produtos(produtos_quantidades, itens, sinal=1):
+    """
+    Soma (sinal=1) ou subtrai (sinal=-1) `itens` da lista de produtos da
+    rota, agrupando por produto_id. Produtos zerados saem da lista.
+    Lança ErroPedidoRota ao subtrair mais do que a rota leva.
+    """
+    totais = {}
+    for item in produtos_quantidades:
+        totais[item['produto_id']] = totais.get(item['produto_id'], 0) + item['quantidade']
+    for item in itens:
+        produto_id = item['produto_id']
+        if not produto_id or not item['quantidade'] or item['quantidade'] <= 0:
+            raise ErroPedidoRota('Produto ID e quantidade são obrigatórios e quantidade deve ser > 0')
+        total = totais.get(produto_id, 0) + sinal * item['quantidade']
+        if total < 0:
+            raise ErroPedidoRota(f'A rota não leva {item["quantidade"]} unidade(s) do produto {produto_id}')
+        totais[produto_id] = total
+    return [
+        {'produto_id': produto_id, 'quantidade': quantidade}
+        for produto_id, quantidade in totais.items() if quantidade > 0
+    ]
+
+
+def atualizar_paradas(usuario, rota, resultado, produtos_adicionados=None, produtos_devolvidos=None):
+    """
+    Grava a rota reotimizada após adicionar ou remover uma parada e ajusta
+    o estoque numa única transação: saída dos produtos da nova parada
+    (validados por validar_produtos) e devolução dos produtos da parada
+    removida ({'produto_id', 'quantidade'}).
+    """
+    produtos_adicionados = produtos_adicionados or []
+    produtos_devolvidos = produtos_devolvidos or []
+    with transaction.atomic():
+        # Bloqueia a rota para que duas edições simultâneas não se sobrescrevam
+        atual = Rota.objects.select_for_update().get(pk=rota.pk)
+        if atual.status != 'em_progresso':
+            raise ErroPedidoRota('Só é possível alterar paradas de rotas em progresso')
+        if atual.enderecos_otimizados != rota.enderecos_otimizados:
+            raise ErroPedidoRota('A rota foi alterada por outra requisição, tente novamente')
+        rota = atual
+        produtos_quantidades = somar_produtos(rota.produtos_quantidades, [
+            {'produto_id': item['produto'].idProduto, 'quantidade': item['quantidade']}
+            for item in produtos_adicionados
+        ])
+        produtos_quantidades = somar_produtos(produtos_quantidades, produtos_devolvidos, sinal=-1)
+
+        rota.enderecos_otimizados = resultado['enderecos_otimizados']
+        rota.coordenadas_otimizadas = resultado['coordenadas_otimizadas']
+        rota.distancia_total_km = round(Decimal(str(resultado['distancia_total_km'])), 2)
+        rota.tempo_estimado_minutos = resultado['tempo_estimado_minutos']
+        rota.valor_rota = round(Decimal(str(resultado['valor_rota'])), 2)
+        rota.produtos_quantidades = produtos_quantidades
+        rota.link_maps = resultado['link_maps']
+        rota.geometria = resultado.get('geometria')
+        rota.qualidade_otimizacao = resultado.get('qualidade')
+        rota.save()
+
+        # A matriz salva precisa acompanhar as paradas da rota
+        if resultado.get('matriz'):
+            salvar_matriz_rota(rota, **resultado['matriz'])
+        else:
+            RotaMatriz.objects.filter(rota=rota).delete()
+
+        if produtos_adicionados:
+            baixar_estoque(usuario, produtos_adicionados, f'Saída para parada adicionada à rota {rota.id}')
+        if produtos_devolvidos:
+            devolver_estoque(usuario, produtos_devolvidos, f'Devolução de parada removida da rota {rota.id}')
+    return rota
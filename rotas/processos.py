@@ -0,0 +1,347 @@
+# Pool de processos para as etapas de CPU (matrizes de distância/tempo e TSP), fora das threads das requisições
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Processos do pool em cada processo web (0, o padrão = tudo na thread da
+# requisição). Cada worker do gunicorn tem o seu pool: com o pool ativo, o
+# total de processos (workers × ROTAS_POOL_PROCESSOS) deve caber nos núcleos
+# e os workers devem ser gthread, para que as requisições esperem os jobs em
+# threads (é o que faz o gunicorn.conf.py)
+ROTAS_POOL_PROCESSOS = int(os.getenv('ROTAS_POOL_PROCESSOS', '0'))
+
+# Jobs aguardando além dos que estão em execução; com a fila cheia, novos
+# pedidos esperam até ROTAS_POOL_ESPERA_MS por uma vaga e então são recusados
+ROTAS_POOL_FILA = int(os.getenv('ROTAS_POOL_FILA', '8'))
+ROTAS_POOL_ESPERA_MS = int(os.getenv('ROTAS_POOL_ESPERA_MS', '2000'))
+
+# Tempo máximo de espera pelo resultado de cada job
+ROTAS_POOL_TIMEOUT_S = float(os.getenv('ROTAS_POOL_TIMEOUT_S', '30'))
+
+# Regiões mantidas em memória por processo do pool
+ROTAS_POOL_REGIOES = int(os.getenv('ROTAS_POOL_REGIOES', '4'))
+
+
+class PoolSaturado(Exception):
+    """Fila do pool cheia: o pedido deve ser repetido mais tarde"""
+
+
+# ---------------------------------------------------------------------------
+# Código executado nos processos do pool
+# ---------------------------------------------------------------------------
+
+_grafos_processo = OrderedDict()
+
+
+def _grafo_processo(diretorio, chave, versao, objetivo):
+    """
+    Grafo roteável da região no processo do pool: a contraction hierarchy
+    persistida para o objetivo ou o CSR, lidos do GrafoStore (mapeado em
+    memória, então as páginas do disco são compartilhadas entre os
+    processos). Sem hierarquia, ela é procurada de novo no disco a cada
+    GRAFOS_CONTRACAO_VERIFICAR_S (é gerada por preprocessar_grafos).
+    """
+    from .contracao import ContracaoHierarquica
+    from .grafo_csr import GrafoCSR
+    from .grafos import GrafoStore
+    from .motor import GRAFOS_CONTRACAO_VERIFICAR_S
+
+    em_cache = _grafos_processo.get((chave, versao, objetivo))
+    if em_cache is not None:
+        _grafos_processo.move_to_end((chave, versao, objetivo))
+        grafo, verificado = em_cache
+        if not isinstance(grafo, GrafoCSR) or time.time() - verificado < GRAFOS_CONTRACAO_VERIFICAR_S:
+            return grafo
+
+    store = GrafoStore(diretorio)
+    compacto = store.carregar(chave)
+    if compacto is None or compacto.versao != versao:
+        raise LookupError(f'Região {chave} (versão {versao}) não encontrada em {diretorio}')
+    grafo = ContracaoHierarquica.carregar(store, chave, versao, objetivo) or GrafoCSR.de_compacto(compacto)
+    _grafos_processo[(chave, versao, objetivo)] = (grafo, time.time())
+    while len(_grafos_processo) > ROTAS_POOL_REGIOES:
+        _grafos_processo.popitem(last=False)
+    return grafo
+
+
+def _tarefa_matrizes(diretorio, chave, versao, nos, linhas, objetivo):
+    return _grafo_processo(diretorio, chave, versao, objetivo).matrizes(nos, linhas=linhas, objetivo=objetivo)
+
+
+def _tarefa_caminhos(diretorio, chave, versao, pares, objetivo):
+    grafo = _grafo_processo(diretorio, chave, versao, objetivo)
+    return [grafo.caminho(origem, destino, objetivo) for origem, destino in pares]
+
+
+def _tarefa_resolver(solver_tsp, nome_memoria, n, max_ms):
+    """
+    Resolve o TSP com a matriz lida da memória compartilhada criada pelo
+    processo da requisição (que também a remove)
+    """
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    try:
+        matriz = np.ndarray((n, n), dtype=np.int64, buffer=memoria.buf).tolist()
+    finally:
+        memoria.close()
+    return solver_tsp.resolver(matriz, max_ms)
+
+
+def _tarefa_aquecer():
+    return os.getpid()
+
+
+# ---------------------------------------------------------------------------
+# Lado do processo web
+# ---------------------------------------------------------------------------
+
+class PoolSolver:
+    """
+    Pool de processos (forkserver) com fila limitada: no máximo
+    `processos + max_fila` jobs pendentes ou em execução. Cada job tem um
+    tempo limite; um job que excede o limite é cancelado se ainda estiver
+    na fila e, se já estiver em execução, os processos do pool são
+    reciclados (terminados e trocados por novos), liberando a CPU e a vaga.
+    Os outros jobs em execução nesses processos falham com
+    BrokenProcessPool.
+    """
+
+    def __init__(self, processos=ROTAS_POOL_PROCESSOS, max_fila=ROTAS_POOL_FILA,
+                 espera_ms=ROTAS_POOL_ESPERA_MS, timeout_s=ROTAS_POOL_TIMEOUT_S):
+        self.processos = processos
+        self.max_fila = max_fila
+        self.espera_ms = espera_ms
+        self.timeout_s = timeout_s
+
+        self._contexto = multiprocessing.get_context('forkserver')
+        self._contexto.set_forkserver_preload(['numpy', 'rotas.motor'])
+        self._executor = self._novo_executor()
+        self._vagas = threading.BoundedSemaphore(processos + max_fila)
+
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._contadores = {
+            'submetidos': 0,
+            'concluidos': 0,
+            'recusados': 0,
+            'timeouts': 0,
+            'erros': 0,
+            'reciclagens': 0,
+        }
+        self._tempo_total = 0.0
+
+    def _incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def _novo_executor(self):
+        return ProcessPoolExecutor(max_workers=self.processos, mp_context=self._contexto)
+
+    def _reciclar(self, executor):
+        """
+        Troca o executor por um novo e termina os processos do antigo (job
+        que excedeu o tempo limite ou pool quebrado). Os jobs pendentes no
+        antigo falham com BrokenProcessPool e liberam suas vagas.
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._novo_executor()
+            self._contadores['reciclagens'] += 1
+        self._terminar(executor)
+
+    @staticmethod
+    def _terminar(executor):
+        """
+        Cancela os jobs na fila e termina os processos do executor sem
+        esperar os jobs em execução
+        """
+        if hasattr(executor, 'terminate_workers'):
+            executor.terminate_workers()
+            return
+        # Antes do Python 3.14 o executor não termina os processos: eles são
+        # lidos antes do shutdown, que descarta a referência
+        processos = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for processo in processos:
+            processo.terminate()
+
+    def _submeter(self, funcao, *args, aguardar=False, ao_concluir=None):
+        """
+        Coloca o job na fila e retorna (future, executor). Sem vaga em
+        espera_ms (ou indefinidamente, com aguardar=True), levanta
+        PoolSaturado.
+        """
+        if not self._vagas.acquire(timeout=None if aguardar else self.espera_ms / 1000):
+            self._incrementar('recusados')
+            raise PoolSaturado(f'Fila de otimização cheia ({self.processos + self.max_fila} jobs)')
+
+        submetido = time.perf_counter()
+        with self._lock:
+            self._pendentes += 1
+            self._contadores['submetidos'] += 1
+
+        def liberar(futuro):
+            with self._lock:
+                self._pendentes -= 1
+                self._tempo_total += time.perf_counter() - submetido
+                if not futuro.cancelled() and futuro.exception() is None:
+                    self._contadores['concluidos'] += 1
+                else:
+                    self._contadores['erros'] += 1
+            self._vagas.release()
+            if ao_concluir is not None:
+                ao_concluir()
+
+        try:
+            executor = self._executor
+            try:
+                futuro = executor.submit(funcao, *args)
+            except BrokenProcessPool:
+                # Um processo do pool morreu (ex.: falta de memória): recicla e tenta de novo
+                self._reciclar(executor)
+                executor = self._executor
+                futuro = executor.submit(funcao, *args)
+        except Exception:
+            with self._lock:
+                self._pendentes -= 1
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(liberar)
+        return futuro, executor
+
+    def _aguardar(self, futuro, executor):
+        try:
+            return futuro.result(timeout=self.timeout_s)
+        except TimeoutError:
+            self._incrementar('timeouts')
+            if not futuro.cancel():
+                self._reciclar(executor)
+            raise
+        except BrokenProcessPool:
+            self._reciclar(executor)
+            raise
+
+    def matrizes(self, regiao, nos, linhas=None, objetivo='distancia', aguardar=False):
+        """
+        Matrizes de distâncias e de tempos da região (persistida no
+        GrafoStore) calculadas em um processo do pool
+        """
+        compacto = regiao['compacto']
+        futuro, executor = self._submeter(
+            _tarefa_matrizes, regiao['diretorio'], regiao['chave'], compacto.versao, list(nos), linhas, objetivo,
+            aguardar=aguardar,
+        )
+        return self._aguardar(futuro, executor)
+
+    def caminhos(self, regiao, pares, objetivo='distancia', aguardar=False):
+        """
+        Nós dos caminhos mínimos [(origem, destino), ...] da região
+        calculados em um processo do pool
+        """
+        compacto = regiao['compacto']
+        futuro, executor = self._submeter(
+            _tarefa_caminhos, regiao['diretorio'], regiao['chave'], compacto.versao, list(pares), objetivo,
+            aguardar=aguardar,
+        )
+        return self._aguardar(futuro, executor)
+
+    def resolver(self, solver_tsp, matriz, max_ms=None, aguardar=False):
+        """
+        Resolve o TSP em um processo do pool; a matriz vai por memória
+        compartilhada (sem serializar n² valores)
+        """
+        matriz = np.asarray(matriz, dtype=np.int64)
+        n = len(matriz)
+        memoria = shared_memory.SharedMemory(create=True, size=max(matriz.nbytes, 1))
+        np.ndarray((n, n), dtype=np.int64, buffer=memoria.buf)[:] = matriz
+
+        def remover_memoria():
+            memoria.close()
+            memoria.unlink()
+
+        try:
+            futuro, executor = self._submeter(
+                _tarefa_resolver, solver_tsp, memoria.name, n, max_ms,
+                aguardar=aguardar, ao_concluir=remover_memoria,
+            )
+        except Exception:
+            remover_memoria()
+            raise
+        return self._aguardar(futuro, executor)
+
+    def aquecer(self):
+        """
+        Inicia o forkserver e os processos do pool (evita o custo na
+        primeira requisição)
+        """
+        for futuro in [self._executor.submit(_tarefa_aquecer) for _ in range(self.processos)]:
+            futuro.result()
+
+    def estatisticas(self):
+        """
+        Profundidade da fila e contadores do processo atual
+        """
+        with self._lock:
+            dados = dict(self._contadores)
+            pendentes = self._pendentes
+            tempo_total = self._tempo_total
+        finalizados = dados['concluidos'] + dados['erros']
+        dados.update({
+            'processos': self.processos,
+            'capacidade_fila': self.max_fila,
+            'em_execucao': min(pendentes, self.processos),
+            'na_fila': max(pendentes - self.processos, 0),
+            # Da submissão ao fim do job (fila + execução)
+            'tempo_medio_ms': round(1000 * tempo_total / finalizados, 1) if finalizados else 0.0,
+        })
+        return dados
+
+    def encerrar(self):
+        """
+        Termina os processos do pool (saída do worker web)
+        """
+        self._terminar(self._executor)
+
+
+# Um pool por processo web: o pool não pode ser herdado pelo fork dos workers
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_solver():
+    """
+    Retorna o pool do processo atual (criado sob demanda), ou None com
+    ROTAS_POOL_PROCESSOS=0
+    """
+    global _pool, _pool_pid
+    if ROTAS_POOL_PROCESSOS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PoolSolver()
+            _pool_pid = os.getpid()
+            atexit.register(encerrar_pool_solver)
+    return _pool
+
+
+def encerrar_pool_solver():
+    """
+    Termina o pool do processo atual, se houver (registrado no atexit e
+    chamado pelo hook worker_exit do gunicorn)
+    """
+    global _pool
+    with _pool_lock:
+        # Um pool herdado pelo fork pertence ao processo pai
+        if _pool is None or _pool_pid != os.getpid():
+            return
+        pool, _pool = _pool, None
+    pool.encerrar()
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from decimal import Decimal
-from .models import Veiculo, Rota
+from django.urls import reverse
+from .models import Veiculo, Rota, RotaJob
 from produtos.models import Produto
 
 class VeiculoSerializer(serializers.ModelSerializer):
@@ -42,12 +43,14 @@ class RotaSerializer(serializers.ModelSerializer):
             'preco_combustivel_usado',
             'produtos_quantidades',
             'link_maps',
+            'qualidade_otimizacao',
             'status',
             'status_display',
             'preco_combustivel_na_geracao'
         ]
         read_only_fields = ['id', 'data_geracao', 'enderecos_otimizados', 'coordenadas_otimizadas', 
-                           'distancia_total_km', 'tempo_estimado_minutos', 'valor_rota', 'link_maps']
+                           'distancia_total_km', 'tempo_estimado_minutos', 'valor_rota', 'link_maps',
+                           'qualidade_otimizacao']
     
     def get_veiculo_nome(self, obj):
         """
@@ -122,6 +125,86 @@ class RotaCreateSerializer(serializers.Serializer):
         child=serializers.DictField(),
         help_text="Lista de produtos com suas quantidades"
     )
+    max_ms = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=60000,
+        help_text="Prazo em milissegundos para a otimização da ordem de visita (opcional)"
+    )
+    assincrono = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Reserva o estoque e otimiza em segundo plano (retorna 202 com o id do job)"
+    )
+
+class RotaParadaAdicionarSerializer(serializers.Serializer):
+    endereco = serializers.CharField(
+        max_length=500,
+        help_text="Endereço da nova parada"
+    )
+    produtos_quantidades = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        default=list,
+        help_text="Produtos entregues na nova parada (saem do estoque)"
+    )
+    max_ms = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=60000,
+        help_text="Prazo em milissegundos para reotimizar a ordem de visita (opcional)"
+    )
+
+class RotaParadaRemoverSerializer(serializers.Serializer):
+    indice = serializers.IntegerField(
+        min_value=1,
+        help_text="Posição da parada em enderecos_otimizados (a origem, posição 0, não pode ser removida)"
+    )
+    produtos_quantidades = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        default=list,
+        help_text="Produtos da parada removida que voltam ao estoque"
+    )
+    max_ms = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=60000,
+        help_text="Prazo em milissegundos para reotimizar a ordem de visita (opcional)"
+    )
+
+class RotaJobSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    url_status = serializers.SerializerMethodField()
+    url_rota = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RotaJob
+        fields = [
+            'id',
+            'status',
+            'status_display',
+            'rota',
+            'erro',
+            'tentativas',
+            'data_criacao',
+            'data_inicio',
+            'data_conclusao',
+            'url_status',
+            'url_rota'
+        ]
+        read_only_fields = fields
+
+    def _url(self, nome, obj):
+        url = reverse(nome, kwargs={'id': obj.id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_url_status(self, obj):
+        return self._url('rota-job-detail', obj)
+
+    def get_url_rota(self, obj):
+        return self._url('rota-job-rota', obj)
 
 class RotaStatusUpdateSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=Rota.STATUS_CHOICES) 
\ No newline at end of file
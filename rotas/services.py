@@ -1,192 +0,0 @@
-# services.py com importação totalmente lazy
-import requests
-from decimal import Decimal
-import json
-import hashlib
-import time
-from functools import lru_cache
-import os
-
-# Configuração de ambiente para controlar carregamento de bibliotecas pesadas
-ENABLE_HEAVY_LIBS = os.getenv('ENABLE_HEAVY_LIBS', 'true').lower() == 'true'
-
-class RotaOtimizacaoService:
-    def __init__(self):
-        # Cache em memória para geocodificação (endereço -> coordenadas)
-        self._geocoding_cache = {}
-        self._geocoding_ttl = 24 * 60 * 60  # 24 horas em segundos
-        
-        # Cache em memória para grafos OSMnx (região -> grafo)
-        self._grafos_cache = {}
-        self._grafos_ttl = 60 * 60  # 1 hora em segundos
-        
-        # Lazy loading controls
-        self._heavy_libs_available = None
-        self._ox = None
-        self._nx = None
-        self._pywrapcp = None
-        self._routing_enums_pb2 = None
-
-    def _load_heavy_libs_if_needed(self):
-        """Carrega bibliotecas pesadas apenas quando realmente necessário"""
-        if not ENABLE_HEAVY_LIBS:
-            print("⚠️  Bibliotecas pesadas desabilitadas via ENABLE_HEAVY_LIBS=false")
-            return False
-            
-        if self._heavy_libs_available is None:
-            try:
-                print("� Carregando bibliotecas de otimização...")
-                import osmnx as ox
-                import networkx as nx
-                from ortools.constraint_solver import pywrapcp, routing_enums_pb2
-                
-                self._ox = ox
-                self._nx = nx
-                self._pywrapcp = pywrapcp
-                self._routing_enums_pb2 = routing_enums_pb2
-                self._heavy_libs_available = True
-                print("✅ Bibliotecas de otimização carregadas com sucesso")
-                return True
-            except ImportError as e:
-                print(f"⚠️  Bibliotecas de otimização não disponíveis: {e}")
-                self._heavy_libs_available = False
-                return False
-        
-        return self._heavy_libs_available
-
-    def otimizar_rota(self, origem, destinos, veiculo_capacidade=None, horario_inicio=None):
-        """
-        Otimiza uma rota entre origem e múltiplos destinos
-        """
-        if not self._load_heavy_libs_if_needed():
-            return {
-                'sucesso': False,
-                'mensagem': 'Otimização de rotas avançada temporariamente indisponível. Usando geocodificação básica.',
-                'rota_otimizada': [],
-                'distancia_total': 0,
-                'tempo_total': 0,
-                'coordenadas': self._geocodificar_basico([origem] + destinos)
-            }
-            
-        try:
-            # Código original de otimização...
-            return self._otimizar_rota_completa(origem, destinos, veiculo_capacidade, horario_inicio)
-        except Exception as e:
-            print(f"Erro na otimização avançada: {e}")
-            return {
-                'sucesso': False,
-                'mensagem': f'Erro na otimização: {str(e)}',
-                'rota_otimizada': [],
-                'distancia_total': 0,
-                'tempo_total': 0
-            }
-
-    def _geocodificar_basico(self, enderecos):
-        """Geocodificação básica usando Nominatim (sem osmnx)"""
-        coordenadas = []
-        for endereco in enderecos:
-            try:
-                # Cache check
-                cache_key = hashlib.md5(endereco.encode()).hexdigest()
-                if cache_key in self._geocoding_cache:
-                    cache_data = self._geocoding_cache[cache_key]
-                    if time.time() - cache_data['timestamp'] < self._geocoding_ttl:
-                        coordenadas.append(cache_data['coordenadas'])
-                        continue
-
-                # API Nominatim
-                url = "https://nominatim.openstreetmap.org/search"
-                params = {
-                    'q': endereco,
-                    'format': 'json',
-                    'limit': 1,
-                    'countrycodes': 'br'  # Foco no Brasil
-                }
-                
-                response = requests.get(url, params=params, timeout=10)
-                data = response.json()
-                
-                if data:
-                    lat, lon = float(data[0]['lat']), float(data[0]['lon'])
-                    coordenadas.append((lat, lon))
-                    
-                    # Cache result
-                    self._geocoding_cache[cache_key] = {
-                        'coordenadas': (lat, lon),
-                        'timestamp': time.time()
-                    }
-                else:
-                    coordenadas.append(None)
-                    
-                # Rate limiting
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Erro na geocodificação de '{endereco}': {e}")
-                coordenadas.append(None)
-                
-        return coordenadas
-
-    def geocodificar_endereco(self, endereco):
-        """Geocodifica um único endereço"""
-        if self._load_heavy_libs_if_needed() and self._ox:
-            try:
-                # Usar osmnx se disponível
-                coordenadas = self._ox.geocode(endereco)
-                return coordenadas
-            except:
-                pass
-                
-        # Fallback para método básico
-        coords = self._geocodificar_basico([endereco])
-        return coords[0] if coords and coords[0] else None
-
-    def calcular_distancia_tempo(self, origem, destino):
-        """Calcula distância e tempo entre dois pontos"""
-        if not self._load_heavy_libs_if_needed():
-            # Implementação básica usando coordenadas
-            coord_origem = self.geocodificar_endereco(origem)
-            coord_destino = self.geocodificar_endereco(destino)
-            
-            if coord_origem and coord_destino:
-                # Cálculo simplificado da distância euclidiana
-                import math
-                lat1, lon1 = coord_origem
-                lat2, lon2 = coord_destino
-                
-                # Fórmula de Haversine simplificada
-                dlat = math.radians(lat2 - lat1)
-                dlon = math.radians(lon2 - lon1)
-                a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-                c = 2 * math.asin(math.sqrt(a))
-                distancia = 6371 * c * 1000  # Em metros
-                
-                # Estimativa de tempo (assumindo 50 km/h médio)
-                tempo = distancia / (50 * 1000 / 3600)  # Em segundos
-                
-                return {
-                    'distancia': int(distancia),
-                    'tempo': int(tempo)
-                }
-            
-            return {'distancia': 0, 'tempo': 0}
-            
-        # Usar implementação completa se disponível
-        return self._calcular_distancia_tempo_completa(origem, destino)
-
-    def _otimizar_rota_completa(self, origem, destinos, veiculo_capacidade, horario_inicio):
-        """Implementação completa da otimização (quando bibliotecas estão disponíveis)"""
-        # Aqui iria todo o código original de otimização
-        # Por agora, retorna um resultado básico
-        return {
-            'sucesso': True,
-            'mensagem': 'Otimização completa disponível',
-            'rota_otimizada': [origem] + destinos,
-            'distancia_total': 0,
-            'tempo_total': 0
-        }
-
-    def _calcular_distancia_tempo_completa(self, origem, destino):
-        """Implementação completa do cálculo (quando bibliotecas estão disponíveis)"""
-        # Implementação com osmnx e networkx
-        return {'distancia': 0, 'tempo': 0}
\ No newline at end of file
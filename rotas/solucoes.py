@@ -0,0 +1,151 @@
+# Cache de rotas resolvidas, independente da ordem em que as paradas foram informadas
+import hashlib
+import json
+import os
+import threading
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+# Validade das soluções armazenadas (a versão do grafo já invalida as antigas)
+ROTAS_SOLUCAO_TTL_HORAS = float(os.getenv('ROTAS_SOLUCAO_TTL_HORAS', '720'))
+
+
+def chave_solucao(versao, deposito, paradas, parametros=None):
+    """
+    Hash do problema: versão do grafo, nó do depósito, nós das paradas
+    ordenados (a ordem de entrada não importa) e parâmetros de custo
+    """
+    conteudo = json.dumps(
+        [versao, int(deposito), sorted(int(no) for no in paradas), parametros or {}],
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+
+def reordenar(nos_entrada, nos_rota):
+    """
+    Converte a sequência de nós de uma solução armazenada em índices da
+    entrada atual (paradas no mesmo nó são atribuídas na ordem de entrada).
+    Retorna None se os nós não corresponderem.
+    """
+    livres = {}
+    for i, no in enumerate(nos_entrada):
+        livres.setdefault(no, []).append(i)
+    rota = []
+    for no in nos_rota:
+        indices = livres.get(no)
+        if not indices:
+            return None
+        rota.append(indices.pop(0))
+    if any(livres.values()):
+        return None
+    return rota
+
+
+class CacheSolucoes:
+    """
+    Soluções de rotas (ordem de visita, distância e tempo) persistidas no
+    banco e compartilhadas entre workers
+    """
+
+    def __init__(self, ttl_horas=ROTAS_SOLUCAO_TTL_HORAS):
+        self.ttl = timedelta(hours=ttl_horas)
+        self._lock = threading.Lock()
+        self._contadores = {'acertos': 0, 'falhas': 0}
+
+    def _incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def obter(self, chave):
+        """
+        Retorna a solução armazenada ({'nos', 'distancia_m', 'tempo_minutos',
+        'qualidade'}) ou None
+        """
+        from .models import RotaSolucaoCache
+
+        try:
+            registro = RotaSolucaoCache.objects.filter(
+                chave=chave, data_criacao__gte=timezone.now() - self.ttl
+            ).first()
+            if registro is not None:
+                RotaSolucaoCache.objects.filter(pk=registro.pk).update(acertos=F('acertos') + 1)
+        except DatabaseError as e:
+            print(f"Erro ao consultar cache de soluções: {e}")
+            registro = None
+
+        if registro is None:
+            self._incrementar('falhas')
+            return None
+        self._incrementar('acertos')
+        return {
+            'nos': registro.nos_rota,
+            'distancia_m': registro.distancia_m,
+            'tempo_minutos': registro.tempo_minutos,
+            'qualidade': registro.qualidade,
+        }
+
+    def salvar(self, chave, versao, nos_rota, distancia_m, tempo_minutos, qualidade=None):
+        """
+        Armazena a solução (nos_rota: ids OSM na ordem de visita, com retorno)
+        """
+        from .models import RotaSolucaoCache
+
+        try:
+            RotaSolucaoCache.objects.update_or_create(
+                chave=chave,
+                defaults={
+                    'versao_grafo': versao,
+                    'nos_rota': [int(no) for no in nos_rota],
+                    'distancia_m': float(distancia_m),
+                    'tempo_minutos': int(tempo_minutos),
+                    'qualidade': qualidade,
+                    'data_criacao': timezone.now(),
+                },
+            )
+        except DatabaseError as e:
+            print(f"Erro ao salvar cache de soluções: {e}")
+
+    def limpar_expirados(self):
+        """
+        Remove do banco as soluções expiradas
+        """
+        from .models import RotaSolucaoCache
+
+        try:
+            removidos, _ = RotaSolucaoCache.objects.filter(
+                data_criacao__lt=timezone.now() - self.ttl
+            ).delete()
+            return removidos
+        except DatabaseError as e:
+            print(f"Erro ao limpar cache de soluções: {e}")
+            return 0
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do processo atual e a taxa de acerto
+        """
+        with self._lock:
+            dados = dict(self._contadores)
+        consultas = dados['acertos'] + dados['falhas']
+        dados['consultas'] = consultas
+        dados['taxa_acerto'] = dados['acertos'] / consultas if consultas else 0.0
+        return dados
+
+
+# Instância compartilhada
+_cache_solucoes = None
+_cache_solucoes_lock = threading.Lock()
+
+
+def get_cache_solucoes():
+    """Retorna instância singleton do cache de soluções"""
+    global _cache_solucoes
+    with _cache_solucoes_lock:
+        if _cache_solucoes is None:
+            _cache_solucoes = CacheSolucoes()
+    return _cache_solucoes
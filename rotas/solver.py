@@ -0,0 +1,427 @@
+# Resolução anytime do caixeiro viajante: rota inicial imediata + busca local até o prazo
+# (somente NumPy, sem OR-Tools)
+import os
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import minimum_spanning_tree
+
+# Melhorias menores que isso (em metros) são ignoradas para evitar ciclos por arredondamento
+EPSILON = 1e-6
+
+# Prazo padrão da busca local quando o cliente não informa um
+SOLVER_MAX_MS = int(os.getenv('SOLVER_MAX_MS', '200'))
+
+# Tamanho das listas de vizinhos usadas pelo Or-opt
+SOLVER_VIZINHOS = int(os.getenv('SOLVER_VIZINHOS', '8'))
+
+# Iterações do subgradiente no limite inferior de Held-Karp
+SOLVER_LIMITE_ITERACOES = int(os.getenv('SOLVER_LIMITE_ITERACOES', '50'))
+
+# Fração final do prazo reservada ao limite inferior (a busca para antes)
+SOLVER_LIMITE_FRACAO = float(os.getenv('SOLVER_LIMITE_FRACAO', '0.2'))
+
+# Estimativa do tempo de uma 1-árvore por par de pontos, usada antes de
+# medir a primeira iteração
+SEGUNDOS_POR_PAR = 3e-7
+
+# Rotas com até esse número de pontos (origem incluída) são resolvidas de forma exata
+SOLVER_EXATO_MAX_PONTOS = int(os.getenv('SOLVER_EXATO_MAX_PONTOS', '12'))
+
+
+def custo_rota(matriz, rota):
+    """
+    Custo total de uma rota fechada (lista de índices terminando na origem)
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    rota = np.asarray(rota)
+    return float(matriz[rota[:-1], rota[1:]].sum())
+
+
+def dividir_prazo(inicio, max_ms, fracao=SOLVER_LIMITE_FRACAO):
+    """
+    Divide os `max_ms` a partir de `inicio` (time.perf_counter) entre a
+    busca e o limite inferior, que fica com a fração final.
+    Retorna (prazo da busca, prazo do limite).
+    """
+    fim = inicio + max_ms / 1000
+    return fim - fracao * max_ms / 1000, fim
+
+
+def gap_percentual(custo, limite):
+    """
+    Diferença percentual entre o custo e o limite inferior (a distância ao
+    ótimo é no máximo essa); None sem limite
+    """
+    if limite is None:
+        return None
+    return round(100 * (custo - limite) / custo, 2) if custo > 0 else 0.0
+
+
+def limite_inferior(matriz, custo=None, iteracoes=SOLVER_LIMITE_ITERACOES, prazo=None):
+    """
+    Limite inferior do custo de qualquer rota fechada: o maior entre o
+    problema de atribuição na matriz (assimétrica) e o limite de Held-Karp
+    na matriz simetrizada pelo sentido mais barato de cada par, que não
+    supera o custo de nenhuma rota. `custo` é o de uma rota conhecida
+    (orienta o passo do subgradiente; sem ele, usa o vizinho mais próximo).
+    Com `prazo` (time.perf_counter), as iterações de Held-Karp param antes
+    de ultrapassá-lo: o limite fica mais fraco (no mínimo o da atribuição),
+    mas continua válido. Retorna None se o prazo já tiver passado.
+    """
+    if prazo is not None and time.perf_counter() >= prazo:
+        return None
+    matriz = np.array(matriz, dtype=np.float64)
+    n = len(matriz)
+    if n < 2:
+        return 0.0
+    if n == 2:
+        return float(matriz[0, 1] + matriz[1, 0])
+    np.fill_diagonal(matriz, np.inf)
+    if not np.isfinite(matriz[~np.eye(n, dtype=bool)]).all():
+        return limite_reducao(matriz)
+
+    linhas, colunas = linear_sum_assignment(matriz)
+    atribuicao = float(matriz[linhas, colunas].sum())
+    if custo is None:
+        custo = custo_rota(matriz, vizinho_mais_proximo(matriz))
+    limite = max(atribuicao, limite_held_karp(np.minimum(matriz, matriz.T), custo, iteracoes, prazo))
+    # Nenhum limite supera uma rota; só o arredondamento poderia
+    return min(limite, float(custo))
+
+
+def limite_reducao(matriz):
+    """
+    Limite inferior pela redução de linhas e colunas da matriz, como no
+    branch and bound de Little (fraco, mas aceita pares sem custo finito)
+    """
+    matriz = np.array(matriz, dtype=np.float64)
+    if len(matriz) < 2:
+        return 0.0
+    np.fill_diagonal(matriz, np.inf)
+    minimos_linhas = matriz.min(axis=1)
+    reduzida = matriz - minimos_linhas[:, None]
+    minimos_colunas = reduzida.min(axis=0)
+    return float(minimos_linhas.sum() + minimos_colunas.sum())
+
+
+def _um_arvore(pesos):
+    """
+    1-árvore mínima: árvore geradora mínima dos nós 1..n-1 mais as duas
+    arestas mais baratas do nó 0. Retorna (custo, grau de cada nó).
+    """
+    n = len(pesos)
+    resto = pesos[1:, 1:]
+    # O csgraph trata zeros como ausência de aresta: todos os pesos são
+    # deslocados para cima (a árvore é a mesma) e o deslocamento é descontado
+    deslocamento = 1.0 - resto[np.isfinite(resto)].min()
+    arvore = minimum_spanning_tree(np.where(np.isfinite(resto), resto + deslocamento, 0.0)).tocoo()
+    graus = np.bincount(np.concatenate([arvore.row, arvore.col]) + 1, minlength=n)
+    dois = np.argpartition(pesos[0, 1:], 1)[:2] + 1
+    graus[0] = 2
+    graus[dois] += 1
+    return float(arvore.data.sum() - deslocamento * (n - 2) + pesos[0, dois].sum()), graus
+
+
+def limite_held_karp(simetrica, custo, iteracoes=SOLVER_LIMITE_ITERACOES, prazo=None):
+    """
+    Limite de Held-Karp por 1-árvores com penalidades nos nós: com pesos
+    c_ij + p_i + p_j, toda rota custa o mesmo mais 2 * soma(p), e a 1-árvore
+    mínima menos 2 * soma(p) é um limite inferior. As penalidades sobem nos
+    nós de grau acima de 2 (subgradiente com passo de Polyak pelo `custo`
+    de uma rota conhecida). `simetrica` tem a diagonal infinita. Com
+    `prazo`, só começa uma iteração que caiba nele (pela duração da mais
+    lenta até então); sem nenhuma, retorna -inf.
+    """
+    n = len(simetrica)
+    penalidades = np.zeros(n)
+    melhor = -np.inf
+    fator, sem_melhora = 2.0, 0
+    duracao, duracoes = SEGUNDOS_POR_PAR * n * n, []
+    for _ in range(iteracoes):
+        agora = time.perf_counter()
+        if prazo is not None and agora + duracao > prazo:
+            break
+        valor, graus = _um_arvore(simetrica + penalidades[:, None] + penalidades[None, :])
+        valor -= 2 * penalidades.sum()
+        duracoes.append(time.perf_counter() - agora)
+        duracao = max(duracoes)
+        if valor > melhor + EPSILON:
+            melhor, sem_melhora = valor, 0
+        else:
+            sem_melhora += 1
+            if sem_melhora >= 5:
+                fator, sem_melhora = fator / 2, 0
+                if fator < 0.05:
+                    break
+        subgradiente = graus - 2
+        norma = float(subgradiente @ subgradiente)
+        # 1-árvore que já é uma rota (todos com grau 2): o limite é o ótimo
+        if norma == 0 or custo - valor <= EPSILON:
+            break
+        penalidades += fator * (custo - valor) / norma * subgradiente
+    return float(melhor)
+
+
+def vizinho_mais_proximo(matriz, origem=0):
+    """
+    Rota inicial gulosa: sempre segue para a parada não visitada mais próxima
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    n = len(matriz)
+    visitado = np.zeros(n, dtype=bool)
+    visitado[origem] = True
+    rota = [origem]
+    atual = origem
+    for _ in range(n - 1):
+        distancias = np.where(visitado, np.inf, matriz[atual])
+        atual = int(np.argmin(distancias))
+        visitado[atual] = True
+        rota.append(atual)
+    rota.append(origem)
+    return rota
+
+
+def dois_opt(matriz, rota, prazo):
+    """
+    Busca local 2-opt até não haver melhoria ou até `prazo` (time.perf_counter).
+
+    Inverter o trecho rota[i+1..j] troca as arestas (i, i+1) e (j, j+1) por
+    (i, j) e (i+1, j+1) e percorre o trecho no sentido contrário; como a
+    matriz pode ser assimétrica (mãos únicas), o ganho considera o custo do
+    trecho invertido, obtido por somas acumuladas nos dois sentidos. Para
+    cada i, todos os j são avaliados de uma vez com NumPy.
+    Retorna (rota, quantidade de melhorias aplicadas).
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    rota = np.asarray(rota, dtype=np.int64)
+    n = len(rota) - 1
+    melhorias = 0
+    if n < 3:
+        return rota.tolist(), melhorias
+
+    melhorou = True
+    while melhorou and time.perf_counter() < prazo:
+        melhorou = False
+        ida = np.concatenate([[0.0], np.cumsum(matriz[rota[:-1], rota[1:]])])
+        volta = np.concatenate([[0.0], np.cumsum(matriz[rota[1:], rota[:-1]])])
+        for i in range(n - 1):
+            j = np.arange(i + 2, n)
+            if not len(j):
+                continue
+            a, b = rota[i], rota[i + 1]
+            c, d = rota[j], rota[j + 1]
+            delta = (
+                matriz[a, c] + matriz[b, d] - matriz[a, b] - matriz[c, d]
+                + (volta[j] - volta[i + 1]) - (ida[j] - ida[i + 1])
+            )
+            k = int(np.argmin(delta))
+            if delta[k] < -EPSILON:
+                j = int(j[k])
+                rota[i + 1:j + 1] = rota[i + 1:j + 1][::-1].copy()
+                melhorias += 1
+                melhorou = True
+                ida = np.concatenate([[0.0], np.cumsum(matriz[rota[:-1], rota[1:]])])
+                volta = np.concatenate([[0.0], np.cumsum(matriz[rota[1:], rota[:-1]])])
+            if time.perf_counter() >= prazo:
+                break
+    return rota.tolist(), melhorias
+
+
+def held_karp(matriz):
+    """
+    Rota ótima por programação dinâmica (Held-Karp) em O(2^n * n^2).
+
+    custo[S, j] é o menor custo para sair da origem, visitar o conjunto de
+    paradas S (máscara de bits) e terminar em j. As máscaras são processadas
+    por quantidade de bits; para cada camada e cada j, a transição a partir
+    de todos os i é uma única operação NumPy sobre a tabela.
+    Retorna a rota fechada na origem 0.
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    m = len(matriz) - 1
+    if m < 1:
+        return [0, 0]
+    entre_paradas = matriz[1:, 1:]
+    total = 1 << m
+    mascaras = np.arange(total)
+    bits = np.zeros(total, dtype=np.int64)
+    for j in range(m):
+        bits += (mascaras >> j) & 1
+
+    custo = np.full((total, m), np.inf)
+    anterior = np.full((total, m), -1, dtype=np.int8)
+    unitarias = 1 << np.arange(m)
+    custo[unitarias, np.arange(m)] = matriz[0, 1:]
+
+    for tamanho in range(2, m + 1):
+        camada = mascaras[bits == tamanho]
+        for j in range(m):
+            com_j = camada[(camada >> j) & 1 == 1]
+            candidatos = custo[com_j ^ (1 << j)] + entre_paradas[:, j]
+            melhores = np.argmin(candidatos, axis=1)
+            custo[com_j, j] = candidatos[np.arange(len(com_j)), melhores]
+            anterior[com_j, j] = melhores
+
+    # Fecha o ciclo voltando à origem e reconstrói a rota de trás para frente
+    mascara = total - 1
+    j = int(np.argmin(custo[mascara] + matriz[1:, 0]))
+    rota = []
+    while j >= 0:
+        rota.append(j + 1)
+        mascara, j = mascara ^ (1 << j), int(anterior[mascara, j])
+    return [0] + rota[::-1] + [0]
+
+
+def listas_vizinhos(matriz, k=SOLVER_VIZINHOS):
+    """
+    As k paradas mais próximas de cada parada (considerando os dois sentidos)
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    n = len(matriz)
+    k = min(k, n - 1)
+    if k < 1:
+        return np.empty((n, 0), dtype=np.int64)
+    proximidade = np.minimum(matriz, matriz.T)
+    np.fill_diagonal(proximidade, np.inf)
+    return np.argpartition(proximidade, k - 1, axis=1)[:, :k]
+
+
+def or_opt(matriz, rota, vizinhos, prazo, max_segmento=3):
+    """
+    Busca local Or-opt até não haver melhoria ou até `prazo`.
+
+    Move trechos de 1 a `max_segmento` paradas consecutivas para outra
+    posição da rota, no mesmo sentido ou invertidos. Só são avaliadas as
+    posições vizinhas (antes ou depois) das paradas em `vizinhos` das pontas
+    do trecho, então cada trecho custa O(k) em vez de O(n).
+    Retorna (rota, quantidade de melhorias aplicadas).
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    rota = list(rota)
+    n = len(rota) - 1
+    melhorias = 0
+    if n < 3:
+        return rota, melhorias
+
+    melhorou = True
+    while melhorou and time.perf_counter() < prazo:
+        melhorou = False
+        for tamanho in range(1, min(max_segmento, n - 2) + 1):
+            i = 1
+            while i + tamanho <= n and time.perf_counter() < prazo:
+                trecho = rota[i:i + tamanho]
+                anterior, seguinte = rota[i - 1], rota[i + tamanho]
+                inicio, fim = trecho[0], trecho[-1]
+                ganho_remocao = matriz[anterior, inicio] + matriz[fim, seguinte] - matriz[anterior, seguinte]
+                if ganho_remocao <= EPSILON:
+                    i += 1
+                    continue
+
+                # Arestas (u, v) da rota sem o trecho, próximas das pontas do trecho
+                posicao = {no: k for k, no in enumerate(rota[:-1])}
+                no_trecho = set(trecho)
+                arestas = set()
+                for c in np.concatenate([vizinhos[inicio], vizinhos[fim]]).tolist():
+                    if c in no_trecho:
+                        continue
+                    k = posicao[c]
+                    if c != anterior:
+                        arestas.add((c, rota[k + 1]))
+                    if c != seguinte:
+                        arestas.add((rota[k - 1] if k > 0 else rota[n - 1], c))
+                if not arestas:
+                    i += 1
+                    continue
+
+                u, v = np.array(sorted(arestas)).T
+                interno_ida = sum(matriz[a, b] for a, b in zip(trecho, trecho[1:]))
+                interno_volta = sum(matriz[b, a] for a, b in zip(trecho, trecho[1:]))
+                insercao = matriz[u, inicio] + matriz[fim, v] - matriz[u, v]
+                insercao_invertida = matriz[u, fim] + matriz[inicio, v] - matriz[u, v] + interno_volta - interno_ida
+                invertido = insercao_invertida < insercao
+                custo = np.where(invertido, insercao_invertida, insercao)
+                k = int(np.argmin(custo))
+
+                if custo[k] - ganho_remocao < -EPSILON:
+                    restante = rota[:i] + rota[i + tamanho:]
+                    destino = next(p for p in range(len(restante) - 1) if restante[p] == u[k] and restante[p + 1] == v[k])
+                    rota = restante[:destino + 1] + (trecho[::-1] if invertido[k] else trecho) + restante[destino + 1:]
+                    melhorias += 1
+                    melhorou = True
+                else:
+                    i += 1
+    return rota, melhorias
+
+
+def insercao_mais_barata(matriz, rota, parada):
+    """
+    Insere `parada` na rota fechada entre o par de paradas consecutivas
+    (u, v) que menos aumenta o custo: m[u, p] + m[p, v] - m[u, v]
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    rota = list(rota)
+    u = np.asarray(rota[:-1])
+    v = np.asarray(rota[1:])
+    aumento = matriz[u, parada] + matriz[parada, v] - matriz[u, v]
+    k = int(np.argmin(aumento))
+    return rota[:k + 1] + [parada] + rota[k + 1:]
+
+
+def busca_local(matriz, rota, prazo, vizinhos=None):
+    """
+    Alterna 2-opt e Or-opt sobre a rota até `prazo` ou até o Or-opt não
+    encontrar melhoria. Retorna (rota, quantidade de melhorias aplicadas).
+    """
+    if vizinhos is None:
+        vizinhos = listas_vizinhos(matriz)
+    melhorias = 0
+    while time.perf_counter() < prazo:
+        rota, melhorias_2opt = dois_opt(matriz, rota, prazo)
+        rota, melhorias_or = or_opt(matriz, rota, vizinhos, prazo)
+        melhorias += melhorias_2opt + melhorias_or
+        if not melhorias_or:
+            break
+    return list(rota), melhorias
+
+
+def resolver(matriz, max_ms=SOLVER_MAX_MS):
+    """
+    Resolve o TSP. Rotas pequenas (até SOLVER_EXATO_MAX_PONTOS pontos) são
+    resolvidas de forma exata por Held-Karp; as demais em modo anytime: rota
+    do vizinho mais próximo imediatamente e melhoria alternando 2-opt e
+    Or-opt até `max_ms` milissegundos (ou até nenhuma das duas encontrar
+    melhoria).
+    Retorna um dicionário com a rota (fechada na origem 0), o custo, o
+    limite inferior, a diferença percentual para ele (gap: a distância ao
+    ótimo é no máximo essa), o método e o tempo gasto. Na solução exata o limite inferior é o próprio custo.
+    O limite é calculado dentro do mesmo prazo (na fração final,
+    SOLVER_LIMITE_FRACAO); sem tempo para ele, limite e gap são None.
+    """
+    inicio = time.perf_counter()
+    prazo, prazo_limite = dividir_prazo(inicio, max_ms)
+    matriz = np.asarray(matriz, dtype=np.float64)
+    melhorias = 0
+    metodo = 'anytime'
+
+    if len(matriz) < 2:
+        rota = [0, 0]
+        metodo = 'exato'
+    elif len(matriz) <= SOLVER_EXATO_MAX_PONTOS:
+        rota = held_karp(matriz)
+        metodo = 'exato'
+    else:
+        rota, melhorias = busca_local(matriz, vizinho_mais_proximo(matriz), prazo)
+
+    custo = custo_rota(matriz, rota)
+    limite = custo if metodo == 'exato' else limite_inferior(matriz, custo, prazo=prazo_limite)
+    return {
+        'rota': rota,
+        'custo': custo,
+        'limite_inferior': limite,
+        'gap_percentual': gap_percentual(custo, limite),
+        'metodo': metodo,
+        'melhorias': melhorias,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
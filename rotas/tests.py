@@ -0,0 +1,819 @@
+import gzip
+import itertools
+import math
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import networkx as nx
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from produtos.models import MovimentacaoEstoque, Produto
+from usuarios.models import Usuario
+from .jobs import (
+    ROTAS_JOBS_MAX_TENTATIVAS,
+    ROTAS_JOBS_TIMEOUT_MINUTOS,
+    FilaJobs,
+    enfileirar_job,
+    falhar_job,
+    processar_job,
+    recuperar_abandonados,
+    reivindicar_proximo,
+)
+from . import grafo_csr, ladrilhos, solver
+from .contracao import ContracaoHierarquica
+from .distancias import CacheDistancias
+from .gazetteer import Gazetteer, extrair_cep
+from .geometria import codificar_polyline, decodificar_polyline, simplificar
+from .grafos import GrafoCompacto, GrafoStore
+from .haversine import distancias_pares
+from .indice_espacial import IndiceEspacial
+from .management.commands.benchmark_grafos import gerar_grade
+from .models import DistanciaCache, Rota, RotaJob
+from .pedidos import (
+    ErroPedidoRota,
+    atualizar_paradas,
+    baixar_estoque,
+    devolver_estoque,
+    somar_produtos,
+)
+from .solucoes import CacheSolucoes, chave_solucao, reordenar
+
+
+def criar_usuario(cnpj='12345678000199'):
+    return Usuario.objects.create_user(
+        cnpj=cnpj, nome='Empresa', telefone='82999999999', cep='57000000', rua='Rua A', numero='1',
+        bairro='Centro', cidade='Maceió', estado='AL', password='senha',
+    )
+
+
+def criar_produto(usuario, nome='Produto', estoque=10):
+    return Produto.objects.create(
+        nome=nome, preco_custo=Decimal('1.00'), preco_venda=Decimal('2.00'),
+        estoque_minimo=0, estoque_atual=estoque, usuario=usuario,
+    )
+
+
+def criar_rota(usuario, produtos_quantidades, enderecos=None, geometria=None):
+    return Rota.objects.create(
+        enderecos_otimizados=enderecos or ['Empresa', 'Destino 1', 'Empresa'],
+        coordenadas_otimizadas=[[-9.6, -35.7], [-9.61, -35.71], [-9.6, -35.7]],
+        distancia_total_km=Decimal('3.00'), tempo_estimado_minutos=10,
+        valor_rota=Decimal('5.00'), produtos_quantidades=produtos_quantidades,
+        link_maps='https://www.google.com/maps/dir/', geometria=geometria, usuario=usuario,
+    )
+
+
+def resultado_otimizacao(enderecos):
+    return {
+        'sucesso': True,
+        'enderecos_otimizados': enderecos,
+        'coordenadas_otimizadas': [[-9.6, -35.7]] * len(enderecos),
+        'distancia_total_km': 4.5,
+        'tempo_estimado_minutos': 12,
+        'valor_rota': 6.0,
+        'preco_combustivel_usado': None,
+        'link_maps': 'https://www.google.com/maps/dir/',
+        'geometria': None,
+        'qualidade': None,
+    }
+
+
+def matriz_aleatoria(n, semente=0, assimetria=0.3):
+    """Distâncias euclidianas entre pontos aleatórios, com um fator por sentido (mãos únicas)"""
+    rng = np.random.default_rng(semente)
+    pontos = rng.random((n, 2)) * 10000
+    distancias = np.hypot(*(pontos[:, None, :] - pontos[None, :, :]).transpose(2, 0, 1))
+    matriz = distancias * (1 + assimetria * rng.random((n, n)))
+    np.fill_diagonal(matriz, 0)
+    return matriz
+
+
+def otimo_forca_bruta(matriz):
+    n = len(matriz)
+    return min(
+        solver.custo_rota(matriz, [0, *permutacao, 0])
+        for permutacao in itertools.permutations(range(1, n))
+    )
+
+
+class MotorFalso:
+    """Motor de rotas que devolve um resultado fixo, sem geocodificar nem otimizar"""
+
+    def __init__(self, resultado):
+        self.resultado = resultado
+
+    def otimizar_rota(self, enderecos, *args, **kwargs):
+        return self.resultado
+
+
+class SomarProdutosTests(TestCase):
+    def test_agrupa_por_produto(self):
+        total = somar_produtos(
+            [{'produto_id': 1, 'quantidade': 2}, {'produto_id': 1, 'quantidade': 3}],
+            [{'produto_id': 2, 'quantidade': 1}],
+        )
+        self.assertEqual(total, [{'produto_id': 1, 'quantidade': 5}, {'produto_id': 2, 'quantidade': 1}])
+
+    def test_subtrair_remove_produtos_zerados(self):
+        total = somar_produtos(
+            [{'produto_id': 1, 'quantidade': 2}, {'produto_id': 2, 'quantidade': 4}],
+            [{'produto_id': 1, 'quantidade': 2}, {'produto_id': 2, 'quantidade': 1}],
+            sinal=-1,
+        )
+        self.assertEqual(total, [{'produto_id': 2, 'quantidade': 3}])
+
+    def test_subtrair_mais_do_que_a_rota_leva(self):
+        with self.assertRaises(ErroPedidoRota):
+            somar_produtos([{'produto_id': 1, 'quantidade': 2}], [{'produto_id': 1, 'quantidade': 3}], sinal=-1)
+
+    def test_quantidade_invalida(self):
+        with self.assertRaises(ErroPedidoRota):
+            somar_produtos([], [{'produto_id': 1, 'quantidade': 0}])
+
+
+class EstoqueTests(TestCase):
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.produto = criar_produto(self.usuario, estoque=10)
+
+    def test_baixar_estoque_registra_saida(self):
+        movimentacoes = baixar_estoque(self.usuario, [{'produto': self.produto, 'quantidade': 3}], 'Saída')
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 7)
+        self.assertEqual(len(movimentacoes), 1)
+        self.assertEqual(
+            (movimentacoes[0].tipo, movimentacoes[0].quantidade, movimentacoes[0].estoque_anterior,
+             movimentacoes[0].estoque_atual),
+            ('saida', 3, 10, 7),
+        )
+
+    def test_baixar_estoque_insuficiente_nao_altera_nada(self):
+        outro = criar_produto(self.usuario, nome='Outro', estoque=1)
+        itens = [{'produto': self.produto, 'quantidade': 3}, {'produto': outro, 'quantidade': 2}]
+        with self.assertRaises(ErroPedidoRota):
+            baixar_estoque(self.usuario, itens, 'Saída')
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 10)
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_baixar_estoque_confere_o_saldo_atual(self):
+        # O objeto validado está desatualizado: o saldo é conferido de novo no banco
+        Produto.objects.filter(idProduto=self.produto.idProduto).update(estoque_atual=2)
+        with self.assertRaises(ErroPedidoRota):
+            baixar_estoque(self.usuario, [{'produto': self.produto, 'quantidade': 3}], 'Saída')
+
+    def test_devolver_estoque_registra_entrada(self):
+        devolver_estoque(self.usuario, [{'produto_id': self.produto.idProduto, 'quantidade': 4}], 'Devolução')
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 14)
+        movimentacao = MovimentacaoEstoque.objects.get()
+        self.assertEqual((movimentacao.tipo, movimentacao.quantidade), ('entrada', 4))
+
+    def test_devolver_estoque_ignora_produto_removido(self):
+        devolver_estoque(self.usuario, [{'produto_id': 999999, 'quantidade': 4}], 'Devolução')
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+
+class AtualizarParadasTests(TestCase):
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.produto = criar_produto(self.usuario, estoque=10)
+        self.rota = criar_rota(self.usuario, [{'produto_id': self.produto.idProduto, 'quantidade': 2}])
+
+    def test_adicionar_parada_baixa_estoque(self):
+        enderecos = ['Empresa', 'Destino 1', 'Destino 2', 'Empresa']
+        rota = atualizar_paradas(
+            self.usuario, self.rota, resultado_otimizacao(enderecos),
+            produtos_adicionados=[{'produto': self.produto, 'quantidade': 3}],
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 7)
+        self.assertEqual(rota.enderecos_otimizados, enderecos)
+        self.assertEqual(rota.produtos_quantidades, [{'produto_id': self.produto.idProduto, 'quantidade': 5}])
+
+    def test_remover_parada_devolve_estoque(self):
+        rota = atualizar_paradas(
+            self.usuario, self.rota, resultado_otimizacao(['Empresa', 'Empresa']),
+            produtos_devolvidos=[{'produto_id': self.produto.idProduto, 'quantidade': 2}],
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 12)
+        self.assertEqual(rota.produtos_quantidades, [])
+        self.assertEqual(MovimentacaoEstoque.objects.get().tipo, 'entrada')
+
+    def test_devolver_mais_do_que_a_rota_leva_nao_altera_nada(self):
+        with self.assertRaises(ErroPedidoRota):
+            atualizar_paradas(
+                self.usuario, self.rota, resultado_otimizacao(['Empresa', 'Empresa']),
+                produtos_devolvidos=[{'produto_id': self.produto.idProduto, 'quantidade': 5}],
+            )
+        self.produto.refresh_from_db()
+        self.rota.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 10)
+        self.assertEqual(self.rota.enderecos_otimizados, ['Empresa', 'Destino 1', 'Empresa'])
+
+    def test_rota_alterada_por_outra_requisicao(self):
+        desatualizada = Rota.objects.get(pk=self.rota.pk)
+        Rota.objects.filter(pk=self.rota.pk).update(enderecos_otimizados=['Empresa', 'Outro', 'Empresa'])
+        with self.assertRaises(ErroPedidoRota):
+            atualizar_paradas(
+                self.usuario, desatualizada, resultado_otimizacao(['Empresa', 'Empresa']),
+                produtos_adicionados=[{'produto': self.produto, 'quantidade': 1}],
+            )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 10)
+
+    def test_rota_concluida(self):
+        Rota.objects.filter(pk=self.rota.pk).update(status='concluido')
+        with self.assertRaises(ErroPedidoRota):
+            atualizar_paradas(self.usuario, self.rota, resultado_otimizacao(['Empresa', 'Empresa']))
+
+
+@mock.patch('rotas.jobs.ROTAS_JOBS_NO_PROCESSO', False)
+class RotaJobTests(TestCase):
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.produto = criar_produto(self.usuario, estoque=10)
+        self.dados = {
+            'enderecos_destino': ['Destino 1'],
+            'produtos_quantidades': [{'produto_id': self.produto.idProduto, 'quantidade': 4}],
+        }
+
+    def enfileirar(self):
+        return enfileirar_job(self.usuario, self.dados, None, [{'produto': self.produto, 'quantidade': 4}])
+
+    def test_enfileirar_reserva_estoque(self):
+        job = self.enfileirar()
+        self.produto.refresh_from_db()
+        self.assertEqual(job.status, 'pendente')
+        self.assertEqual(self.produto.estoque_atual, 6)
+        reserva = job.parametros['reservas'][0]
+        self.assertEqual((reserva['produto_id'], reserva['quantidade']), (self.produto.idProduto, 4))
+        self.assertTrue(MovimentacaoEstoque.objects.filter(id=reserva['movimentacao_id'], tipo='saida').exists())
+
+    def test_reivindicar_marca_processando_uma_unica_vez(self):
+        job = self.enfileirar()
+        reivindicado = reivindicar_proximo()
+        self.assertEqual(reivindicado.id, job.id)
+        self.assertEqual(reivindicado.status, 'processando')
+        self.assertEqual(reivindicado.tentativas, 1)
+        self.assertIsNotNone(reivindicado.data_inicio)
+        self.assertIsNone(reivindicar_proximo())
+
+    def test_reivindicar_o_mais_antigo(self):
+        primeiro = self.enfileirar()
+        self.enfileirar()
+        self.assertEqual(reivindicar_proximo().id, primeiro.id)
+
+    def test_falhar_devolve_reserva_uma_unica_vez(self):
+        job = self.enfileirar()
+        falhar_job(job, 'erro')
+        falhar_job(job, 'erro')
+        job.refresh_from_db()
+        self.produto.refresh_from_db()
+        self.assertEqual((job.status, job.erro), ('erro', 'erro'))
+        self.assertEqual(self.produto.estoque_atual, 10)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(tipo='entrada').count(), 1)
+
+    def test_recuperar_abandonados_volta_para_a_fila(self):
+        job = self.enfileirar()
+        reivindicar_proximo()
+        RotaJob.objects.filter(id=job.id).update(
+            data_inicio=timezone.now() - timedelta(minutes=ROTAS_JOBS_TIMEOUT_MINUTOS + 1)
+        )
+        recuperar_abandonados()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.data_inicio), ('pendente', None))
+        self.assertEqual(reivindicar_proximo().tentativas, 2)
+
+    def test_recuperar_abandonados_apos_max_tentativas(self):
+        job = self.enfileirar()
+        reivindicar_proximo()
+        RotaJob.objects.filter(id=job.id).update(
+            tentativas=ROTAS_JOBS_MAX_TENTATIVAS,
+            data_inicio=timezone.now() - timedelta(minutes=ROTAS_JOBS_TIMEOUT_MINUTOS + 1),
+        )
+        recuperar_abandonados()
+        job.refresh_from_db()
+        self.produto.refresh_from_db()
+        self.assertEqual(job.status, 'erro')
+        self.assertEqual(self.produto.estoque_atual, 10)
+
+    def test_recuperar_abandonados_ignora_jobs_recentes(self):
+        job = self.enfileirar()
+        reivindicar_proximo()
+        recuperar_abandonados()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'processando')
+
+    def test_processar_cria_rota_e_mantem_a_reserva(self):
+        self.enfileirar()
+        job = reivindicar_proximo()
+        processar_job(job, MotorFalso(resultado_otimizacao(['Empresa', 'Destino 1', 'Empresa'])))
+        job.refresh_from_db()
+        self.produto.refresh_from_db()
+        self.assertEqual(job.status, 'concluido')
+        self.assertIsNotNone(job.rota)
+        self.assertEqual(self.produto.estoque_atual, 6)
+        movimentacao = MovimentacaoEstoque.objects.get()
+        self.assertEqual(movimentacao.observacao, f'Saída para rota {job.rota.id} - Sem motorista')
+
+    def test_processar_com_falha_devolve_reserva(self):
+        self.enfileirar()
+        job = reivindicar_proximo()
+        processar_job(job, MotorFalso({'sucesso': False, 'erro': 'Endereço não encontrado'}))
+        job.refresh_from_db()
+        self.produto.refresh_from_db()
+        self.assertEqual(job.status, 'erro')
+        self.assertIn('Endereço não encontrado', job.erro)
+        self.assertIsNone(job.rota)
+        self.assertEqual(self.produto.estoque_atual, 10)
+
+
+class RotaGeometriaViewTests(TestCase):
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.rota = criar_rota(self.usuario, [], geometria='_p~iF~ps|U_ulLnnqC')
+
+    def url(self, rota):
+        return reverse('rota-geometria', kwargs={'id': rota.id})
+
+    def test_retorna_polyline_com_etag(self):
+        resposta = self.client.get(self.url(self.rota))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['polyline'], '_p~iF~ps|U_ulLnnqC')
+        self.assertTrue(resposta['ETag'])
+        self.assertIn('no-cache', resposta['Cache-Control'])
+
+    def test_if_none_match_retorna_304(self):
+        etag = self.client.get(self.url(self.rota))['ETag']
+        resposta = self.client.get(self.url(self.rota), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], etag)
+
+    def test_etag_muda_com_a_geometria(self):
+        etag = self.client.get(self.url(self.rota))['ETag']
+        Rota.objects.filter(pk=self.rota.pk).update(geometria='_p~iF~ps|U')
+        resposta = self.client.get(self.url(self.rota), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_rota_sem_geometria(self):
+        rota = criar_rota(self.usuario, [])
+        self.assertEqual(self.client.get(self.url(rota)).status_code, 404)
+
+    def test_rota_de_outro_usuario(self):
+        rota = criar_rota(criar_usuario('98765432000199'), [], geometria='_p~iF~ps|U')
+        self.assertEqual(self.client.get(self.url(rota)).status_code, 404)
+
+
+class LimiteInferiorTests(SimpleTestCase):
+    def test_nao_supera_o_otimo(self):
+        for semente in range(5):
+            matriz = matriz_aleatoria(8, semente)
+            otimo = otimo_forca_bruta(matriz)
+            limite = solver.limite_inferior(matriz)
+            self.assertLessEqual(limite, otimo + 1e-6)
+            self.assertGreater(limite, 0.5 * otimo)
+
+    def test_supera_o_limite_da_reducao(self):
+        matriz = matriz_aleatoria(30, assimetria=0)
+        self.assertGreaterEqual(solver.limite_inferior(matriz), solver.limite_reducao(matriz))
+
+    def test_pares_sem_custo_finito(self):
+        matriz = matriz_aleatoria(6)
+        matriz[1, 2] = np.inf
+        self.assertEqual(solver.limite_inferior(matriz), solver.limite_reducao(matriz))
+
+    def test_prazo_vencido(self):
+        self.assertIsNone(solver.limite_inferior(matriz_aleatoria(20), prazo=time.perf_counter()))
+
+    def test_prazo_curto_mantem_limite_valido(self):
+        matriz = matriz_aleatoria(300)
+        inicio = time.perf_counter()
+        limite = solver.limite_inferior(matriz, prazo=inicio + 0.01)
+        self.assertLess(time.perf_counter() - inicio, 0.1)
+        custo = solver.custo_rota(matriz, solver.vizinho_mais_proximo(matriz))
+        self.assertLessEqual(limite, custo)
+        self.assertLessEqual(limite, solver.limite_inferior(matriz))
+
+
+class ResolverPrazoTests(SimpleTestCase):
+    def test_respeita_o_prazo(self):
+        matriz = matriz_aleatoria(300)
+        inicio = time.perf_counter()
+        resultado = solver.resolver(matriz, 100)
+        self.assertLess(time.perf_counter() - inicio, 0.2)
+        self.assertEqual(sorted(resultado['rota'][:-1]), list(range(300)))
+        self.assertLessEqual(resultado['limite_inferior'], resultado['custo'])
+        self.assertGreaterEqual(resultado['gap_percentual'], 0)
+
+    def test_sem_prazo_sem_gap(self):
+        resultado = solver.resolver(matriz_aleatoria(40), 0)
+        self.assertIsNone(resultado['limite_inferior'])
+        self.assertIsNone(resultado['gap_percentual'])
+
+
+class MatrizesLimitadasTests(SimpleTestCase):
+    def setUp(self):
+        self.grafo = gerar_grade(40, semente=1)
+        # Paradas em um canto da grade: as buscas param bem antes do resto dela
+        self.nos = [int(i * 40 + j) for i, j in [(0, 0), (3, 7), (8, 2), (10, 10), (5, 12), (12, 1)]]
+
+    def sem_coordenadas(self):
+        csr = grafo_csr.GrafoCSR.de_compacto(self.grafo)
+        csr.nos_lat = csr.nos_lon = None
+        return csr
+
+    def test_igual_a_busca_completa(self):
+        csr = grafo_csr.GrafoCSR.de_compacto(self.grafo)
+        for objetivo in grafo_csr.OBJETIVOS:
+            limitadas = csr.matrizes(self.nos, objetivo=objetivo)
+            completas = self.sem_coordenadas().matrizes(self.nos, objetivo=objetivo)
+            np.testing.assert_allclose(limitadas, completas)
+
+    def test_limite_curto_busca_de_novo(self):
+        csr = grafo_csr.GrafoCSR.de_compacto(self.grafo)
+        with mock.patch.object(grafo_csr, 'GRAFOS_CSR_LIMITE_FATOR', 0.1):
+            limitadas = csr.matrizes(self.nos)
+        np.testing.assert_allclose(limitadas, self.sem_coordenadas().matrizes(self.nos))
+        self.assertTrue(np.isfinite(limitadas[0]).all())
+
+
+class BuscaLocalTests(SimpleTestCase):
+    def test_dois_opt_chega_a_um_otimo_local(self):
+        matriz = matriz_aleatoria(25, semente=2)
+        inicial = list(range(25)) + [0]
+        rota, melhorias = solver.dois_opt(matriz, inicial, time.perf_counter() + 10)
+        self.assertGreater(melhorias, 0)
+        self.assertEqual((rota[0], rota[-1], sorted(rota[:-1])), (0, 0, list(range(25))))
+        custo = solver.custo_rota(matriz, rota)
+        self.assertLess(custo, solver.custo_rota(matriz, inicial))
+        # Nenhuma inversão de trecho melhora a rota (o ganho considera a matriz assimétrica)
+        for i in range(1, 25):
+            for j in range(i + 1, 25):
+                vizinha = rota[:i] + rota[i:j + 1][::-1] + rota[j + 1:]
+                self.assertGreaterEqual(solver.custo_rota(matriz, vizinha), custo - 1e-6)
+
+    def test_or_opt_chega_a_um_otimo_local(self):
+        matriz = matriz_aleatoria(20, semente=3)
+        inicial = list(range(20)) + [0]
+        vizinhos = solver.listas_vizinhos(matriz, k=19)
+        rota, melhorias = solver.or_opt(matriz, inicial, vizinhos, time.perf_counter() + 10)
+        self.assertGreater(melhorias, 0)
+        self.assertEqual((rota[0], rota[-1], sorted(rota[:-1])), (0, 0, list(range(20))))
+        custo = solver.custo_rota(matriz, rota)
+        # Nenhum trecho de até 3 paradas melhora a rota em outra posição, em qualquer sentido
+        for tamanho in range(1, 4):
+            for i in range(1, 21 - tamanho):
+                trecho = rota[i:i + tamanho]
+                restante = rota[:i] + rota[i + tamanho:]
+                for destino in range(len(restante) - 1):
+                    for movido in (trecho, trecho[::-1]):
+                        vizinha = restante[:destino + 1] + movido + restante[destino + 1:]
+                        self.assertGreaterEqual(solver.custo_rota(matriz, vizinha), custo - 1e-6)
+
+    def test_busca_local_respeita_o_prazo(self):
+        matriz = matriz_aleatoria(400)
+        inicio = time.perf_counter()
+        rota, _ = solver.busca_local(matriz, solver.vizinho_mais_proximo(matriz), inicio + 0.05)
+        self.assertLess(time.perf_counter() - inicio, 0.25)
+        self.assertEqual(sorted(rota[:-1]), list(range(400)))
+
+
+class HeldKarpTests(SimpleTestCase):
+    def test_igual_a_forca_bruta(self):
+        for semente in range(4):
+            matriz = matriz_aleatoria(8, semente)
+            rota = solver.held_karp(matriz)
+            self.assertEqual((rota[0], rota[-1], sorted(rota[:-1])), (0, 0, list(range(8))))
+            self.assertAlmostEqual(solver.custo_rota(matriz, rota), otimo_forca_bruta(matriz), places=6)
+
+    def test_rotas_minimas(self):
+        self.assertEqual(solver.held_karp([[0]]), [0, 0])
+        self.assertEqual(solver.held_karp([[0, 5], [7, 0]]), [0, 1, 0])
+
+    def test_resolver_usa_solucao_exata_em_rotas_pequenas(self):
+        matriz = matriz_aleatoria(solver.SOLVER_EXATO_MAX_PONTOS, semente=5)
+        resultado = solver.resolver(matriz, 0)
+        self.assertEqual(resultado['metodo'], 'exato')
+        self.assertEqual(resultado['gap_percentual'], 0.0)
+        self.assertEqual(resultado['limite_inferior'], resultado['custo'])
+
+
+class GrafoCSRTests(SimpleTestCase):
+    def setUp(self):
+        self.grafo = gerar_grade(12, semente=4)
+        self.csr = grafo_csr.GrafoCSR.de_compacto(self.grafo)
+        self.G = self.grafo.para_networkx()
+        self.nos = [0, 17, 58, 71, 100, 143]
+
+    def test_matrizes_iguais_ao_networkx(self):
+        for objetivo, peso in [('distancia', 'length'), ('tempo', 'travel_time')]:
+            matriz = self.csr.matrizes(self.nos, objetivo=objetivo)[grafo_csr.OBJETIVOS.index(objetivo)]
+            for i, origem in enumerate(self.nos):
+                comprimentos = nx.single_source_dijkstra_path_length(self.G, origem, weight=peso)
+                for j, destino in enumerate(self.nos):
+                    self.assertAlmostEqual(matriz[i, j], comprimentos.get(destino, math.inf), delta=1e-3)
+
+    def test_caminho_tem_o_custo_minimo(self):
+        for origem, destino in itertools.permutations(self.nos[:4], 2):
+            caminho = self.csr.caminho(origem, destino)
+            self.assertEqual((caminho[0], caminho[-1]), (origem, destino))
+            custo = sum(
+                min(aresta['length'] for aresta in self.G[u][v].values())
+                for u, v in zip(caminho, caminho[1:])
+            )
+            esperado = nx.shortest_path_length(self.G, origem, destino, weight='length')
+            self.assertAlmostEqual(custo, esperado, delta=1e-3)
+            self.assertAlmostEqual(self.csr.distancia(origem, destino), esperado, delta=1e-3)
+
+    def test_inalcancavel(self):
+        # Nó sem arestas acrescentado ao grafo
+        csr = grafo_csr.GrafoCSR(
+            np.append(self.csr.offsets, self.csr.offsets[-1]), self.csr.destinos,
+            self.csr.comprimentos, self.csr.tempos,
+        )
+        distancias, tempos = csr.matrizes([0, 144])
+        self.assertEqual((distancias[0, 1], tempos[1, 0]), (math.inf, math.inf))
+        self.assertIsNone(csr.caminho(0, 144))
+        self.assertEqual(csr.caminho(144, 144), [144])
+
+
+class ContracaoHierarquicaTests(SimpleTestCase):
+    def setUp(self):
+        self.csr = grafo_csr.GrafoCSR.de_compacto(gerar_grade(10, semente=6))
+        self.nos = [0, 9, 23, 45, 67, 88, 99]
+
+    def test_matrizes_iguais_ao_dijkstra(self):
+        for objetivo in grafo_csr.OBJETIVOS:
+            ch = ContracaoHierarquica.construir(self.csr, objetivo=objetivo)
+            self.assertGreater(ch.num_atalhos, 0)
+            np.testing.assert_allclose(
+                ch.matrizes(self.nos), self.csr.matrizes(self.nos, objetivo=objetivo), rtol=1e-5,
+            )
+
+    def test_caminho_desempacota_os_atalhos(self):
+        ch = ContracaoHierarquica.construir(self.csr)
+        pesos = {
+            (u, int(self.csr.destinos[k])): float(self.csr.comprimentos[k])
+            for u in range(self.csr.num_nos)
+            for k in range(self.csr.offsets[u], self.csr.offsets[u + 1])
+        }
+        for origem, destino in itertools.permutations(self.nos[:4], 2):
+            caminho = ch.caminho(origem, destino)
+            self.assertEqual((caminho[0], caminho[-1]), (origem, destino))
+            custo = sum(pesos[(u, v)] for u, v in zip(caminho, caminho[1:]))
+            self.assertAlmostEqual(custo, self.csr.distancia(origem, destino), delta=1e-2)
+            self.assertAlmostEqual(ch.distancia(origem, destino), custo, delta=1e-2)
+
+    def test_objetivo_diferente_da_hierarquia(self):
+        ch = ContracaoHierarquica.construir(self.csr, objetivo='tempo')
+        with self.assertRaises(ValueError):
+            ch.matrizes(self.nos, objetivo='distancia')
+
+
+class IndiceEspacialTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.grafo = SimpleNamespace(
+            nos_lat=rng.uniform(-9.70, -9.60, 3000), nos_lon=rng.uniform(-35.80, -35.70, 3000),
+            num_nos=3000, versao='v1',
+        )
+        self.indice = IndiceEspacial.construir(self.grafo)
+        # Pontos dentro da grade, na borda e bem fora dela
+        self.pontos = np.concatenate([
+            np.column_stack([rng.uniform(-9.70, -9.60, 50), rng.uniform(-35.80, -35.70, 50)]),
+            [[-9.70, -35.80], [-9.55, -35.75], [-9.65, -36.20], [-10.50, -34.90]],
+        ])
+
+    def test_igual_a_forca_bruta(self):
+        nos, distancias = self.indice.mais_proximos(self.pontos)
+        todas = distancias_pares(
+            np.repeat(self.pontos, self.grafo.num_nos, axis=0),
+            np.tile(np.column_stack([self.grafo.nos_lat, self.grafo.nos_lon]), (len(self.pontos), 1)),
+        ).reshape(len(self.pontos), -1)
+        np.testing.assert_allclose(distancias, todas.min(axis=1))
+        np.testing.assert_allclose(todas[np.arange(len(self.pontos)), nos], todas.min(axis=1))
+
+    def test_celulas_pequenas(self):
+        indice = IndiceEspacial.construir(self.grafo, nos_por_celula=1)
+        np.testing.assert_allclose(indice.mais_proximos(self.pontos)[1], self.indice.mais_proximos(self.pontos)[1])
+
+
+class GazetteerTests(SimpleTestCase):
+    CSV = (
+        'cep;logradouro;bairro;cidade;latitude;longitude\n'
+        '57035-000;Rua Jangadeiros Alagoanos;Pajuçara;Maceió;-9.664;-35.712\n'
+        '57035000;;;;-9.666;-35.714\n'
+        ';Avenida Fernandes Lima;Farol;Maceió;-9.640;-35.730\n'
+        'sem cep;Rua Sem Coordenadas;Centro;Maceió;;\n'
+    )
+
+    def carregar(self, compactado=False):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        caminho = f'{diretorio.name}/gazetteer.csv' + ('.gz' if compactado else '')
+        with (gzip.open if compactado else open)(caminho, 'wt', encoding='utf-8') as arquivo:
+            arquivo.write(self.CSV)
+        return Gazetteer.carregar(caminho)
+
+    def test_extrair_cep(self):
+        self.assertEqual(extrair_cep('Rua A, 10 - AL, 57035-000'), 57035000)
+        self.assertEqual(extrair_cep('CEP 57035000'), 57035000)
+        self.assertIsNone(extrair_cep('Telefone 8299999999'))
+        self.assertIsNone(extrair_cep(None))
+
+    def test_localiza_por_cep_e_logradouro(self):
+        for compactado in (False, True):
+            gazetteer = self.carregar(compactado)
+            self.assertEqual(len(gazetteer), 3)
+            # Centroide das linhas com o mesmo CEP
+            # Coordenadas em float32: comparadas com tolerância
+            np.testing.assert_allclose(gazetteer.localizar_cep('57035-000'), (-9.665, -35.713), atol=1e-5)
+            np.testing.assert_allclose(
+                gazetteer.localizar('Rua X, 1, Centro, Recife - PE, 57035000'), (-9.665, -35.713), atol=1e-5,
+            )
+            np.testing.assert_allclose(
+                gazetteer.localizar('Avenida Fernandes Lima, 1000, Farol, Maceió - AL, 57000-000'),
+                (-9.64, -35.73), atol=1e-5,
+            )
+            np.testing.assert_allclose(
+                gazetteer.localizar_logradouro('RUA JANGADEIROS ALAGOANOS', 'Pajucara', 'maceio'),
+                (-9.664, -35.712), atol=1e-5,
+            )
+            self.assertIsNone(gazetteer.localizar('Rua Sem Coordenadas, 5, Centro, Maceió - AL'))
+            self.assertEqual(
+                gazetteer.estatisticas(),
+                {'acertos_cep': 1, 'acertos_rua': 1, 'falhas': 1, 'ceps': 1, 'logradouros': 2},
+            )
+
+
+class GeometriaTests(SimpleTestCase):
+    def test_polyline_exemplo_do_google(self):
+        coordenadas = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+        self.assertEqual(codificar_polyline(coordenadas), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        np.testing.assert_allclose(decodificar_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), coordenadas)
+
+    def test_polyline_ida_e_volta(self):
+        rng = np.random.default_rng(8)
+        coordenadas = np.column_stack([rng.uniform(-9.7, -9.6, 200), rng.uniform(-35.8, -35.7, 200)])
+        for precisao in (5, 6):
+            decodificadas = decodificar_polyline(codificar_polyline(coordenadas, precisao), precisao)
+            np.testing.assert_allclose(decodificadas, np.round(coordenadas, precisao), atol=1e-9)
+        self.assertEqual(codificar_polyline([]), '')
+        self.assertEqual(decodificar_polyline(''), [])
+
+    def test_simplificar(self):
+        # Trecho reto com desvios de ~1 m: sobram as pontas
+        lats = np.linspace(-9.70, -9.69, 50)
+        reta = np.column_stack([lats, np.full(50, -35.75) + np.tile([0.0, 0.00001], 25)])
+        self.assertEqual(simplificar(reta, tolerancia_m=5), [reta[0].tolist(), reta[-1].tolist()])
+        self.assertEqual(len(simplificar(reta, tolerancia_m=0)), 50)
+        # Ida e volta pela mesma via: o ponto de retorno é mantido
+        ida_e_volta = [[-9.70, -35.75], [-9.69, -35.75], [-9.68, -35.75], [-9.69, -35.75], [-9.70, -35.75]]
+        self.assertIn([-9.68, -35.75], simplificar(ida_e_volta, tolerancia_m=5))
+        # Nenhum ponto removido fica a mais da tolerância da linha simplificada
+        curva = [[-9.70 + 0.001 * k, -35.75 + 0.0005 * math.sin(k / 3)] for k in range(60)]
+        simplificada = simplificar(curva, tolerancia_m=10)
+        self.assertLess(len(simplificada), len(curva))
+        self.assertEqual((simplificada[0], simplificada[-1]), (curva[0], curva[-1]))
+        escala = np.array([111195.0, 111195.0 * math.cos(math.radians(-9.7))])
+        pontos, linha = np.array(curva) * escala, np.array(simplificada) * escala
+        for ponto in pontos:
+            distancias = []
+            for a, b in zip(linha, linha[1:]):
+                t = np.clip((ponto - a) @ (b - a) / ((b - a) @ (b - a)), 0.0, 1.0)
+                distancias.append(np.hypot(*(ponto - a - t * (b - a))))
+            self.assertLessEqual(min(distancias), 10.5)
+
+
+class LadrilhosTests(SimpleTestCase):
+    def test_faixa_ladrilhos(self):
+        coordenadas = [(-9.66, -35.74), (-9.61, -35.71)]
+        self.assertEqual(ladrilhos.faixa_ladrilhos(coordenadas, margem=0.0, lado=0.05), (-194, -715, -193, -715))
+        self.assertEqual(ladrilhos.faixa_ladrilhos(coordenadas, margem=0.02, lado=0.05), (-194, -716, -192, -714))
+        faixa = ladrilhos.faixa_ladrilhos([(0.01, 0.01)], margem=0.0, lado=0.05)
+        self.assertEqual(ladrilhos.ladrilhos_da_faixa(faixa), [(0, 0)])
+        self.assertEqual(ladrilhos.faixa_da_chave(ladrilhos.chave_regiao(faixa)), faixa)
+        self.assertIsNone(ladrilhos.faixa_da_chave('regiao_maceio'))
+
+    def test_dividir_e_unir_reproduz_o_grafo(self):
+        grafo = gerar_grade(12, semente=9)
+        partes = ladrilhos.dividir_em_ladrilhos(grafo, lado=0.003)
+        self.assertGreater(len(partes), 4)
+        for (i, j), parte in partes.items():
+            sul, oeste, norte, leste = ladrilhos.limites_ladrilho(i, j, lado=0.003)
+            # Cada aresta do ladrilho tem ao menos uma ponta dentro dele
+            dentro = ((parte.nos_lat >= sul) & (parte.nos_lat < norte)
+                      & (parte.nos_lon >= oeste) & (parte.nos_lon < leste))
+            self.assertTrue((dentro[parte.arestas_origem] | dentro[parte.arestas_destino]).all())
+
+        unido = ladrilhos.unir_ladrilhos(list(partes.values()))
+        for nome in ('nos_osm', 'nos_lat', 'nos_lon', 'arestas_origem', 'arestas_destino',
+                     'arestas_comprimento', 'arestas_tempo'):
+            np.testing.assert_array_equal(getattr(unido, nome), getattr(grafo, nome), err_msg=nome)
+
+    def test_unir_mantem_a_aresta_mais_curta(self):
+        def grafo(nos_osm, comprimento, tempo):
+            return GrafoCompacto(
+                np.array(nos_osm, dtype=np.int64), np.array([-9.6, -9.61]), np.array([-35.7, -35.71]),
+                np.array([0], dtype=np.int32), np.array([1], dtype=np.int32),
+                np.array([comprimento], dtype=np.float32), np.array([tempo], dtype=np.float32),
+            )
+
+        unido = ladrilhos.unir_ladrilhos([grafo([10, 20], 150.0, 20.0), grafo([10, 20], 120.0, 30.0),
+                                          ladrilhos.grafo_vazio()])
+        self.assertEqual(unido.nos_osm.tolist(), [10, 20])
+        self.assertEqual((unido.arestas_comprimento.tolist(), unido.arestas_tempo.tolist()), ([120.0], [30.0]))
+        self.assertEqual(ladrilhos.unir_ladrilhos([ladrilhos.grafo_vazio()]).num_nos, 0)
+
+
+class CacheSolucoesTests(TestCase):
+    def test_chave_independe_da_ordem_das_paradas(self):
+        chave = chave_solucao('v1', 10, [30, 20, 40], {'objetivo': 'tempo'})
+        self.assertEqual(chave, chave_solucao('v1', 10, [40, 30, 20], {'objetivo': 'tempo'}))
+        self.assertEqual(chave, chave_solucao('v1', np.int64(10), np.array([20, 40, 30]), {'objetivo': 'tempo'}))
+        for outra in (
+            chave_solucao('v2', 10, [30, 20, 40], {'objetivo': 'tempo'}),
+            chave_solucao('v1', 20, [30, 10, 40], {'objetivo': 'tempo'}),
+            chave_solucao('v1', 10, [30, 20, 40]),
+            chave_solucao('v1', 10, [30, 20, 40, 40], {'objetivo': 'tempo'}),
+        ):
+            self.assertNotEqual(chave, outra)
+
+    def test_reordenar(self):
+        # Paradas no mesmo nó recebem os índices na ordem de entrada
+        self.assertEqual(reordenar([10, 30, 20, 30], [20, 30, 10, 30]), [2, 1, 0, 3])
+        self.assertIsNone(reordenar([10, 20], [10, 30]))
+        self.assertIsNone(reordenar([10, 20, 30], [10, 20]))
+
+    def test_salva_e_obtem_em_outra_ordem(self):
+        cache = CacheSolucoes()
+        cache.salvar(chave_solucao('v1', 1, [5, 6, 7]), 'v1', [1, 7, 5, 6, 1], 1234.5, 9, qualidade={'gap': 1.0})
+        solucao = cache.obter(chave_solucao('v1', 1, [7, 6, 5]))
+        self.assertEqual(solucao['nos'], [1, 7, 5, 6, 1])
+        self.assertEqual((solucao['distancia_m'], solucao['tempo_minutos']), (1234.5, 9))
+        self.assertEqual(reordenar([1, 7, 6, 5], solucao['nos'][:-1]), [0, 1, 3, 2])
+        self.assertIsNone(cache.obter(chave_solucao('v2', 1, [5, 6, 7])))
+        self.assertEqual(cache.estatisticas()['acertos'], 1)
+
+    def test_expiradas(self):
+        cache = CacheSolucoes(ttl_horas=1)
+        chave = chave_solucao('v1', 1, [2])
+        cache.salvar(chave, 'v1', [1, 2, 1], 10.0, 1)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(hours=2)):
+            self.assertIsNone(cache.obter(chave))
+            self.assertEqual(cache.limpar_expirados(), 1)
+
+
+class FilaJobsTests(SimpleTestCase):
+    def test_verificacao_periodica_sem_jobs_novos(self):
+        fila = FilaJobs(workers=1, intervalo=0.02)
+        with mock.patch('rotas.jobs.processar_pendentes') as processar, \
+                mock.patch('rotas.motor.get_motor_rotas'), mock.patch('rotas.jobs.connection'):
+            fila.iniciar_verificacao()
+            fila.iniciar_verificacao()
+            limite = time.monotonic() + 5
+            while processar.call_count < 3 and time.monotonic() < limite:
+                time.sleep(0.01)
+            fila.parar_verificacao()
+            fila._verificacao.join(timeout=1)
+            fila._executor.shutdown(wait=True)
+        self.assertGreaterEqual(processar.call_count, 3)
+        self.assertFalse(fila._verificacao.is_alive())
+
+    def test_intervalo_zero_desliga(self):
+        fila = FilaJobs(workers=1, intervalo=0)
+        fila.iniciar_verificacao()
+        self.assertIsNone(fila._verificacao)
+
+
+class LimpezaDistanciasTests(TestCase):
+    def test_remove_versoes_fora_do_armazenamento(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        store = GrafoStore(diretorio.name)
+        store.salvar('regiao', gerar_grade(4, semente=1))
+        antiga = store.versoes()['regiao']
+        store.salvar('regiao', gerar_grade(4, semente=2))
+        atual = store.versoes()['regiao']
+        self.assertNotEqual(antiga, atual)
+
+        cache = CacheDistancias()
+        for versao in (antiga, atual):
+            cache.salvar_muitos(versao, {(1, 2): (100.0, 10.0), (2, 1): (math.inf, math.inf)})
+        self.assertEqual(cache.limpar_versoes(store.versoes().values()), 2)
+        self.assertEqual(set(DistanciaCache.objects.values_list('versao_grafo', flat=True)), {atual})
+        self.assertEqual(cache.obter_muitos(antiga, [(1, 2)]), {})
+        self.assertEqual(cache.obter_muitos(atual, [(1, 2)]), {(1, 2): (100.0, 10.0)})
@@ -8,9 +8,15 @@ from .views import (
     RotaCreateView,
     RotaListView,
     RotaDetailView,
+    RotaGeometriaView,
     RotaStatusUpdateView,
     RotaDeleteView,
-    PrecosCombustivelView
+    RotaParadaAdicionarView,
+    RotaParadaRemoverView,
+    RotaJobDetailView,
+    RotaJobRotaView,
+    PrecosCombustivelView,
+    MotorEstatisticasView
 )
 
 urlpatterns = [
@@ -25,9 +31,19 @@ urlpatterns = [
     path('rotas/', RotaListView.as_view(), name='rota-list'),
     path('rotas/criar/', RotaCreateView.as_view(), name='rota-create'),
     path('rotas/<int:id>/', RotaDetailView.as_view(), name='rota-detail'),
+    path('rotas/<int:id>/geometria/', RotaGeometriaView.as_view(), name='rota-geometria'),
     path('rotas/<int:id>/status/', RotaStatusUpdateView.as_view(), name='rota-status-update'),
     path('rotas/<int:id>/excluir/', RotaDeleteView.as_view(), name='rota-delete'),
+    path('rotas/<int:id>/paradas/adicionar/', RotaParadaAdicionarView.as_view(), name='rota-parada-adicionar'),
+    path('rotas/<int:id>/paradas/remover/', RotaParadaRemoverView.as_view(), name='rota-parada-remover'),
+    
+    # Jobs de otimização assíncrona
+    path('rotas/jobs/<uuid:id>/', RotaJobDetailView.as_view(), name='rota-job-detail'),
+    path('rotas/jobs/<uuid:id>/rota/', RotaJobRotaView.as_view(), name='rota-job-rota'),
     
     # Preços de Combustível
     path('precos-combustivel/', PrecosCombustivelView.as_view(), name='precos-combustivel'),
+    
+    # Métricas do motor de rotas
+    path('motor/estatisticas/', MotorEstatisticasView.as_view(), name='motor-estatisticas'),
 ] 
\ No newline at end of file
@@ -0,0 +1,85 @@
+# Velocidade das vias (maxspeed e tipo de via do OSM) e tempo de percurso das arestas
+import os
+import re
+
+import numpy as np
+
+# Velocidade (km/h) das vias sem maxspeed nem tipo conhecido, e dos grafos
+# persistidos antes dos tempos de percurso
+VELOCIDADE_PADRAO_KMH = float(os.getenv('GRAFOS_VELOCIDADE_PADRAO_KMH', '30'))
+
+# Velocidade típica (km/h) por tipo de via, usada quando a via não tem maxspeed
+VELOCIDADES_VIA_KMH = {
+    'motorway': 100,
+    'motorway_link': 60,
+    'trunk': 80,
+    'trunk_link': 50,
+    'primary': 60,
+    'primary_link': 40,
+    'secondary': 50,
+    'secondary_link': 40,
+    'tertiary': 40,
+    'tertiary_link': 30,
+    'unclassified': 30,
+    'residential': 30,
+    'living_street': 10,
+    'road': 30,
+    'busway': 30,
+}
+
+# Limites implícitos de maxspeed (ex.: 'BR:urban', 'DE:rural')
+VELOCIDADES_IMPLICITAS_KMH = {
+    'urban': 50,
+    'rural': 80,
+    'motorway': 110,
+    'trunk': 90,
+    'living_street': 10,
+    'walk': 7,
+}
+
+_NUMERO = re.compile(r'\d+(?:\.\d+)?')
+
+
+def velocidade_maxima(maxspeed):
+    """
+    Converte a tag maxspeed do OSM em km/h ('60', '40 mph', 'BR:urban',
+    '60;80'). Retorna None quando o valor não é reconhecido.
+    """
+    if not maxspeed:
+        return None
+    if isinstance(maxspeed, (list, tuple)):
+        valores = [v for v in (velocidade_maxima(m) for m in maxspeed) if v is not None]
+        return min(valores) if valores else None
+    maxspeed = str(maxspeed).strip().lower()
+    numeros = [float(n) for n in _NUMERO.findall(maxspeed)]
+    if numeros:
+        velocidade = min(numeros)
+        if 'mph' in maxspeed:
+            velocidade *= 1.609344
+        elif 'knots' in maxspeed:
+            velocidade *= 1.852
+        return velocidade if velocidade > 0 else None
+    return VELOCIDADES_IMPLICITAS_KMH.get(maxspeed.rsplit(':', 1)[-1])
+
+
+def velocidade_via(highway, maxspeed=None):
+    """
+    Velocidade (km/h) de uma via: maxspeed quando presente, senão a
+    velocidade típica do tipo de via (highway pode ser uma lista, nas
+    arestas simplificadas do OSMnx)
+    """
+    velocidade = velocidade_maxima(maxspeed)
+    if velocidade is not None:
+        return velocidade
+    if isinstance(highway, (list, tuple)):
+        velocidades = [VELOCIDADES_VIA_KMH[h] for h in highway if h in VELOCIDADES_VIA_KMH]
+        return min(velocidades) if velocidades else VELOCIDADE_PADRAO_KMH
+    return VELOCIDADES_VIA_KMH.get(highway, VELOCIDADE_PADRAO_KMH)
+
+
+def tempos_percurso(comprimentos, velocidades_kmh=VELOCIDADE_PADRAO_KMH):
+    """
+    Tempo de percurso (segundos, float32) de arestas com os comprimentos (m)
+    e velocidades (km/h) informados
+    """
+    return (np.asarray(comprimentos, dtype=np.float64) / (np.asarray(velocidades_kmh, dtype=np.float64) / 3.6)).astype(np.float32)
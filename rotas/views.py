@@ -1,28 +1,47 @@
+import hashlib
+
 from rest_framework import generics, filters, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.shortcuts import get_object_or_404
-from .models import Veiculo, Rota
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from .models import Veiculo, Rota, RotaJob
 from .serializers import (
     VeiculoSerializer, 
     RotaSerializer, 
     RotaCreateSerializer, 
-    RotaStatusUpdateSerializer
+    RotaStatusUpdateSerializer,
+    RotaJobSerializer,
+    RotaParadaAdicionarSerializer,
+    RotaParadaRemoverSerializer
+)
+from .geometria import POLYLINE_PRECISAO
+from .motor import get_motor_rotas
+from .jobs import enfileirar_job
+from .pedidos import (
+    ErroPedidoRota,
+    baixar_estoque,
+    criar_rota,
+    atualizar_paradas,
+    montar_enderecos,
+    observacao_saida,
+    validar_pedido,
+    validar_produtos,
 )
-from .services import RotaOtimizacaoService
 
-# Instância singleton para reutilizar caches entre requisições
-_rota_service_instance = None
 
-def get_rota_service():
-    """Retorna instância singleton do serviço de otimização"""
-    global _rota_service_instance
-    if _rota_service_instance is None:
-        _rota_service_instance = RotaOtimizacaoService()
-    return _rota_service_instance
-from produtos.models import Produto, MovimentacaoEstoque
+def resposta_ocupado(resultado):
+    """503 quando a fila do pool de otimização está cheia (o cliente deve repetir o pedido)"""
+    return Response(
+        {'erro': resultado['erro']},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': '5'}
+    )
+
 
 class VeiculoCreateView(generics.CreateAPIView):
     """Criar um novo veículo"""
@@ -78,134 +97,88 @@ class RotaCreateView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
         
-        # Validações
-        veiculo_id = serializer.validated_data.get('veiculo_id')
-        produtos_quantidades = serializer.validated_data['produtos_quantidades']
-        nome_motorista = serializer.validated_data.get('nome_motorista', '')
-        preco_combustivel = serializer.validated_data.get('preco_combustivel')
+        # Validações (veículo, produtos e estoque em lote)
+        try:
+            veiculo, produtos_validados = validar_pedido(request.user, dados)
+        except ErroPedidoRota as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verifica se o veículo pertence ao usuário (se fornecido)
-        veiculo = None
-        if veiculo_id:
+        # Modo job: reserva o estoque agora e otimiza em segundo plano
+        if dados.get('assincrono'):
             try:
-                veiculo = Veiculo.objects.get(id=veiculo_id, usuario=request.user)
-            except Veiculo.DoesNotExist:
-                return Response(
-                    {'erro': 'Veículo não encontrado ou não pertence ao usuário'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        # Valida produtos e quantidades (OTIMIZADO - consulta em lote)
-        produtos_validados = []
-        
-        # Extrai IDs dos produtos para consulta em lote
-        produto_ids = [item.get('produto_id') for item in produtos_quantidades if item.get('produto_id')]
-        quantidades = [item.get('quantidade', 0) for item in produtos_quantidades]
-        
-        # Validações básicas
-        if not produto_ids or any(q <= 0 for q in quantidades):
-            return Response(
-                {'erro': 'Produto ID e quantidade são obrigatórios e quantidade deve ser > 0'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Consulta em lote todos os produtos
-        try:
-            produtos_queryset = Produto.objects.filter(
-                idProduto__in=produto_ids, 
-                usuario=request.user
-            ).values('idProduto', 'nome', 'estoque_atual')
-            
-            # Cria dicionário para acesso rápido
-            produtos_dict = {p['idProduto']: p for p in produtos_queryset}
-            
-            # Valida cada produto
-            for i, item in enumerate(produtos_quantidades):
-                produto_id = item.get('produto_id')
-                quantidade = item.get('quantidade', 0)
-                
-                if produto_id not in produtos_dict:
-                    return Response(
-                        {'erro': f'Produto com ID {produto_id} não encontrado'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                produto_data = produtos_dict[produto_id]
-                if produto_data['estoque_atual'] < quantidade:
-                    return Response(
-                        {'erro': f'Estoque insuficiente para o produto {produto_data["nome"]}. Disponível: {produto_data["estoque_atual"]}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Busca o objeto completo do produto para uso posterior
-                produto = Produto.objects.get(idProduto=produto_id, usuario=request.user)
-                produtos_validados.append({
-                    'produto': produto,
-                    'quantidade': quantidade
-                })
-                
-        except Exception as e:
+                job = enfileirar_job(request.user, dados, veiculo, produtos_validados)
+            except ErroPedidoRota as e:
+                return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            job_serializer = RotaJobSerializer(job, context={'request': request})
             return Response(
-                {'erro': f'Erro na validação de produtos: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
+                job_serializer.data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': job_serializer.data['url_status']}
             )
         
-        # Prepara endereços (origem + destinos)
-        # A rota sempre começa e termina na empresa (origem)
-        endereco_origem = request.user.endereco_completo()
-        enderecos = [endereco_origem] + serializer.validated_data['enderecos_destino']
-        
         # Otimiza a rota (inclui retorno automático à origem/empresa)
         # Usa instância singleton para reutilizar caches
-        service = get_rota_service()
-        resultado = service.otimizar_rota(enderecos, veiculo, produtos_quantidades, preco_combustivel)
+        motor = get_motor_rotas()
+        resultado = motor.otimizar_rota(
+            montar_enderecos(request.user, dados),
+            veiculo,
+            dados['produtos_quantidades'],
+            dados.get('preco_combustivel'),
+            max_ms=dados.get('max_ms'),
+            usuario=request.user
+        )
         
+        if resultado.get('ocupado'):
+            return resposta_ocupado(resultado)
         if not resultado['sucesso']:
             return Response(
                 {'erro': f'Erro na otimização da rota: {resultado.get("erro", "Erro desconhecido")}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-        # Cria a rota
-        rota = Rota.objects.create(
-            enderecos_otimizados=resultado['enderecos_otimizados'],
-            coordenadas_otimizadas=resultado['coordenadas_otimizadas'],
-            distancia_total_km=resultado['distancia_total_km'],
-            tempo_estimado_minutos=resultado['tempo_estimado_minutos'],
-            veiculo=veiculo,
-            nome_motorista=nome_motorista if nome_motorista else None,
-            valor_rota=resultado['valor_rota'],
-            preco_combustivel_usado=resultado['preco_combustivel_usado'],
-            produtos_quantidades=produtos_quantidades,
-            link_maps=resultado['link_maps'],
-            usuario=request.user
-        )
-        
-        # Atualiza estoque dos produtos
-        for item in produtos_validados:
-            produto = item['produto']
-            quantidade = item['quantidade']
-            estoque_anterior = produto.estoque_atual
-            produto.estoque_atual -= quantidade
-            produto.save()
-            
-            # Registra movimentação de estoque
-            motorista_info = rota.nome_motorista if rota.nome_motorista else 'Sem motorista'
-            MovimentacaoEstoque.objects.create(
-                produto=produto,
-                tipo='saida',
-                quantidade=quantidade,
-                estoque_anterior=estoque_anterior,
-                estoque_atual=produto.estoque_atual,
-                observacao=f'Saída para rota {rota.id} - {motorista_info}',
-                usuario=request.user
-            )
+        # Cria a rota e dá saída no estoque dos produtos
+        try:
+            with transaction.atomic():
+                rota = criar_rota(
+                    request.user, resultado, veiculo,
+                    dados.get('nome_motorista', ''), dados['produtos_quantidades']
+                )
+                baixar_estoque(request.user, produtos_validados, observacao_saida(rota))
+        except ErroPedidoRota as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Retorna a rota criada
         rota_serializer = RotaSerializer(rota)
         return Response(rota_serializer.data, status=status.HTTP_201_CREATED)
 
+class RotaJobDetailView(generics.RetrieveAPIView):
+    """Consultar o status de um job de otimização de rota"""
+    serializer_class = RotaJobSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'id'
+
+    def get_queryset(self):
+        return RotaJob.objects.filter(usuario=self.request.user)
+
+class RotaJobRotaView(APIView):
+    """Obter a rota gerada por um job (202 enquanto ainda está na fila)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+        job = get_object_or_404(
+            RotaJob.objects.select_related('rota', 'rota__veiculo'), id=id, usuario=request.user
+        )
+        if job.status == 'concluido' and job.rota is not None:
+            return Response(RotaSerializer(job.rota).data)
+        if job.status == 'erro':
+            return Response({'erro': job.erro}, status=status.HTTP_409_CONFLICT)
+        return Response(
+            RotaJobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
 class RotaListView(generics.ListAPIView):
     """Listar todas as rotas do usuário"""
     serializer_class = RotaSerializer
@@ -215,7 +188,8 @@ class RotaListView(generics.ListAPIView):
     search_fields = ['nome_motorista']
 
     def get_queryset(self):
-        return Rota.objects.filter(usuario=self.request.user)
+        # A geometria é servida à parte (RotaGeometriaView)
+        return Rota.objects.filter(usuario=self.request.user).defer('geometria')
 
 class RotaDetailView(generics.RetrieveAPIView):
     """Obter detalhes de uma rota específica"""
@@ -224,7 +198,31 @@ class RotaDetailView(generics.RetrieveAPIView):
     lookup_field = 'id'
 
     def get_queryset(self):
-        return Rota.objects.filter(usuario=self.request.user)
+        return Rota.objects.filter(usuario=self.request.user).defer('geometria')
+
+class RotaGeometriaView(APIView):
+    """
+    Traçado da rota pelas vias (polyline codificada do Google), com ETag:
+    o cliente revalida com If-None-Match e recebe 304 se a rota não mudou
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+        geometria = get_object_or_404(
+            Rota.objects.filter(usuario=request.user).values_list('geometria', flat=True), id=id
+        )
+        if not geometria:
+            return Response({'erro': 'Rota sem geometria'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = quote_etag(hashlib.sha1(geometria.encode()).hexdigest()[:16])
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            resposta = Response({'id': id, 'polyline': geometria, 'precisao': POLYLINE_PRECISAO})
+        resposta['ETag'] = etag
+        # A geometria muda quando paradas são adicionadas ou removidas: sempre revalidar
+        patch_cache_control(resposta, private=True, no_cache=True)
+        return resposta
 
 class RotaStatusUpdateView(generics.UpdateAPIView):
     """Atualizar apenas o status de uma rota"""
@@ -246,6 +244,80 @@ class RotaStatusUpdateView(generics.UpdateAPIView):
         rota_serializer = RotaSerializer(rota)
         return Response(rota_serializer.data)
 
+class RotaParadaAdicionarView(APIView):
+    """Adicionar uma parada a uma rota em progresso (sem reotimizar do zero)"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id):
+        rota = get_object_or_404(Rota.objects.select_related('veiculo'), id=id, usuario=request.user)
+        if rota.status != 'em_progresso':
+            return Response(
+                {'erro': 'Só é possível alterar paradas de rotas em progresso'},
+                status=status.HTTP_409_CONFLICT
+            )
+        serializer = RotaParadaAdicionarSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        
+        try:
+            produtos_validados = (
+                validar_produtos(request.user, dados['produtos_quantidades'])
+                if dados['produtos_quantidades'] else []
+            )
+        except ErroPedidoRota as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resultado = get_motor_rotas().adicionar_parada(rota, dados['endereco'], max_ms=dados.get('max_ms'))
+        if resultado.get('ocupado'):
+            return resposta_ocupado(resultado)
+        if not resultado['sucesso']:
+            return Response(
+                {'erro': f'Erro ao adicionar parada: {resultado.get("erro", "Erro desconhecido")}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            rota = atualizar_paradas(request.user, rota, resultado, produtos_adicionados=produtos_validados)
+        except ErroPedidoRota as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(RotaSerializer(rota).data)
+
+class RotaParadaRemoverView(APIView):
+    """Remover uma parada de uma rota em progresso (devolve os produtos informados ao estoque)"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id):
+        rota = get_object_or_404(Rota.objects.select_related('veiculo'), id=id, usuario=request.user)
+        if rota.status != 'em_progresso':
+            return Response(
+                {'erro': 'Só é possível alterar paradas de rotas em progresso'},
+                status=status.HTTP_409_CONFLICT
+            )
+        serializer = RotaParadaRemoverSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        
+        resultado = get_motor_rotas().remover_parada(rota, dados['indice'], max_ms=dados.get('max_ms'))
+        if resultado.get('ocupado'):
+            return resposta_ocupado(resultado)
+        if not resultado['sucesso']:
+            return Response(
+                {'erro': f'Erro ao remover parada: {resultado.get("erro", "Erro desconhecido")}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            rota = atualizar_paradas(
+                request.user, rota, resultado,
+                produtos_devolvidos=[
+                    {'produto_id': item.get('produto_id'), 'quantidade': item.get('quantidade', 0)}
+                    for item in dados['produtos_quantidades']
+                ]
+            )
+        except ErroPedidoRota as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(RotaSerializer(rota).data)
+
 class RotaDeleteView(generics.DestroyAPIView):
     """Excluir uma rota"""
     serializer_class = RotaSerializer
@@ -260,14 +332,14 @@ class PrecosCombustivelView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        service = get_rota_service()  # Usa singleton para cache
+        motor = get_motor_rotas()  # Usa singleton para cache
         
         try:
             # Obtém preços para todos os tipos de combustível
-            preco_diesel = service.obter_preco_combustivel('diesel')
-            preco_gasolina = service.obter_preco_combustivel('gasolina')
-            preco_etanol = service.obter_preco_combustivel('etanol')
-            preco_gnv = service.obter_preco_combustivel('gnv')
+            preco_diesel = motor.obter_preco_combustivel('diesel')
+            preco_gasolina = motor.obter_preco_combustivel('gasolina')
+            preco_etanol = motor.obter_preco_combustivel('etanol')
+            preco_gnv = motor.obter_preco_combustivel('gnv')
             
             return Response({
                 'diesel': preco_diesel,
@@ -287,3 +359,10 @@ class PrecosCombustivelView(APIView):
             return Response({
                 'erro': f'Erro ao obter preços de combustível: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class MotorEstatisticasView(APIView):
+    """Profundidade da fila do pool de otimização e contadores dos caches (administradores)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_motor_rotas().estatisticas())